@@ -38,6 +38,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # BrinIndex and the other Postgres index types and operations used by core.
+    'django.contrib.postgres',
     'crispy_forms',
     'crispy_bootstrap5',
     'core',
@@ -50,9 +52,11 @@ CSRF_COOKIE_SAMESITE = 'None'
 CSRF_COOKIE_SECURE = True
 
 MIDDLEWARE = [
+    'core.metrics_middleware.MetricsMiddleware', # Per-view Prometheus metrics, served at /metrics
     'core.cors_middleware.SimpleCorsMiddleware',
+    'core.compression_middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', # Render Static Files
+    'core.static_middleware.WhiteNoiseMiddleware', # Render Static Files (async-capable whitenoise)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,13 +89,46 @@ WSGI_APPLICATION = 'capstone.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Serve the JSON API with the async views (core.async_api_views). Set by
+# gunicorn.conf.py when GUNICORN_MODE=asgi.
+ASYNC_API = os.environ.get('ASYNC_API', 'False') == 'True'
+
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get('DATABASE_URL'),
-        conn_max_age=600
+        # Under ASGI every request's ORM calls run on a fresh executor thread,
+        # so persistent per-thread connections would pile up until the DB refuses new ones.
+        conn_max_age=0 if ASYNC_API else 600,
+        # Test a reused connection before the request uses it, so a Postgres restart
+        # costs one reconnect instead of a failed request.
+        conn_health_checks=True,
     )
 }
 
+# Connection pool mode (DB_POOL=True, PostgreSQL only): one psycopg pool per
+# worker process, shared by its threads. DB_POOL_SIZE connections are kept
+# open and up to DB_POOL_MAX_OVERFLOW more are opened under load and closed
+# again after DB_POOL_MAX_IDLE seconds unused. A request waits up to
+# DB_POOL_TIMEOUT seconds for a free connection. With conn_health_checks
+# Django tests every checkout first, so connections killed by a Postgres
+# restart are replaced rather than handed to a view. The server sees at most
+# workers * (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW) connections (see gunicorn.conf.py).
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', '2'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))
+
+if DB_POOL and DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    # Connections go back to the pool at the end of each request.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': DB_POOL_SIZE,
+        'max_size': DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW,
+        'timeout': DB_POOL_TIMEOUT,
+        'max_idle': DB_POOL_MAX_IDLE,
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -149,3 +186,80 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
+
+# CSV import: rows per bulk_create INSERT
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', '1000'))
+
+# Uploads of at least this size are imported by a background job (core.jobs)
+IMPORT_JOB_MIN_BYTES = int(os.environ.get('IMPORT_JOB_MIN_BYTES', str(256 * 1024)))
+IMPORT_JOB_WORKERS = int(os.environ.get('IMPORT_JOB_WORKERS', '1'))
+# A running job whose progress is older than this is considered abandoned and resumed
+IMPORT_JOB_LEASE_SECONDS = int(os.environ.get('IMPORT_JOB_LEASE_SECONDS', '120'))
+# Run jobs inline after commit instead of on the thread pool (tests)
+IMPORT_JOBS_EAGER = os.environ.get('IMPORT_JOBS_EAGER', 'False') == 'True'
+
+# Per-process cache by default; set REDIS_URL to share it between workers.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'capstone',
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '5000'))},
+        }
+    }
+
+# Dashboard KPIs and monthly series (core.kpi_cache), in seconds
+KPI_CACHE_ALIAS = 'default'
+KPI_CACHE_TIMEOUT = int(os.environ.get('KPI_CACHE_TIMEOUT', '600'))
+
+# Delta sync (core.sync): tokens never move past writes younger than this,
+# so rows from transactions still committing are re-sent instead of skipped.
+SYNC_SETTLE_SECONDS = int(os.environ.get('SYNC_SETTLE_SECONDS', '5'))
+# Tombstones older than this are pruned; older sync tokens get 410 and resync.
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '90'))
+
+# Dotted path to a callable(data) -> bytes|str used for large API responses
+# (core.fastjson). Unset: orjson when installed, else the stdlib encoder.
+API_JSON_DUMPS = os.environ.get('API_JSON_DUMPS') or None
+
+# Time zone of /api/recharges/series/ buckets when the request has no tz parameter
+SERIES_DEFAULT_TIME_ZONE = os.environ.get('SERIES_DEFAULT_TIME_ZONE', 'America/Sao_Paulo')
+
+# API response compression (core.compression_middleware)
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+# 11 is for offline assets; 4-5 is the usual trade-off for dynamic responses
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+# Compressed bodies of strong-ETag responses are reused from this cache (empty to disable)
+COMPRESSION_CACHE_ALIAS = os.environ.get('COMPRESSION_CACHE_ALIAS', 'default')
+COMPRESSION_CACHE_TIMEOUT = int(os.environ.get('COMPRESSION_CACHE_TIMEOUT', '600'))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get('COMPRESSION_CACHE_MAX_BYTES', str(512 * 1024)))
+
+# /metrics (core.metrics): when set, scrapes must send "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Sessions. cached_db serves reads from the cache and only falls back to
+# django_session on a miss, so it is the default only when REDIS_URL gives
+# every worker the same cache: with per-process caches a logout would only
+# evict the session from the worker that served it. db (the default without
+# Redis) costs one query per request; signed_cookies stores the session in
+# the cookie itself, with no server-side storage at all, but a copied cookie
+# stays valid until it expires even after logout. Sessions are only written
+# when they change.
+SESSION_MODE = os.environ.get('SESSION_MODE', 'cached_db' if os.environ.get('REDIS_URL') else 'db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_MODE]
+
+# Expired sessions and old tombstones are deleted this often by each worker
+# (core.housekeeping); 0 disables it.
+HOUSEKEEPING_INTERVAL_SECONDS = int(os.environ.get('HOUSEKEEPING_INTERVAL_SECONDS', '3600'))
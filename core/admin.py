@@ -1,21 +1,91 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import get_last_value_from_parameters
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from django.db.models import Count
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils.text import smart_split, unescape_string_literal
 from django.utils.translation import gettext_lazy as _
+from . import search
 from .models import Recharge, Settings, ContactLog
+from .pagination import EstimatedCountPaginator
 
 # Unregister User to register our custom version
 admin.site.unregister(User)
 
+def user_autocomplete(admin_site):
+    """The admin's select2 user picker, fed by UserAdmin.search_fields."""
+    field = forms.ModelChoiceField(
+        User.objects.all(), required=False,
+        widget=AutocompleteSelect(Recharge._meta.get_field('user'), admin_site),
+    )
+    return field.widget
+
+
+class UserAutocompleteFilter(admin.ListFilter):
+    """
+    Filter by user with an autocomplete box. The stock ``'user'`` filter
+    renders every user into the sidebar; this one loads only the selected one.
+    """
+    title = _("usuário")
+    parameter_name = 'user__id__exact'
+    template = 'admin/core/user_autocomplete_filter.html'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.value = get_last_value_from_parameters(params, self.parameter_name)
+        params.pop(self.parameter_name, None)
+        if self.value is not None and not self.value.isdigit():
+            raise IncorrectLookupParameters(self.parameter_name)
+        self.widget = user_autocomplete(model_admin.admin_site)
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_name]
+
+    def queryset(self, request, queryset):
+        if self.value is not None:
+            return queryset.filter(user_id=self.value)
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value is not None,
+            'widget': self.widget.render(self.parameter_name, self.value),
+            # The other active filters ride along as hidden inputs of the filter form.
+            'hidden': [
+                (key, value)
+                for key, values in changelist.params.items()
+                if key not in (self.parameter_name, 'p')
+                for value in (values if isinstance(values, list) else [values])
+            ],
+            'clear_url': changelist.get_query_string(remove=[self.parameter_name, 'p']),
+        }
+
+
+class ScaleModeMixin:
+    """
+    Changelist settings for tables too big to count: estimated page count,
+    no full-table COUNT(*) next to filtered results and no per-choice facets.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ScaleModeMixin, BaseUserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'last_login', 'recharge_count')
     list_filter = BaseUserAdmin.list_filter + ('last_login',)
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        queryset = queryset.annotate(recharge_count=Count('recharge'))
+        # Denormalized count kept by core.rollups: one join per page, no scan of core_recharge.
+        queryset = queryset.annotate(recharge_count=Coalesce('dataversion__recargas', 0))
         return queryset
 
     def recharge_count(self, obj):
@@ -36,12 +106,36 @@ class ContactLogAdmin(admin.ModelAdmin):
     short_message.short_description = _("Mensagem")
 
 @admin.register(Recharge)
-class RechargeAdmin(admin.ModelAdmin):
+class RechargeAdmin(ScaleModeMixin, admin.ModelAdmin):
     list_display = ('user', 'data', 'kwh', 'custo', 'isento', 'local')
-    list_filter = ('user', 'isento', 'data')
+    list_filter = (UserAutocompleteFilter, 'isento', 'data')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     search_fields = ('user__username', 'local', 'observacoes')
+    # Rendered from MonthlyRollup bounds by the change_list.html override
+    # (templatetags/admin_scale.py) instead of DISTINCT queries on core_recharge.
     date_hierarchy = 'data'
 
+    @property
+    def media(self):
+        # The user filter's select2 widget lives outside any form, so its assets are added here.
+        return super().media + user_autocomplete(self.admin_site).media
+
+    def get_search_results(self, request, queryset, search_term):
+        # Same semantics as the default search (every term must match some field),
+        # but local/observacoes go through the trigram indexes (core.search) and
+        # usernames are matched in a subquery on auth_user, so each term is an
+        # OR of index scans rather than an ILIKE over every recharge joined to
+        # auth_user, and a short term never inlines thousands of user ids.
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            term = Q(user_id__in=User.objects.filter(username__icontains=bit).values('id'))
+            for field in search.SEARCH_FIELDS:
+                term |= search.matches(field, bit)
+            queryset = queryset.filter(term)
+        return queryset, False
+
 @admin.register(Settings)
 class SettingsAdmin(admin.ModelAdmin):
     list_display = ('user', 'preco_gasolina', 'consumo_km_l')
@@ -3,7 +3,8 @@ from django.contrib.auth import authenticate, login, logout
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from .models import Recharge, Settings
+from . import batch, db_pool, fastjson, geo, kpi_cache, pagination, segments, serializers, series, sync, versions
+from .models import Recharge, Settings, ImportJob
 
 @csrf_exempt
 def api_login(request):
@@ -27,59 +28,195 @@ def api_logout(request):
     logout(request)
     return JsonResponse({"status": "success", "message": "Logged out"})
 
+def serialize_settings(settings):
+    return {
+        "preco_gasolina": settings.preco_gasolina if settings else 0,
+        "consumo_km_l": settings.consumo_km_l if settings else 0,
+        # Keys of the original response, still read by released mobile
+        # clients. Settings has no limits, so they were only ever 0.
+        "limit_kwh": 0,
+        "limit_cost": 0,
+    }
+
 @login_required
 def api_settings(request):
-    try:
-        settings = Settings.objects.get(user=request.user)
-        return JsonResponse({
-            "limit_kwh": settings.limit_kwh,
-            "limit_cost": settings.limit_cost
-        })
-    except Settings.DoesNotExist:
-        return JsonResponse({"limit_kwh": 0, "limit_cost": 0})
+    return JsonResponse(serialize_settings(Settings.objects.filter(user=request.user).first()))
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 500
+
+def serialize_recharge(r):
+    return {
+        "id": r.id,
+        "data": r.data.isoformat(),
+        "kwh": r.kwh,
+        "custo": r.custo,
+        "isento": r.isento,
+        "odometro": r.odometro,
+        "observacoes": r.observacoes,
+        "local": r.local,
+        "latitude": r.latitude,
+        "longitude": r.longitude,
+        "atualizado_em": r.atualizado_em.isoformat(),
+    }
+
+def recharge_fields(body):
+    """Model kwargs for a recharge created from a POST body."""
+    return dict(
+        data=body.get("data"),
+        kwh=float(body.get("kwh", 0)),
+        custo=float(body.get("custo", 0)),
+        isento=body.get("isento", False),
+        odometro=float(body.get("odometro", 0)),
+        observacoes=body.get("observacoes", ""),
+        local=body.get("local", ""),
+        latitude=float(body.get("latitude")) if body.get("latitude") is not None else None,
+        longitude=float(body.get("longitude")) if body.get("longitude") is not None else None,
+    )
+
+def update_recharge(recharge, body):
+    """Apply a PUT body to ``recharge`` (not saved)."""
+    recharge.data = body.get("data", recharge.data)
+    recharge.kwh = float(body.get("kwh", recharge.kwh))
+    recharge.custo = float(body.get("custo", recharge.custo))
+    recharge.isento = body.get("isento", recharge.isento)
+    recharge.odometro = float(body.get("odometro", recharge.odometro))
+    recharge.observacoes = body.get("observacoes", recharge.observacoes)
+    recharge.local = body.get("local", recharge.local)
+    if "latitude" in body:
+        recharge.latitude = float(body["latitude"]) if body["latitude"] is not None else None
+    if "longitude" in body:
+        recharge.longitude = float(body["longitude"]) if body["longitude"] is not None else None
 
 @csrf_exempt
 @login_required
+@versions.conditional
 def api_recharge_list(request):
     if request.method == "GET":
-        recharges = Recharge.objects.filter(user=request.user).order_by('-data')
-        data = []
-        for r in recharges:
-            data.append({
-                "id": r.id,
-                "data": r.data.isoformat(),
-                "kwh": r.kwh,
-                "custo": r.custo,
-                "isento": r.isento,
-                "odometro": r.odometro,
-                "observacoes": r.observacoes,
-                "local": r.local,
-                "latitude": r.latitude,
-                "longitude": r.longitude,
-            })
-        return JsonResponse(data, safe=False)
+        recharges = Recharge.objects.filter(user=request.user)
+        try:
+            fields = serializers.parse_fields(request.GET.get("fields"))
+            fmt = serializers.parse_format(request.GET.get("format"))
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        rows = serializers.project(recharges, fields)
+
+        # Legacy clients without limit/cursor still get the full array.
+        if not any(p in request.GET for p in ("limit", "cursor", "before")):
+            return fastjson.JsonResponse(serializers.render(list(rows.order_by('-data')), fields, fmt))
+
+        try:
+            limit = min(max(int(request.GET.get("limit", DEFAULT_PAGE_LIMIT)), 1), MAX_PAGE_LIMIT)
+            page = pagination.paginate(
+                rows, limit,
+                after=request.GET.get("cursor"), before=request.GET.get("before"),
+            )
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        data = {
+            "results": serializers.render(page.items, fields, fmt),
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
+            "limit": limit,
+        }
+        if request.GET.get("include_total") in ("1", "true"):
+            data["total_aproximado"] = pagination.approximate_count(recharges)
+        return fastjson.JsonResponse(data)
     
     elif request.method == "POST":
         try:
             body = json.loads(request.body)
-            recharge = Recharge.objects.create(
-                user=request.user,
-                data=body.get("data"),
-                kwh=float(body.get("kwh", 0)),
-                custo=float(body.get("custo", 0)),
-                isento=body.get("isento", False),
-                odometro=float(body.get("odometro", 0)),
-                observacoes=body.get("observacoes", ""),
-                local=body.get("local", ""),
-                latitude=float(body.get("latitude")) if body.get("latitude") is not None else None,
-                longitude=float(body.get("longitude")) if body.get("longitude") is not None else None,
-            )
+            recharge = Recharge.objects.create(user=request.user, **recharge_fields(body))
             return JsonResponse({"status": "success", "id": recharge.id})
         except Exception as e:
             return JsonResponse({"status": "error", "message": str(e)}, status=400)
 
+@login_required
+def api_recharge_changes(request):
+    try:
+        limit = min(max(int(request.GET.get("limit", sync.DEFAULT_LIMIT)), 1), sync.MAX_LIMIT)
+        changes = sync.changes(request.user, request.GET.get("since"), limit)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    except sync.TokenExpired as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=410)
+
+    return JsonResponse({
+        "upserts": [serialize_recharge(r) for r in changes["upserts"]],
+        "deletes": changes["deletes"],
+        "next": changes["next"],
+        "has_more": changes["has_more"],
+    })
+
+@login_required
+@versions.conditional
+def api_recharge_series(request):
+    try:
+        query = series.parse(request.GET)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    def build():
+        config = Settings.objects.filter(user=request.user).first()
+        return series.build(request.user, config, query)
+
+    return JsonResponse(kpi_cache.get_or_compute(request, query.cache_name, build))
+
+@login_required
+@versions.conditional
+def api_recharge_map(request):
+    try:
+        bbox = geo.parse_bbox(request.GET.get('bbox'))
+        zoom = geo.parse_zoom(request.GET.get('zoom', 12))
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    precision, clusters = geo.clusters(request.user, bbox, zoom)
+    return JsonResponse({
+        "zoom": zoom,
+        "precision": precision,
+        "recargas": sum(cluster["recargas"] for cluster in clusters),
+        "clusters": clusters,
+    })
+
+@login_required
+@versions.conditional
+def api_recharge_segments(request):
+    try:
+        query = segments.parse(request.GET)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    config = Settings.objects.filter(user=request.user).first()
+    return JsonResponse(segments.page(request.user, query, config))
+
 @csrf_exempt
 @login_required
+def api_recharge_batch(request):
+    if request.method != "POST":
+        return JsonResponse({"status": "error", "message": "Method not allowed"}, status=405)
+    try:
+        body = json.loads(request.body)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    operations = body.get("operations") if isinstance(body, dict) else None
+    if not isinstance(operations, list):
+        return JsonResponse({"status": "error", "message": "Expected {\"operations\": [...]}"}, status=400)
+    if len(operations) > batch.MAX_OPERATIONS:
+        return JsonResponse(
+            {"status": "error", "message": f"At most {batch.MAX_OPERATIONS} operations per batch"}, status=400
+        )
+
+    result = batch.apply(request.user, operations)
+    if not result.ok:
+        return JsonResponse({"status": "error", "message": "No operation was applied", "results": result.results}, status=400)
+    return JsonResponse({"status": "success", "results": result.results})
+
+@csrf_exempt
+@login_required
+@versions.conditional
 def api_recharge_detail(request, pk):
     try:
         recharge = Recharge.objects.get(pk=pk, user=request.user)
@@ -87,33 +224,11 @@ def api_recharge_detail(request, pk):
         return JsonResponse({"status": "error", "message": "Recharge not found"}, status=404)
 
     if request.method == "GET":
-        return JsonResponse({
-            "id": recharge.id,
-            "data": recharge.data.isoformat(),
-            "kwh": recharge.kwh,
-            "custo": recharge.custo,
-            "isento": recharge.isento,
-            "odometro": recharge.odometro,
-            "observacoes": recharge.observacoes,
-            "local": recharge.local,
-            "latitude": recharge.latitude,
-            "longitude": recharge.longitude,
-        })
+        return JsonResponse(serialize_recharge(recharge))
     
     elif request.method == "PUT":
         try:
-            body = json.loads(request.body)
-            recharge.data = body.get("data", recharge.data)
-            recharge.kwh = float(body.get("kwh", recharge.kwh))
-            recharge.custo = float(body.get("custo", recharge.custo))
-            recharge.isento = body.get("isento", recharge.isento)
-            recharge.odometro = float(body.get("odometro", recharge.odometro))
-            recharge.observacoes = body.get("observacoes", recharge.observacoes)
-            recharge.local = body.get("local", recharge.local)
-            if "latitude" in body:
-                recharge.latitude = float(body["latitude"]) if body["latitude"] is not None else None
-            if "longitude" in body:
-                recharge.longitude = float(body["longitude"]) if body["longitude"] is not None else None
+            update_recharge(recharge, json.loads(request.body))
             recharge.save()
             return JsonResponse({"status": "success"})
         except Exception as e:
@@ -124,3 +239,36 @@ def api_recharge_detail(request, pk):
         return JsonResponse({"status": "success"})
 
     return JsonResponse({"status": "error", "message": "Method not allowed"}, status=405)
+
+@login_required
+def api_import_job(request, pk):
+    try:
+        job = ImportJob.objects.defer('arquivo').get(pk=pk, user=request.user)
+    except ImportJob.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "Import job not found"}, status=404)
+
+    return JsonResponse({
+        "id": job.id,
+        "status": job.status,
+        "arquivo": job.nome_arquivo,
+        "total_linhas": job.total_linhas,
+        "processadas": job.processadas,
+        "criadas": job.criadas,
+        "progresso": round(job.processadas / job.total_linhas * 100, 1) if job.total_linhas else 0.0,
+        "erros_qtd": len(job.erros),
+        "erros": job.erros[:50],
+        "criado_em": job.criado_em.isoformat(),
+        "atualizado_em": job.atualizado_em.isoformat(),
+    })
+
+@login_required
+def api_cache_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({"status": "error", "message": "Forbidden"}, status=403)
+    return JsonResponse({"kpis": kpi_cache.stats()})
+
+@login_required
+def api_db_pool_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({"status": "error", "message": "Forbidden"}, status=403)
+    return JsonResponse({"pools": db_pool.stats()})
@@ -0,0 +1,123 @@
+"""
+Async versions of the JSON API views, served when ``ASYNC_API`` is on (the
+ASGI gunicorn mode, see gunicorn.conf.py).
+
+They return the same responses as core.api_views and the monthly view in
+core.views, but wait on the database through Django's async ORM, so a slow
+query parks a coroutine instead of holding one of the worker's few threads.
+Writes still run the sync save/delete signals (rollups, tombstones) in a
+worker thread through ``acreate``/``asave``/``adelete``.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import fastjson, kpi_cache, kpis, pagination, serializers, versions
+from .api_views import (
+    DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT, recharge_fields, serialize_recharge, serialize_settings, update_recharge,
+)
+from .models import MonthlyRollup, Recharge, Settings
+
+
+def _method_not_allowed():
+    return JsonResponse({"status": "error", "message": "Method not allowed"}, status=405)
+
+
+@login_required
+async def api_settings(request):
+    user = await request.auser()
+    return JsonResponse(serialize_settings(await Settings.objects.filter(user=user).afirst()))
+
+
+@csrf_exempt
+@login_required
+@versions.aconditional
+async def api_recharge_list(request):
+    if request.method == "GET":
+        recharges = Recharge.objects.filter(user=request.user)
+        try:
+            fields = serializers.parse_fields(request.GET.get("fields"))
+            fmt = serializers.parse_format(request.GET.get("format"))
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        rows = serializers.project(recharges, fields)
+
+        # Legacy clients without limit/cursor still get the full array.
+        if not any(p in request.GET for p in ("limit", "cursor", "before")):
+            items = [row async for row in rows.order_by('-data')]
+            return fastjson.JsonResponse(serializers.render(items, fields, fmt))
+
+        try:
+            limit = min(max(int(request.GET.get("limit", DEFAULT_PAGE_LIMIT)), 1), MAX_PAGE_LIMIT)
+            page = await pagination.apaginate(
+                rows, limit,
+                after=request.GET.get("cursor"), before=request.GET.get("before"),
+            )
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        data = {
+            "results": serializers.render(page.items, fields, fmt),
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
+            "limit": limit,
+        }
+        if request.GET.get("include_total") in ("1", "true"):
+            data["total_aproximado"] = await sync_to_async(pagination.approximate_count)(recharges)
+        return fastjson.JsonResponse(data)
+
+    elif request.method == "POST":
+        try:
+            body = json.loads(request.body)
+            recharge = await Recharge.objects.acreate(user=request.user, **recharge_fields(body))
+            return JsonResponse({"status": "success", "id": recharge.id})
+        except Exception as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    return _method_not_allowed()
+
+
+@csrf_exempt
+@login_required
+@versions.aconditional
+async def api_recharge_detail(request, pk):
+    try:
+        recharge = await Recharge.objects.aget(pk=pk, user=request.user)
+    except Recharge.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "Recharge not found"}, status=404)
+
+    if request.method == "GET":
+        return JsonResponse(serialize_recharge(recharge))
+
+    elif request.method == "PUT":
+        try:
+            update_recharge(recharge, json.loads(request.body))
+            await recharge.asave()
+            return JsonResponse({"status": "success"})
+        except Exception as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    elif request.method == "DELETE":
+        await recharge.adelete()
+        return JsonResponse({"status": "success"})
+
+    return _method_not_allowed()
+
+
+async def _monthly_payload(user):
+    config = await Settings.objects.filter(user=user).afirst()
+    rollups = MonthlyRollup.objects.filter(user=user).order_by('mes').values(*kpis.MONTHLY_ROLLUP_FIELDS)
+    return {
+        "kpis": await kpis.acompute_kpis(user, config, missing=0),
+        **kpis.monthly_series([row async for row in rollups], config),
+    }
+
+
+@login_required
+@versions.aconditional
+async def api_recharges_monthly(request):
+    payload = await kpi_cache.aget_or_compute(request, 'monthly', lambda: _monthly_payload(request.user))
+    return JsonResponse(payload)
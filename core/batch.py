@@ -0,0 +1,138 @@
+"""
+Batch create/update/delete of recharges for the mobile sync endpoint.
+
+All operations are validated in one pass (a single query loads every recharge
+they reference) and, only if none of them fails, applied together in one
+transaction: one ``bulk_create``, one ``bulk_update`` and one ``DELETE``.
+Rollups and the data version are refreshed once per touched month.
+"""
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, sync
+from .models import Recharge
+
+MAX_OPERATIONS = 2000
+UPDATE_BATCH_SIZE = 500
+
+EDITABLE_FIELDS = ['data', 'kwh', 'custo', 'isento', 'odometro', 'observacoes', 'local', 'latitude', 'longitude']
+# Same defaults as a single POST to /api/recharges/.
+CREATE_DEFAULTS = {'kwh': 0.0, 'custo': 0.0, 'isento': False, 'odometro': 0.0, 'observacoes': '', 'local': ''}
+
+
+@dataclass
+class BatchResult:
+    results: list = field(default_factory=list)
+    ok: bool = True
+
+    def error(self, index, op, message):
+        self.ok = False
+        self.results.append({'index': index, 'op': op, 'status': 'error', 'message': message})
+
+
+def clean_fields(values, partial):
+    """
+    Validate ``values`` with the model fields. Returns the cleaned dict;
+    raises ValueError naming the first invalid field.
+    """
+    if not isinstance(values, dict):
+        raise ValueError("'fields' must be an object")
+    unknown = sorted(set(values) - set(EDITABLE_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if not partial:
+        values = {**CREATE_DEFAULTS, **values}
+        if values.get('data') is None:
+            raise ValueError("data: This field is required.")
+
+    cleaned = {}
+    for name, value in values.items():
+        try:
+            value = Recharge._meta.get_field(name).clean(value, None)
+        except ValidationError as e:
+            raise ValueError(f"{name}: {' '.join(e.messages)}") from e
+        if name == 'data' and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        cleaned[name] = value
+    return cleaned
+
+
+def apply(user, operations):
+    """
+    Validate and apply ``operations`` for ``user``. Each operation is
+    ``{"op": "create", "fields": {...}, "ref": ...}``,
+    ``{"op": "update", "id": ..., "fields": {...}}`` or ``{"op": "delete", "id": ...}``.
+
+    Returns a BatchResult with one result per operation, in order. If any
+    operation is invalid nothing is written and only the errors are reported.
+    """
+    result = BatchResult()
+    ids = set()
+    for op in operations:
+        if isinstance(op, dict) and op.get('op') in ('update', 'delete') and isinstance(op.get('id'), int):
+            ids.add(op['id'])
+    existing = Recharge.objects.filter(user=user).in_bulk(ids)
+
+    creates, updates, deletes = [], {}, {}
+    seen = set()
+    for index, op in enumerate(operations):
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind not in ('create', 'update', 'delete'):
+            result.error(index, kind, "'op' must be create, update or delete")
+            continue
+        try:
+            if kind == 'create':
+                creates.append((index, op.get('ref'), clean_fields(op.get('fields', {}), partial=False)))
+                continue
+            pk = op.get('id')
+            if pk not in existing:
+                raise ValueError("Recharge not found")
+            if pk in seen:
+                raise ValueError("Recharge appears in more than one operation")
+            seen.add(pk)
+            if kind == 'update':
+                updates[pk] = (index, clean_fields(op.get('fields', {}), partial=True))
+            else:
+                deletes[pk] = index
+        except ValueError as e:
+            result.error(index, kind, str(e))
+
+    if not result.ok:
+        return result
+
+    results = [None] * len(operations)
+    with transaction.atomic(), rollups.deferred(), sync.deferred():
+        # bulk_create/bulk_update skip the save signals: flag months here.
+        objs = [Recharge(user=user, **values) for _index, _ref, values in creates]
+        Recharge.objects.bulk_create(objs)
+        for (index, ref, _values), obj in zip(creates, objs):
+            rollups.mark_dirty(user.id, rollups.month_of(obj.data))
+            results[index] = {'index': index, 'op': 'create', 'status': 'created', 'id': obj.pk, 'ref': ref}
+
+        # bulk_update does not apply auto_now either.
+        changed = {'atualizado_em'}
+        now = timezone.now()
+        for pk, (index, values) in updates.items():
+            obj = existing[pk]
+            rollups.mark_dirty(user.id, rollups.month_of(obj.data))
+            for name, value in values.items():
+                setattr(obj, name, value)
+            obj.atualizado_em = now
+            changed.update(values)
+            rollups.mark_dirty(user.id, rollups.month_of(obj.data))
+            results[index] = {'index': index, 'op': 'update', 'status': 'updated', 'id': pk}
+        if updates:
+            Recharge.objects.bulk_update(
+                [existing[pk] for pk in updates], sorted(changed), batch_size=UPDATE_BATCH_SIZE
+            )
+
+        if deletes:
+            Recharge.objects.filter(user=user, pk__in=list(deletes)).delete()
+            for pk, index in deletes.items():
+                results[index] = {'index': index, 'op': 'delete', 'status': 'deleted', 'id': pk}
+
+    result.results = results
+    return result
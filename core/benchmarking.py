@@ -0,0 +1,85 @@
+"""
+Helpers shared by the benchmark and diagnostics management commands:
+synthetic data seeding and timing utilities.
+"""
+import csv
+import datetime
+import io
+import random
+import statistics
+
+from django.contrib.auth.models import User
+
+from . import rollups
+from .models import Recharge
+
+CSV_FIELDS = ['data', 'kwh', 'custo', 'isento', 'odometro', 'local', 'observacoes']
+LOCAIS = ["Casa", "Trabalho", "Shopping Eldorado", "Posto Ipiranga", "Eletroposto BR-116", ""]
+
+
+def make_rows(count, start=None, seed=0, step_hours=30):
+    """
+    Yield ``count`` realistic recharge dicts in date order: the odometer only
+    grows, roughly one charge every ``step_hours`` hours.
+    """
+    rng = random.Random(seed)
+    data = start or datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    odometro = 1000.0
+    for _ in range(count):
+        data += datetime.timedelta(hours=rng.uniform(step_hours * 0.5, step_hours * 1.5))
+        odometro += rng.uniform(20, 250)
+        kwh = round(rng.uniform(5, 60), 2)
+        isento = rng.random() < 0.2
+        yield {
+            'data': data,
+            'kwh': kwh,
+            'custo': 0.0 if isento else round(kwh * rng.uniform(0.7, 2.5), 2),
+            'isento': isento,
+            'odometro': round(odometro, 1),
+            'observacoes': rng.choice(["", "", "Carga rápida", "Viagem"]),
+            'local': rng.choice(LOCAIS),
+            'latitude': round(rng.uniform(-23.7, -23.4), 6),
+            'longitude': round(rng.uniform(-46.8, -46.4), 6),
+        }
+
+
+def seed_user(username, count, seed=0, batch_size=5000):
+    """Create (or reuse) ``username`` and bulk insert ``count`` recharges for it."""
+    user, _created = User.objects.get_or_create(username=username)
+    batch = []
+    for row in make_rows(count, seed=seed):
+        batch.append(Recharge(user=user, **row))
+        if len(batch) >= batch_size:
+            Recharge.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Recharge.objects.bulk_create(batch)
+    # bulk_create bypasses the save signals.
+    rollups.rebuild_user(user.id)
+    return user
+
+
+def csv_upload(rows):
+    """Render recharge dicts as a CSV file in the format ``bulk_recharge`` accepts."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, 'data': row['data'].strftime("%Y-%m-%d %H:%M")})
+    return out.getvalue().encode()
+
+
+def latency_summary(seconds):
+    """Mean and p50/p95/p99 (nearest rank) of ``seconds``, in milliseconds."""
+    ordered = sorted(seconds)
+    count = len(ordered)
+
+    def pct(p):
+        return round(ordered[min(count - 1, int(count * p))] * 1000, 1) if count else None
+
+    return {
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 1) if count else None,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+    }
@@ -0,0 +1,157 @@
+"""
+Negotiated gzip/brotli compression for API responses (JSON and the CSV export).
+
+Static files are already precompressed by whitenoise and HTML pages are left
+alone: compressing pages that echo a CSRF token would expose it to BREACH.
+Bodies under ``COMPRESSION_MIN_BYTES`` are sent as is. Streaming responses
+are compressed chunk by chunk with a flush after each one, so rows still
+reach the client while the export is running.
+
+Responses with a strong ETag (the versioned API endpoints, see core.versions)
+identify their bytes exactly, so the compressed body is cached under
+(path, ETag, encoding) and a hot response is only compressed once per data
+version.
+"""
+import hashlib
+import re
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional, gzip always works
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv')
+
+_q_re = re.compile(r'(?:^|;)\s*q\s*=\s*([0-9.]+)')
+
+
+def negotiate(accept_encoding):
+    """Return 'br', 'gzip' or None for an Accept-Encoding header value."""
+    prefs = {}
+    for part in accept_encoding.split(','):
+        name, _sep, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        match = _q_re.search(params)
+        try:
+            prefs[name] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            prefs[name] = 0.0
+
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = prefs.get(encoding, prefs.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class Compressor:
+    """Incremental gzip or brotli encoder."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits=31: deflate inside a gzip container.
+            self._obj = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def feed(self, data):
+        if self.encoding == 'br':
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def chunk(self, data):
+        """Compress ``data`` and flush it, so it can be sent right away."""
+        if self.encoding == 'br':
+            return self.feed(data) + self._obj.flush()
+        return self.feed(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def compress(data, encoding):
+    compressor = Compressor(encoding)
+    return compressor.feed(data) + compressor.finish()
+
+
+def _compress_stream(chunks, encoding):
+    compressor = Compressor(encoding)
+    for data in chunks:
+        out = compressor.chunk(data)
+        if out:
+            yield out
+    yield compressor.finish()
+
+
+async def _compress_async_stream(chunks, encoding):
+    compressor = Compressor(encoding)
+    async for data in chunks:
+        out = compressor.chunk(data)
+        if out:
+            yield out
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def _is_candidate(self, response):
+        if response.has_header('Content-Encoding') or response.status_code == 206:
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return False
+        return response.streaming or len(response.content) >= settings.COMPRESSION_MIN_BYTES
+
+    def _cache_key(self, request, response, encoding):
+        etag = response.get('ETag', '')
+        if not etag.startswith('"') or not settings.COMPRESSION_CACHE_ALIAS:
+            return None
+        path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+        return f"compressed:{encoding}:{path}:{etag}"
+
+    def process_response(self, request, response):
+        if not self._is_candidate(response):
+            return response
+        # The representation depends on Accept-Encoding even when this client gets it plain.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _compress_async_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = _compress_stream(response.streaming_content, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            key = self._cache_key(request, response, encoding)
+            cache = caches[settings.COMPRESSION_CACHE_ALIAS] if key else None
+            body = cache.get(key) if key else None
+            if body is None:
+                body = compress(response.content, encoding)
+                if len(body) >= len(response.content):
+                    return response
+                if key and len(body) <= settings.COMPRESSION_CACHE_MAX_BYTES:
+                    cache.set(key, body, settings.COMPRESSION_CACHE_TIMEOUT)
+            response.content = body
+            response.headers['Content-Length'] = str(len(body))
+
+        # The compressed bytes differ from the ones the strong ETag names.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
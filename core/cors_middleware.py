@@ -1,18 +1,39 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
 
 class SimpleCorsMiddleware:
+    # Runs natively under both WSGI and ASGI (no thread hop for async views).
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         if request.method == "OPTIONS":
             response = HttpResponse()
         else:
             response = self.get_response(request)
+        return self.add_headers(request, response)
+
+    async def __acall__(self, request):
+        if request.method == "OPTIONS":
+            response = HttpResponse()
+        else:
+            response = await self.get_response(request)
+        return self.add_headers(request, response)
 
+    def add_headers(self, request, response):
         origin = request.headers.get('Origin', '*')
         response["Access-Control-Allow-Origin"] = origin
         response["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS, PUT, DELETE"
         response["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With, Accept, Origin"
         response["Access-Control-Allow-Credentials"] = "true"
+        # The allowed origin is echoed back, so caches must key on it.
+        patch_vary_headers(response, ('Origin',))
         return response
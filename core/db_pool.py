@@ -0,0 +1,33 @@
+"""
+Metrics and lifecycle helpers for the database connection pools (``DB_POOL``
+mode, see capstone/settings.py).
+
+Each worker process has its own pool per database alias, created on the
+first query, so the figures reported here describe the process that serves
+the request.
+"""
+from django.db import connections
+
+
+def _pooled():
+    for alias in connections:
+        connection = connections[alias]
+        if connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            yield alias, connection
+
+
+def stats():
+    """
+    Return ``{alias: counters}`` for every pooled alias, from psycopg's
+    ``get_stats()``: ``pool_size``/``pool_available`` for the current
+    state, and cumulative counters such as ``requests_waiting``,
+    ``requests_wait_ms``, ``requests_errors`` (checkout timeouts) and
+    ``connections_lost`` (connections that failed the checkout check).
+    """
+    return {alias: connection.pool.get_stats() for alias, connection in _pooled()}
+
+
+def close_pools():
+    """Close every pool opened in this process; the next query opens a new one."""
+    for _alias, connection in _pooled():
+        connection.close_pool()
@@ -0,0 +1,54 @@
+"""
+JSON encoding for large API responses.
+
+``dumps`` uses the callable named by ``API_JSON_DUMPS`` (a dotted path to a
+function returning bytes or str), otherwise orjson when it is installed,
+otherwise the standard library with Django's encoder. All of them produce
+the same JSON for the types the API emits (str, int, float, bool, None,
+lists and dicts); datetimes are converted to ISO strings before encoding.
+"""
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def stdlib_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def orjson_dumps(data):
+    return orjson.dumps(data)
+
+
+@lru_cache(maxsize=None)
+def _resolve(path):
+    if path:
+        return import_string(path)
+    return orjson_dumps if orjson is not None else stdlib_dumps
+
+
+def get_dumps():
+    return _resolve(getattr(settings, 'API_JSON_DUMPS', None))
+
+
+def dumps(data):
+    """Encode ``data`` with the configured backend; always returns bytes."""
+    content = get_dumps()(data)
+    return content.encode() if isinstance(content, str) else content
+
+
+class JsonResponse(HttpResponse):
+    """Drop-in for django.http.JsonResponse (without encoder options) using ``dumps``."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
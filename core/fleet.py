@@ -0,0 +1,192 @@
+"""
+Fleet-wide KPI report (``python manage.py fleet_report``).
+
+Users are split into shards of consecutive ids. Each shard streams its
+recharge columns, in (user, data) order from the covering index, straight
+into one NumPy structured array and reduces it per user with ``reduceat``;
+the dashboard KPIs (core.kpis.build_kpis) are then derived for every user
+of the shard at once. Shards run in a process pool, and the parent only
+concatenates the per-user columns and summarises them.
+
+Workers are started with ``spawn``, so this module must stay importable
+before Django is set up: models are imported inside the functions that
+run after ``init_worker``.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROW_DTYPE = np.dtype([
+    ('user_id', np.int64),
+    ('kwh', np.float64),
+    ('custo', np.float64),
+    ('isento', np.bool_),
+    ('odometro', np.float64),
+])
+
+# Per-user columns of the report, in CSV order (the build_kpis names).
+KPI_COLUMNS = (
+    'recargas', 'recargas_isentas_qtd', 'recargas_pagas_qtd', 'total_km', 'consumo_total_kwh',
+    'consumo_por_100km', 'custo_total', 'custo_isentas', 'custo_pagas', 'custo_medio_kwh',
+    'custo_medio_km', 'custo_gas_por_km', 'custo_gas_total', 'economia_total',
+    'economia_total_por_km', 'economia_pagas', 'economia_pagas_por_km',
+)
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def shards(user_ids, size):
+    """(first_id, last_id) ranges of ``size`` consecutive ids from the sorted ``user_ids``."""
+    user_ids = list(user_ids)
+    return [(chunk[0], chunk[-1]) for chunk in (user_ids[i:i + size] for i in range(0, len(user_ids), size))]
+
+
+def load_rows(first_id, last_id, chunk_size=20000):
+    """The shard's recharge columns as a ROW_DTYPE array ordered by (user, data)."""
+    from .models import Recharge
+
+    rows = (
+        Recharge.objects.filter(user_id__gte=first_id, user_id__lte=last_id)
+        .order_by('user_id', 'data', 'id')
+        .values_list('user_id', 'kwh', 'custo', 'isento', 'odometro')
+        .iterator(chunk_size=chunk_size)
+    )
+    return np.fromiter(rows, dtype=ROW_DTYPE)
+
+
+def load_gas_config(first_id, last_id, user_ids):
+    """(preco_gasolina, consumo_km_l) aligned with ``user_ids``, NaN where a user has none."""
+    from .models import Settings
+
+    preco = np.full(len(user_ids), np.nan)
+    consumo = np.full(len(user_ids), np.nan)
+    configs = Settings.objects.filter(user_id__gte=first_id, user_id__lte=last_id).values_list(
+        'user_id', 'preco_gasolina', 'consumo_km_l',
+    )
+    for user_id, preco_gasolina, consumo_km_l in configs:
+        idx = np.searchsorted(user_ids, user_id)
+        if idx < len(user_ids) and user_ids[idx] == user_id:
+            preco[idx] = np.nan if preco_gasolina is None else preco_gasolina
+            consumo[idx] = np.nan if consumo_km_l is None else consumo_km_l
+    return preco, consumo
+
+
+def user_kpis(rows, preco_gasolina, consumo_km_l):
+    """
+    The build_kpis dict of every user in ``rows`` (sorted by user), as
+    arrays. Same formulas, same zero rules; gasoline figures are NaN for
+    users without a complete configuration.
+    """
+    user_id = rows['user_id']
+    starts = np.flatnonzero(np.r_[True, user_id[1:] != user_id[:-1]])
+    recargas = np.diff(np.r_[starts, len(rows)])
+    isento = rows['isento']
+    custo = rows['custo']
+
+    kwh_total = np.add.reduceat(rows['kwh'], starts)
+    custo_total = np.add.reduceat(custo, starts)
+    custo_isentas = np.add.reduceat(np.where(isento, custo, 0.0), starts)
+    custo_pagas = np.add.reduceat(np.where(isento, 0.0, custo), starts)
+    isentas_qtd = np.add.reduceat(isento.astype(np.int64), starts)
+    odo_min = np.minimum.reduceat(rows['odometro'], starts)
+    odo_max = np.maximum.reduceat(rows['odometro'], starts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_km = np.where(recargas >= 2, odo_max - odo_min, 0.0)
+        has_km = total_km > 0
+        tem_config = ~np.isnan(preco_gasolina) & (np.nan_to_num(consumo_km_l) > 0)
+        custo_gas_total = np.where(tem_config, (total_km / consumo_km_l) * preco_gasolina, np.nan)
+        economia_total = custo_gas_total - custo_total
+        economia_pagas = custo_gas_total - custo_pagas
+        return {
+            'user_id': user_id[starts],
+            'recargas': recargas,
+            'recargas_isentas_qtd': isentas_qtd,
+            'recargas_pagas_qtd': recargas - isentas_qtd,
+            'total_km': total_km,
+            'consumo_total_kwh': kwh_total,
+            'consumo_por_100km': np.where(has_km, kwh_total / total_km * 100, 0.0),
+            'custo_total': custo_total,
+            'custo_isentas': custo_isentas,
+            'custo_pagas': custo_pagas,
+            'custo_medio_kwh': np.where(kwh_total > 0, custo_total / kwh_total, 0.0),
+            'custo_medio_km': np.where(has_km, custo_total / total_km, 0.0),
+            'custo_gas_por_km': np.where(tem_config, preco_gasolina / consumo_km_l, np.nan),
+            'custo_gas_total': custo_gas_total,
+            'economia_total': economia_total,
+            'economia_total_por_km': np.where(tem_config & ~has_km, 0.0, economia_total / total_km),
+            'economia_pagas': economia_pagas,
+            'economia_pagas_por_km': np.where(tem_config & ~has_km, 0.0, economia_pagas / total_km),
+        }
+
+
+def analyze_shard(shard):
+    """Per-user KPI columns of one (first_id, last_id) shard, plus its row count."""
+    first_id, last_id = shard
+    rows = load_rows(first_id, last_id)
+    if not len(rows):
+        return {'rows': 0, 'kpis': None}
+    kpis = user_kpis(rows, *load_gas_config(first_id, last_id, np.unique(rows['user_id'])))
+    return {'rows': len(rows), 'kpis': kpis}
+
+
+def init_worker(database_name):
+    """Set Django up in a spawned worker, pointed at the parent's database (the test one under tests)."""
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.DATABASES['default']['NAME'] = database_name
+
+
+def run(shard_list, workers, database_name):
+    """
+    Yield ``analyze_shard`` results in shard order, in this process when
+    ``workers`` is 0, else across a pool of ``workers`` processes.
+    """
+    if not workers:
+        yield from map(analyze_shard, shard_list)
+        return
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker,
+                             initargs=(database_name,)) as pool:
+        yield from pool.map(analyze_shard, shard_list)
+
+
+def combine(results):
+    """Concatenate the shards' per-user columns; returns (columns or None, total rows)."""
+    parts = [result['kpis'] for result in results if result['kpis'] is not None]
+    total_rows = sum(result['rows'] for result in results)
+    if not parts:
+        return None, total_rows
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}, total_rows
+
+
+def summarize(columns):
+    """Fleet totals and the distribution of per-user kWh/100 km."""
+    if columns is None:
+        return {'usuarios': 0}
+    configured = ~np.isnan(columns['economia_total'])
+    consumo = columns['consumo_por_100km'][columns['total_km'] > 0]
+    if len(consumo):
+        percentis = dict(zip((f'p{p}' for p in PERCENTILES), np.percentile(consumo, PERCENTILES).tolist()))
+    else:
+        percentis = dict.fromkeys(f'p{p}' for p in PERCENTILES)
+    total_km = float(columns['total_km'].sum())
+    consumo_total_kwh = float(columns['consumo_total_kwh'].sum())
+    return {
+        'usuarios': len(columns['user_id']),
+        'usuarios_com_gasolina': int(configured.sum()),
+        'recargas': int(columns['recargas'].sum()),
+        'total_km': total_km,
+        'consumo_total_kwh': consumo_total_kwh,
+        'custo_total': float(columns['custo_total'].sum()),
+        'custo_pagas': float(columns['custo_pagas'].sum()),
+        'economia_total': float(columns['economia_total'][configured].sum()),
+        'economia_pagas': float(columns['economia_pagas'][configured].sum()),
+        'consumo_por_100km': {
+            'frota': consumo_total_kwh / total_km * 100 if total_km > 0 else 0.0,
+            'media_usuarios': float(consumo.mean()) if len(consumo) else None,
+            **percentis,
+        },
+    }
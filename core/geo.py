@@ -0,0 +1,159 @@
+"""
+Geohash grid for the recharge map (``/api/recharges/map/``).
+
+``Recharge.geohash`` is kept by a Postgres trigger: every insert, and every
+update that sets latitude/longitude, fills it with the ``core_geohash`` SQL
+function (migration 0012), including bulk and raw SQL writes. A geohash
+prefix is a grid cell and neighbouring points share prefixes, so:
+
+* clusters for a zoom level are ``GROUP BY substr(geohash, 1, precision)``;
+* a bounding box is covered by a few prefixes, each one a tight range scan
+  of the ``(user, geohash)`` index, instead of a scan of the user's rows.
+
+``encode`` mirrors the SQL function; ``cover`` picks the prefixes.
+"""
+from dataclasses import dataclass
+
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import Substr
+
+from .models import GEOHASH_PRECISION, Recharge
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_ZOOM = 22
+# Above this many cover cells a coarser prefix is used; the exact bbox filter still applies.
+MAX_COVER_CELLS = 32
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, ch, bit, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                ch, lon_lo = ch * 2 + 1, mid
+            else:
+                ch, lon_hi = ch * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                ch, lat_lo = ch * 2 + 1, mid
+            else:
+                ch, lat_hi = ch * 2, mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[ch])
+            ch, bit = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(latitude, longitude) span in degrees of a cell with ``precision`` characters."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def precision_for_zoom(zoom):
+    """Geohash length giving a few clusters across one web map tile at ``zoom``."""
+    return max(1, min(GEOHASH_PRECISION, (2 * zoom + 4) // 5))
+
+
+@dataclass(frozen=True)
+class BBox:
+    west: float
+    south: float
+    east: float
+    north: float
+
+
+def parse_bbox(value):
+    """Parse ``west,south,east,north`` in degrees; raises ValueError."""
+    try:
+        west, south, east, north = (float(part) for part in (value or '').split(','))
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north in degrees")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError("bbox is out of range or crosses the antimeridian")
+    return BBox(west, south, east, north)
+
+
+def parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("zoom must be an integer")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    return zoom
+
+
+def _cells(bbox, precision):
+    dlat, dlon = cell_size(precision)
+    rows = range(int((bbox.south + 90) // dlat), int(min(bbox.north + 90, 180 - 1e-9) // dlat) + 1)
+    cols = range(int((bbox.west + 180) // dlon), int(min(bbox.east + 180, 360 - 1e-9) // dlon) + 1)
+    return rows, cols, dlat, dlon
+
+
+def cover(bbox, precision):
+    """
+    Geohash prefixes, at most ``precision`` long and at most
+    ``MAX_COVER_CELLS`` of them, whose cells together contain ``bbox``.
+    An empty list means the box is too large to narrow down.
+    """
+    for q in range(precision, 0, -1):
+        rows, cols, dlat, dlon = _cells(bbox, q)
+        if len(rows) * len(cols) <= MAX_COVER_CELLS:
+            return sorted({
+                encode((r + 0.5) * dlat - 90, (c + 0.5) * dlon - 180, q)
+                for r in rows for c in cols
+            })
+    return []
+
+
+def _next_prefix(prefix):
+    # Smallest string above every string starting with ``prefix`` (the column uses the "C" collation).
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def clusters(user, bbox, zoom):
+    """One dict per occupied cell at ``zoom``'s precision inside ``bbox``, from one grouped query."""
+    precision = precision_for_zoom(zoom)
+    recharges = Recharge.objects.filter(
+        user=user,
+        latitude__range=(bbox.south, bbox.north),
+        longitude__range=(bbox.west, bbox.east),
+    )
+    prefixes = cover(bbox, precision)
+    if prefixes:
+        ranges = Q()
+        for prefix in prefixes:
+            ranges |= Q(geohash__gte=prefix, geohash__lt=_next_prefix(prefix))
+        recharges = recharges.filter(ranges)
+
+    rows = (
+        recharges
+        .annotate(celula=Substr('geohash', 1, precision))
+        .values('celula')
+        .annotate(
+            recargas=Count('id'),
+            kwh_total=Sum('kwh'),
+            custo_medio=Avg('custo'),
+            lat=Avg('latitude'),
+            lon=Avg('longitude'),
+        )
+        .order_by('celula')
+    )
+    return precision, [
+        {
+            "geohash": row['celula'],
+            "recargas": row['recargas'],
+            "kwh_total": round(row['kwh_total'] or 0.0, 2),
+            "custo_medio": round(row['custo_medio'] or 0.0, 2),
+            # Centroid of the cell's recharges, where the cluster marker goes.
+            "latitude": round(row['lat'], 6),
+            "longitude": round(row['lon'], 6),
+        }
+        for row in rows
+    ]
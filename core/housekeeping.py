@@ -0,0 +1,56 @@
+"""
+Periodic cleanup that the deploy has no cron for: expired ``django_session``
+rows and recharge tombstones past ``SYNC_TOMBSTONE_RETENTION_DAYS``.
+
+``start()`` runs ``run_once()`` every ``HOUSEKEEPING_INTERVAL_SECONDS`` on a
+daemon thread; gunicorn.conf.py starts one per worker. Both deletes are
+idempotent range deletes on indexed columns, so workers running them
+concurrently only repeat a cheap no-op. ``python manage.py clearsessions``
+and ``prune_tombstones`` do the same on demand.
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.utils import timezone
+
+from . import sync
+
+logger = logging.getLogger(__name__)
+
+_started = False
+_lock = threading.Lock()
+
+
+def run_once():
+    # Rows left by the db/cached_db engines, also after switching to signed cookies.
+    sessions, _deleted = Session.objects.filter(expire_date__lt=timezone.now()).delete()
+    return {'sessions': sessions, 'tombstones': sync.prune_tombstones()}
+
+
+def _loop(interval):
+    # Jitter keeps the workers from waking up together.
+    while True:
+        time.sleep(interval * random.uniform(0.9, 1.1))
+        try:
+            logger.info("Housekeeping: %s", run_once())
+        except Exception:
+            logger.exception("Housekeeping failed")
+        finally:
+            connection.close()
+
+
+def start():
+    """Start the cleanup thread once per process; a zero interval disables it."""
+    global _started
+    interval = settings.HOUSEKEEPING_INTERVAL_SECONDS
+    with _lock:
+        if _started or interval <= 0:
+            return False
+        _started = True
+    threading.Thread(target=_loop, args=(interval,), name='housekeeping', daemon=True).start()
+    return True
@@ -0,0 +1,214 @@
+"""
+CSV imports: ``validate_csv_and_parse`` turns an uploaded file into row
+dicts, and ``import_rows`` inserts them with ``bulk_create`` in batches
+inside a single transaction.
+"""
+import csv
+import io
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils.translation import gettext as _
+
+from . import rollups, sync
+from .models import Recharge
+
+
+def normalize_header(h):
+    if not h: return ""
+    return unicodedata.normalize('NFKD', h).encode('ASCII', 'ignore').decode('utf-8').strip().lower()
+
+
+def validate_csv_and_parse(file_storage):
+    err_msgs = []
+    rows_validos = []
+    try:
+        raw = file_storage.read()
+    except Exception as e:
+        return [], [_(f"Erro ao ler arquivo: {e}")]
+
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1", errors="ignore")
+    
+    text = text.replace("\x00", "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    stream = io.StringIO(text, newline='')
+
+    sample = text[:10000]
+    delimiter = ','
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=[',', ';', '\t', '|'])
+        delimiter = dialect.delimiter
+    except Exception:
+        first_line = text.splitlines()[0] if text.splitlines() else ""
+        if ';' in first_line and ',' not in first_line:
+            delimiter = ';'
+        elif '\t' in first_line:
+            delimiter = '\t'
+
+    try:
+        reader = csv.DictReader(stream, delimiter=delimiter)
+    except Exception as e:
+        return [], [_(f"Erro ao preparar leitor CSV: {e}")]
+
+    if not reader.fieldnames:
+        return [], [_("Arquivo CSV sem cabeçalho.")]
+
+    # Normalize headers behavior: Remove accents, lowercase
+    reader.fieldnames = [normalize_header(h) for h in reader.fieldnames]
+    required_headers = ['data', 'kwh', 'custo', 'isento', 'odometro']
+    # observacoes is optional
+
+    missing = [h for h in required_headers if h not in reader.fieldnames]
+    if missing:
+        msg = _("Cabeçalhos inválidos. Esperados: %(expected)s. Ausentes: %(missing)s") % {
+            'expected': ", ".join(required_headers),
+            'missing': ", ".join(missing)
+        }
+        return [], [msg]
+
+    line_num = 1
+    for row in reader:
+        line_num += 1
+        # Skip empty lines
+        if all((row.get(h) is None or str(row.get(h)).strip() == "") for h in required_headers):
+            continue
+            
+        try:
+            data_str = (row.get('data') or "").strip()
+            if not data_str:
+                raise ValueError(_("Campo 'data' vazio."))
+
+            try:
+                # Attempt ISO
+                dt = datetime.fromisoformat(data_str.replace(' ', 'T'))
+            except ValueError:
+                raise ValueError(_("Formato de data inválido (Use AAAA-MM-DD HH:MM)."))
+
+            kwh = float((row.get('kwh') or "").replace(',', '.'))
+            custo = float((row.get('custo') or "").replace(',', '.'))
+            odometro = float((row.get('odometro') or "").replace(',', '.'))
+            observacoes = (row.get('observacoes') or "").strip()
+            local = (row.get('local') or "").strip()
+            
+            isento_raw = (row.get('isento') or "").strip().lower()
+            isento = isento_raw in ["true", "1", "sim", "yes", "y"]
+
+            latitude = None
+            try:
+                lat_str = row.get('latitude') or row.get('lat')
+                if lat_str and lat_str.strip():
+                    latitude = float(lat_str.strip().replace(',', '.'))
+            except Exception:
+                pass
+
+            longitude = None
+            try:
+                lon_str = row.get('longitude') or row.get('lon') or row.get('lng')
+                if lon_str and lon_str.strip():
+                    longitude = float(lon_str.strip().replace(',', '.'))
+            except Exception:
+                pass
+
+            rows_validos.append({
+                'data': dt,
+                'kwh': kwh,
+                'custo': custo,
+                'odometro': odometro,
+                'isento': isento,
+                'observacoes': observacoes,
+                'local': local,
+                'latitude': latitude,
+                'longitude': longitude,
+            })
+        except ValueError as ve:
+            err_msgs.append(_(f"Linha {line_num}: {ve}"))
+        except Exception as e:
+            err_msgs.append(_(f"Linha {line_num}: erro inesperado: {e}"))
+
+    if not rows_validos and not err_msgs:
+        err_msgs.append(_("Nenhuma linha válida encontrada no CSV."))
+        
+    return rows_validos, err_msgs
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.created / self.elapsed if self.elapsed > 0 else float(self.created)
+
+
+def _insert_skipping_bad_rows(objs, offset, result):
+    """Insert one batch; if it fails, retry row by row and record the bad rows."""
+    try:
+        with transaction.atomic():
+            Recharge.objects.bulk_create(objs)
+        result.created += len(objs)
+        return
+    except DatabaseError:
+        pass
+
+    for position, obj in enumerate(objs, start=offset + 1):
+        try:
+            with transaction.atomic():
+                obj.save(force_insert=True)
+            result.created += 1
+        except DatabaseError as e:
+            result.errors.append(_("Registro %(n)s: %(error)s") % {'n': position, 'error': e})
+
+
+def insert_batch(user, rows, offset, result, skip_errors=False, import_job=None):
+    """
+    Insert one batch of parsed rows and flag the months it touched. Rows are
+    tagged with ``import_job`` when given. Returns the Recharge objects that
+    were actually saved.
+    """
+    objs = [Recharge(user=user, importacao=import_job, **row) for row in rows]
+    if skip_errors:
+        _insert_skipping_bad_rows(objs, offset, result)
+    else:
+        Recharge.objects.bulk_create(objs)
+        result.created += len(objs)
+
+    # bulk_create skips the save signals, so flag the touched months here.
+    for mes in {rollups.month_of(row['data']) for row in rows}:
+        rollups.mark_dirty(user.id, mes)
+    return [obj for obj in objs if obj.pk is not None]
+
+
+def import_rows(user, rows, batch_size=None, skip_errors=False):
+    """
+    Insert parsed rows for ``user`` in ``bulk_create`` batches.
+
+    All-or-nothing by default: any database error rolls the whole import back
+    and is re-raised. With ``skip_errors`` the rows the database rejects are
+    reported in ``ImportResult.errors`` and the rest are kept.
+    """
+    batch_size = batch_size or settings.BULK_IMPORT_BATCH_SIZE
+    result = ImportResult()
+    started = time.perf_counter()
+
+    with transaction.atomic(), rollups.deferred():
+        id_ranges = []
+        for offset in range(0, len(rows), batch_size):
+            saved = insert_batch(user, rows[offset:offset + batch_size], offset, result, skip_errors)
+            if saved:
+                ids = [obj.pk for obj in saved]
+                id_ranges.append((min(ids), max(ids)))
+        # The rows only become visible at commit, possibly long after they
+        # were stamped; delta sync must see them as changed from then on.
+        sync.restamp_on_commit(user.id, id_ranges)
+
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,203 @@
+"""
+In-process worker for background CSV imports (no external broker).
+
+Jobs are persisted as ImportJob rows and executed on a small thread pool
+inside each web worker. Every batch is committed together with the job's
+progress, so a job interrupted by a worker restart is picked up again from
+its last committed batch, either by ``resume_pending()`` (called from the
+gunicorn ``post_worker_init`` hook) or by ``manage.py run_import_jobs``.
+Each batch transaction first renews the worker's lease and locks the job row,
+so a worker whose lease was taken over stops without committing anything.
+"""
+import io
+import logging
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from . import importer, rollups, sync
+from .models import ImportJob, Recharge
+
+logger = logging.getLogger(__name__)
+
+MAX_STORED_ERRORS = 1000
+PROGRESS_FIELDS = ['total_linhas', 'processadas', 'criadas', 'erros', 'lotes', 'atualizado_em']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMPORT_JOB_WORKERS, thread_name_prefix='import-job'
+            )
+    return _executor
+
+
+def create_job(user, uploaded_file, modo):
+    job = ImportJob.objects.create(
+        user=user,
+        modo=modo,
+        nome_arquivo=uploaded_file.name[:255],
+        arquivo=uploaded_file.read(),
+    )
+    enqueue(job.pk)
+    return job
+
+
+def enqueue(job_id):
+    """Run the job after the current transaction commits."""
+    if settings.IMPORT_JOBS_EAGER:
+        transaction.on_commit(lambda: run_job(job_id))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job_id))
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception("Import job %s crashed", job_id)
+    finally:
+        connection.close()
+
+
+def claimable():
+    stale = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_LEASE_SECONDS)
+    return Q(status=ImportJob.PENDENTE) | Q(status=ImportJob.PROCESSANDO, atualizado_em__lt=stale)
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker claimed it."""
+
+
+def claim(job_id):
+    """
+    Atomically take ownership of a pending job, or of a running job whose
+    worker stopped heartbeating. Returns the lease token to pass to
+    ``renew()``, or None if someone else owns the job.
+    """
+    token = secrets.token_hex(16)
+    updated = ImportJob.objects.filter(claimable(), pk=job_id).update(
+        status=ImportJob.PROCESSANDO, token_execucao=token, atualizado_em=timezone.now()
+    )
+    return token if updated == 1 else None
+
+
+def renew(job, token):
+    """
+    Extend our lease on ``job``. Inside a transaction the row stays locked
+    until commit, so no other worker can claim the job before our writes are
+    in. Raises LeaseLost if another worker claimed it in the meantime.
+    """
+    updated = ImportJob.objects.filter(
+        pk=job.pk, status=ImportJob.PROCESSANDO, token_execucao=token
+    ).update(atualizado_em=timezone.now())
+    if updated != 1:
+        raise LeaseLost(job.pk)
+
+
+def resume_pending():
+    """Queue every job left pending or abandoned by a dead worker."""
+    job_ids = list(ImportJob.objects.filter(claimable()).values_list('pk', flat=True))
+    for job_id in job_ids:
+        _get_executor().submit(_run_in_thread, job_id)
+    return job_ids
+
+
+def _add_errors(job, errors):
+    room = MAX_STORED_ERRORS - len(job.erros)
+    if room > 0:
+        job.erros.extend(str(e) for e in errors[:room])
+
+
+def _fail(job, errors):
+    _add_errors(job, errors)
+    job.status = ImportJob.FALHOU
+    job.arquivo = b''
+    job.save()
+
+
+def _undo_committed_batches(job):
+    if not job.lotes:
+        return
+    ranges = Q()
+    for first_id, last_id in job.lotes:
+        ranges |= Q(pk__range=(first_id, last_id))
+    # The ranges keep the delete on the primary key; the job tag leaves out
+    # rows the user created in between while the import was running.
+    with transaction.atomic(), rollups.deferred(), sync.deferred():
+        Recharge.objects.filter(ranges, user_id=job.user_id, importacao=job).delete()
+    job.criadas = 0
+    job.processadas = 0
+    job.lotes = []
+
+
+def run_job(job_id):
+    token = claim(job_id)
+    if token is None:
+        return
+    try:
+        _run_claimed(ImportJob.objects.select_related('user').get(pk=job_id), token)
+    except LeaseLost:
+        logger.warning("Import job %s was claimed by another worker, stopping", job_id)
+
+
+def _run_claimed(job, token):
+    skip_errors = job.modo == 'skip'
+
+    rows, parse_errors = importer.validate_csv_and_parse(io.BytesIO(bytes(job.arquivo)))
+    if parse_errors and (not skip_errors or not rows):
+        with transaction.atomic():
+            renew(job, token)
+            _fail(job, parse_errors)
+        return
+    if job.processadas == 0:
+        _add_errors(job, parse_errors)
+    job.total_linhas = len(rows)
+    # Parsing a large file can take a good part of the lease.
+    renew(job, token)
+
+    batch_size = settings.BULK_IMPORT_BATCH_SIZE
+    for offset in range(job.processadas, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        result = importer.ImportResult()
+        try:
+            with transaction.atomic(), rollups.deferred():
+                renew(job, token)
+                saved = importer.insert_batch(job.user, batch, offset, result, skip_errors, import_job=job)
+                if saved:
+                    ids = [obj.pk for obj in saved]
+                    job.lotes.append([min(ids), max(ids)])
+                job.processadas = offset + len(batch)
+                job.criadas += result.created
+                _add_errors(job, result.errors)
+                job.save(update_fields=PROGRESS_FIELDS)
+        except DatabaseError as e:
+            job.refresh_from_db(fields=PROGRESS_FIELDS)
+            with transaction.atomic():
+                renew(job, token)
+                if skip_errors:
+                    _fail(job, [str(e)])
+                else:
+                    # All-or-nothing: remove what earlier batches committed.
+                    _undo_committed_batches(job)
+                    _fail(job, [_("Importação cancelada, nenhuma recarga foi salva: %(error)s") % {'error': e}])
+            return
+
+    with transaction.atomic():
+        renew(job, token)
+        job.status = ImportJob.CONCLUIDO
+        job.arquivo = b''
+        job.save()
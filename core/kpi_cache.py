@@ -0,0 +1,84 @@
+"""
+Per-user cache of the dashboard KPIs and the monthly API payload.
+
+Keys embed the user's ``DataVersion``, which every write to their recharges
+or settings bumps: save/delete signals, and ``rollups.deferred()`` blocks
+around queryset-level operations such as ``delete_all_recharges`` and CSV
+imports. A write therefore makes the old entries unreachable in every worker
+process at once, without any cross-process delete; they age out through the
+TTL (``KPI_CACHE_TIMEOUT``) and the backend's ``MAX_ENTRIES`` bound.
+
+Hit/miss counters are kept per process and reported by ``stats()``.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import versions
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.KPI_CACHE_ALIAS]
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def cache_key(user_id, versao, name):
+    return f"kpis:{user_id}:{versao}:{name}"
+
+
+def get_or_compute(request, name, compute):
+    """
+    Return the cached value ``name`` for the request's user at their current
+    data version, calling ``compute()`` and storing the result on a miss.
+    """
+    versao, _atualizado_em = versions.current(request)
+    key = cache_key(request.user.id, versao, name)
+    cache = _cache()
+    value = cache.get(key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = compute()
+    cache.set(key, value, settings.KPI_CACHE_TIMEOUT)
+    return value
+
+
+async def aget_or_compute(request, name, compute):
+    """``get_or_compute`` for async views; ``compute`` is a coroutine function."""
+    versao, _atualizado_em = await versions.acurrent(request)
+    key = cache_key(request.user.id, versao, name)
+    cache = _cache()
+    value = await cache.aget(key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = await compute()
+    await cache.aset(key, value, settings.KPI_CACHE_TIMEOUT)
+    return value
+
+
+def stats():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
@@ -0,0 +1,220 @@
+"""
+KPI engine shared by the dashboard and the monthly API.
+
+All totals come from a single aggregate query over the user's recharges, so
+no model instances are loaded regardless of history size.
+"""
+from django.db.models import Count, Sum, Min, Max, Q
+
+from .models import Recharge
+
+
+def has_gas_config(config):
+    return bool(
+        config
+        and config.preco_gasolina is not None
+        and config.consumo_km_l
+        and config.consumo_km_l > 0
+    )
+
+
+def _totals():
+    return {
+        'recargas': Count('id'),
+        'isentas_qtd': Count('id', filter=Q(isento=True)),
+        'kwh_total': Sum('kwh'),
+        'custo_sum': Sum('custo'),
+        'custo_isentas_sum': Sum('custo', filter=Q(isento=True)),
+        'custo_pagas_sum': Sum('custo', filter=Q(isento=False)),
+        'odo_min': Min('odometro'),
+        'odo_max': Max('odometro'),
+    }
+
+
+def _normalize(agg):
+    for key in ('kwh_total', 'custo_sum', 'custo_isentas_sum', 'custo_pagas_sum'):
+        agg[key] = agg[key] or 0.0
+    return agg
+
+
+def aggregate_totals(queryset):
+    """Run the single KPI aggregate over ``queryset`` and normalize empty sums to 0."""
+    return _normalize(queryset.aggregate(**_totals()))
+
+
+async def aaggregate_totals(queryset):
+    return _normalize(await queryset.aaggregate(**_totals()))
+
+
+def build_kpis(totals, config=None, missing=None):
+    """
+    Derive the KPI dict from ``aggregate_totals`` output.
+
+    ``missing`` is used for the gasoline comparison fields when the user has
+    no complete gas configuration (the dashboard shows "-", the API sends 0).
+    """
+    total_recargas = totals['recargas']
+    recargas_isentas_qtd = totals['isentas_qtd']
+
+    # A single odometer reading does not describe any distance driven.
+    if total_recargas >= 2 and totals['odo_min'] is not None:
+        total_km = totals['odo_max'] - totals['odo_min']
+    else:
+        total_km = 0.0
+
+    custo_total = totals['custo_sum']
+    custo_isentas = totals['custo_isentas_sum']
+    custo_pagas = totals['custo_pagas_sum']
+    consumo_total_kwh = totals['kwh_total']
+
+    consumo_por_100km = (consumo_total_kwh / total_km * 100) if total_km > 0 else 0
+    custo_medio_kwh = (custo_total / consumo_total_kwh) if consumo_total_kwh > 0 else 0
+    custo_medio_km = (custo_total / total_km) if total_km > 0 else 0
+
+    if has_gas_config(config):
+        preco_gasolina = config.preco_gasolina
+        consumo_km_l = config.consumo_km_l
+        custo_gas_por_km = preco_gasolina / consumo_km_l
+        custo_gas_total = (total_km / consumo_km_l) * preco_gasolina
+        economia_total = custo_gas_total - custo_total
+        economia_total_por_km = economia_total / total_km if total_km > 0 else 0
+        economia_pagas = custo_gas_total - custo_pagas
+        economia_pagas_por_km = economia_pagas / total_km if total_km > 0 else 0
+    else:
+        custo_gas_por_km = missing
+        custo_gas_total = missing
+        economia_total = missing
+        economia_total_por_km = missing
+        economia_pagas = missing
+        economia_pagas_por_km = missing
+
+    return {
+        "recargas": total_recargas,
+        "recargas_isentas_qtd": recargas_isentas_qtd,
+        "recargas_pagas_qtd": total_recargas - recargas_isentas_qtd,
+        "total_km": total_km,
+        "consumo_total_kwh": consumo_total_kwh,
+        "consumo_por_100km": consumo_por_100km,
+        "custo_total": custo_total,
+        "custo_isentas": custo_isentas,
+        "custo_pagas": custo_pagas,
+        "custo_medio_kwh": custo_medio_kwh,
+        "custo_medio_km": custo_medio_km,
+        "custo_gas_por_km": custo_gas_por_km,
+        "custo_gas_total": custo_gas_total,
+        "economia_total": economia_total,
+        "economia_total_por_km": economia_total_por_km,
+        "economia_pagas": economia_pagas,
+        "economia_pagas_por_km": economia_pagas_por_km,
+    }
+
+
+def compute_kpis(user, config=None, missing=None):
+    """Compute the user's KPI dict with one aggregate query."""
+    return build_kpis(aggregate_totals(Recharge.objects.filter(user=user)), config, missing)
+
+
+async def acompute_kpis(user, config=None, missing=None):
+    return build_kpis(await aaggregate_totals(Recharge.objects.filter(user=user)), config, missing)
+
+
+MONTHLY_ROLLUP_FIELDS = ('mes', 'recargas', 'kwh', 'custo_total', 'custo_pagas', 'odometro_min', 'odometro_max')
+
+
+def monthly_series(rollups, config=None):
+    """
+    Build the per-month chart arrays of ``api_recharges_monthly`` from
+    MonthlyRollup ``values(*MONTHLY_ROLLUP_FIELDS)`` rows in month order.
+    """
+    # Aggregation: one pre-computed row per month (see core.rollups)
+    return bucket_series(rollups, config, 'mes', "%Y-%m")
+
+
+def bucket_series(rows, config, key, label_format):
+    """
+    Build the chart arrays from one row per bucket carrying the
+    MonthlyRollup fields, labelled by ``row[key].strftime(label_format)``.
+    A bucket with a single recharge gets the distance driven since the
+    previous bucket's last odometer reading.
+    """
+    preco_gasolina = config.preco_gasolina if config else None
+    consumo_km_l = config.consumo_km_l if config else None
+    tem_config = has_gas_config(config)
+
+    monthly = {r[key].strftime(label_format): r for r in rows}
+
+    meses_ord = sorted(monthly.keys())
+    
+    # Response Arrays
+    labels = []
+    custos_total = []
+    custos_pagamento = []
+    custos_percentual = []
+    consumos = []
+    kms = []
+    economias_total = []
+    economias_pagamento = []
+    consumo_por_100km_list = []
+
+    for idx, mes in enumerate(meses_ord):
+        data_mes = monthly[mes]
+        labels.append(mes)
+        
+        ct = float(data_mes["custo_total"])
+        cp = float(data_mes["custo_pagas"])
+        custos_total.append(round(ct, 2))
+        custos_pagamento.append(round(cp, 2))
+        custos_percentual.append(round((cp / ct * 100) if ct > 0 else 0.0, 2))
+        
+        consumo_mes = round(float(data_mes["kwh"]), 2)
+        consumos.append(consumo_mes)
+        
+        if data_mes["recargas"] >= 2:
+            km_mes = data_mes["odometro_max"] - data_mes["odometro_min"]
+        elif data_mes["recargas"] == 1:
+            if idx > 0:
+                prev_mes = meses_ord[idx-1]
+                prev_last = monthly[prev_mes]["odometro_max"] or 0.0
+                km_mes = data_mes["odometro_min"] - prev_last
+            else:
+                km_mes = 0.0
+                # Could argue odos[0] if it's the very first month, but logic says diff.
+                # Use 0.0 to be safe
+        else:
+            km_mes = 0.0
+            
+        # Prevent negative km if data is weird
+        km_mes = max(km_mes, 0.0)
+        kms.append(round(km_mes, 2))
+        
+        if km_mes > 0:
+            consumo_por_100km_list.append(round((consumo_mes / km_mes) * 100, 2))
+        else:
+            consumo_por_100km_list.append(0)
+            
+        if tem_config:
+            custo_gas_mes = (km_mes / consumo_km_l) * preco_gasolina
+            economia_total_mes = custo_gas_mes - ct
+            economia_pagamento_mes = custo_gas_mes - cp
+        else:
+            economia_total_mes = 0.0
+            economia_pagamento_mes = 0.0
+            
+        economias_total.append(round(economia_total_mes, 2))
+        economias_pagamento.append(round(economia_pagamento_mes, 2))
+        
+    return {
+        "labels": labels,
+        "custos": {
+            "total": custos_total,
+            "pagas": custos_pagamento,
+            "percentual": custos_percentual
+        },
+        "consumo": consumos,
+        "km": kms,
+        "economia": {
+            "total": economias_total,
+            "pagas": economias_pagamento
+        },
+        "consumo_por_100km": consumo_por_100km_list
+    }
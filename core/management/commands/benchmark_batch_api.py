@@ -0,0 +1,78 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from core.benchmarking import make_rows
+
+
+def to_json_fields(row):
+    return {**row, 'data': row['data'].isoformat()}
+
+
+class Command(BaseCommand):
+    help = (
+        "Sync N creates, N updates and N deletes through the per-item API endpoints "
+        "and through /api/recharges/batch/, and report the time for each. "
+        "Every run is rolled back, so it is safe to point at a real database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000])
+
+    def per_item(self, client, rows):
+        ids = []
+        for row in rows:
+            response = client.post(reverse('api_recharge_list'), to_json_fields(row), content_type='application/json')
+            ids.append(response.json()['id'])
+        for pk in ids:
+            client.put(reverse('api_recharge_detail', args=[pk]), {'kwh': 1.5}, content_type='application/json')
+        for pk in ids:
+            client.delete(reverse('api_recharge_detail', args=[pk]))
+
+    def batched(self, client, rows):
+        url = reverse('api_recharge_batch')
+
+        def send(operations):
+            response = client.post(url, {'operations': operations}, content_type='application/json')
+            assert response.status_code == 200, response.content
+            return response.json()['results']
+
+        created = send([{'op': 'create', 'fields': to_json_fields(row)} for row in rows])
+        ids = [r['id'] for r in created]
+        send([{'op': 'update', 'id': pk, 'fields': {'kwh': 1.5}} for pk in ids])
+        send([{'op': 'delete', 'id': pk} for pk in ids])
+
+    def run(self, size, path):
+        rows = list(make_rows(size))
+        with transaction.atomic():
+            user = User.objects.create(username="__bench_batch_api")
+            client = Client()
+            client.force_login(user)
+            started = time.perf_counter()
+            getattr(self, path)(client, rows)
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        operations = size * 3
+        return {
+            'path': path,
+            'operations': operations,
+            'seconds': round(elapsed, 3),
+            'operations_per_second': round(operations / elapsed, 1) if elapsed else None,
+        }
+
+    def handle(self, *args, **options):
+        results = []
+        for size in options['sizes']:
+            for path in ('per_item', 'batched'):
+                result = self.run(size, path)
+                results.append(result)
+                self.stderr.write(
+                    f"{path:>8} {result['operations']:>6} ops: {result['seconds']:>8.3f}s "
+                    f"({result['operations_per_second']} ops/s)"
+                )
+        self.stdout.write(json.dumps(results, indent=2))
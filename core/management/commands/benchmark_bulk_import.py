@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import importer, rollups
+from core.benchmarking import make_rows
+from core.models import Recharge
+
+
+def legacy_import(user, rows):
+    """The previous bulk_recharge write path: one INSERT per row, no transaction."""
+    with rollups.deferred():
+        for r in rows:
+            Recharge.objects.create(user=user, **r)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-row and the batched bulk_recharge write paths. "
+        "Every run is rolled back, so it is safe to point at a real database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--legacy-max', type=int, default=10000,
+            help="Skip the per-row path above this size (it takes minutes).",
+        )
+
+    def run(self, size, path, batch_size):
+        rows = list(make_rows(size))
+        with transaction.atomic():
+            user = User.objects.create(username="__bench_import")
+            started = time.perf_counter()
+            if path == 'legacy':
+                legacy_import(user, rows)
+            else:
+                importer.import_rows(user, rows, batch_size=batch_size)
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return {
+            'path': path,
+            'rows': size,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(size / elapsed, 1) if elapsed else None,
+        }
+
+    def handle(self, *args, **options):
+        results = []
+        for size in options['sizes']:
+            for path in ('legacy', 'batched'):
+                if path == 'legacy' and size > options['legacy_max']:
+                    continue
+                result = self.run(size, path, options['batch_size'])
+                results.append(result)
+                self.stderr.write(
+                    f"{path:>8} {size:>8} rows: {result['seconds']:>8.3f}s "
+                    f"({result['rows_per_second']} rows/s)"
+                )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,148 @@
+import json
+import platform
+import time
+import tracemalloc
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import versions
+from core.benchmarking import csv_upload, latency_summary, make_rows, seed_user
+
+
+def _upload(rows):
+    body = csv_upload(make_rows(rows, seed=1))
+    return lambda client: client.post(
+        reverse('bulk_recharge'),
+        {'file': SimpleUploadedFile("recargas.csv", body, content_type="text/csv"), 'mode': 'atomic'},
+    )
+
+
+def endpoints(import_rows):
+    return {
+        'dashboard': lambda client: client.get(reverse('dashboard')),
+        'api_recharges_monthly': lambda client: client.get(reverse('api_recharges_monthly')),
+        'api_recharge_series': lambda client: client.get(reverse('api_recharge_series') + '?granularity=month'),
+        'api_recharge_map': lambda client: client.get(reverse('api_recharge_map') + '?bbox=-46.8,-23.7,-46.4,-23.4&zoom=13'),
+        'api_recharge_segments': lambda client: client.get(reverse('api_recharge_segments') + '?limit=100'),
+        'manage_recharges': lambda client: client.get(reverse('manage_recharges')),
+        'manage_recharges_csv': lambda client: client.get(reverse('manage_recharges') + '?export=csv'),
+        'api_recharge_list': lambda client: client.get(reverse('api_recharge_list') + '?limit=100'),
+        'api_recharge_list_full': lambda client: client.get(reverse('api_recharge_list')),
+        'bulk_recharge': _upload(import_rows),
+    }
+
+
+def _body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a user per history size and drive the core endpoints through the test client, "
+        "reporting p50/p95/p99 latency, query count and peak traced memory per request as JSON. "
+        "Seeded rows and every request's writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                            help="Recharges per seeded user; 1000000 works but seeding takes minutes.")
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(endpoints(0)), default=None)
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per endpoint and size.")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests before the timed ones.")
+        parser.add_argument('--import-rows', type=int, default=500, help="CSV rows per bulk_recharge upload.")
+        parser.add_argument('--cached', action='store_true',
+                            help="Keep the KPI cache warm instead of bumping the data version before each request.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+
+    def request_once(self, client, call):
+        # A savepoint per request keeps uploads from growing the history between runs.
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = call(client)
+                size = _body_size(response)
+                elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return response.status_code, size, elapsed, len(queries)
+
+    def measure(self, client, user, name, call, options):
+        def run():
+            if not options['cached']:
+                # What a write does: the next request recomputes the KPIs instead of hitting the cache.
+                versions.bump(user.id)
+            return self.request_once(client, call)
+
+        for _ in range(options['warmup']):
+            run()
+        timings, queries = [], []
+        for _ in range(options['repeat']):
+            status, size, elapsed, count = run()
+            timings.append(elapsed)
+            queries.append(count)
+
+        # Tracing slows Python down several times, so memory gets its own run.
+        tracemalloc.start()
+        try:
+            run()
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'endpoint': name,
+            'status': status,
+            'bytes': size,
+            'requests': len(timings),
+            **latency_summary(timings),
+            'queries': max(queries),
+            'peak_memory_kib': round(peak / 1024, 1),
+        }
+
+    def handle(self, *args, **options):
+        selected = endpoints(options['import_rows'])
+        names = options['endpoints'] or list(selected)
+
+        results = []
+        for size in options['sizes']:
+            with transaction.atomic():
+                started = time.perf_counter()
+                user = seed_user("__bench_endpoints", size, seed=options['seed'])
+                self.stderr.write(f"seeded {size} recharges in {time.perf_counter() - started:.1f}s")
+                client = Client(raise_request_exception=True)
+                client.force_login(user)
+                for name in names:
+                    result = {'rows': size, **self.measure(client, user, name, selected[name], options)}
+                    results.append(result)
+                    self.stderr.write(
+                        f"{name:>24} {size:>8} rows: p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+                        f"p99 {result['p99_ms']:>8} ms  {result['queries']:>3} queries  "
+                        f"{result['peak_memory_kib']:>9} KiB"
+                    )
+                transaction.set_rollback(True)
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'warmup': options['warmup'],
+                'cached': options['cached'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
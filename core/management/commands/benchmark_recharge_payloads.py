@@ -0,0 +1,68 @@
+import gzip
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import fastjson, serializers
+from core.benchmarking import seed_user
+from core.models import Recharge
+
+MODES = [
+    ('objects', None),
+    ('objects', 'data,kwh'),
+    ('columnar', None),
+    ('columnar', 'data,kwh'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure query + serialization time and payload size of the recharge list "
+        "for each format/fields combination and JSON encoder. Seeded rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per mode; the best time is reported.")
+
+    def measure(self, user, fmt, fields_param, dumps, repeat):
+        fields = serializers.parse_fields(fields_param)
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = list(serializers.project(Recharge.objects.filter(user=user), fields).order_by('-data'))
+            body = dumps(serializers.render(rows, fields, fmt))
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        body = body.encode() if isinstance(body, str) else body
+        return {
+            'format': fmt,
+            'fields': fields_param or 'all',
+            'encoder': dumps.__name__,
+            'rows': len(rows),
+            'milliseconds': round(best * 1000, 1),
+            'bytes': len(body),
+            'gzip_bytes': len(gzip.compress(body)),
+        }
+
+    def handle(self, *args, **options):
+        encoders = [fastjson.stdlib_dumps]
+        if fastjson.orjson is not None:
+            encoders.append(fastjson.orjson_dumps)
+
+        results = []
+        with transaction.atomic():
+            user = seed_user("__bench_payloads", options['rows'])
+            for fmt, fields in MODES:
+                for dumps in encoders:
+                    result = self.measure(user, fmt, fields, dumps, options['repeat'])
+                    results.append(result)
+                    self.stderr.write(
+                        f"{fmt:>8} {result['fields']:>8} {dumps.__name__:>13}: "
+                        f"{result['milliseconds']:>8.1f} ms {result['bytes']:>9} B "
+                        f"({result['gzip_bytes']} B gzip)"
+                    )
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,69 @@
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import search
+from core.benchmarking import latency_summary, seed_user
+from core.models import Recharge
+
+# A place that occurs a fixed number of times whatever the history size, so a
+# search that scales with the matches (not the rows) stays flat as rows grow.
+NEEDLE_LOCAL = "Eletroposto São Sebastião do Paraíso"
+NEEDLE_TERM = "sao sebastiao"
+NEEDLE_ROWS = 20
+
+
+def indexed(queryset, term):
+    return search.filter_text(queryset, 'local', term)
+
+
+def ilike(queryset, term):
+    return queryset.filter(local__icontains=term)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the history page's local search (indexed core.search vs plain icontains) "
+        "for growing history sizes. Seeded rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, user, method, term, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            page = method(Recharge.objects.filter(user=user), term).order_by('-data')
+            rows = list(page.values_list('id', flat=True)[:20])
+            timings.append(time.perf_counter() - started)
+        return {'matches': len(rows), **latency_summary(timings)}
+
+    def handle(self, *args, **options):
+        results = []
+        for size in options['sizes']:
+            with transaction.atomic():
+                user = seed_user("__bench_search", size)
+                start = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+                Recharge.objects.bulk_create([
+                    Recharge(user=user, data=start + datetime.timedelta(days=i), kwh=30, custo=40,
+                             odometro=100 + i, local=NEEDLE_LOCAL)
+                    for i in range(NEEDLE_ROWS)
+                ])
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute("ANALYZE core_recharge")
+                # icontains does not ignore accents, so it gets the accented term.
+                for name, method, term in (('indexed', indexed, NEEDLE_TERM), ('icontains', ilike, "são sebastião")):
+                    result = {'rows': size, 'method': name, **self.measure(user, method, term, options['repeat'])}
+                    results.append(result)
+                    self.stderr.write(
+                        f"{name:>9} {size:>8} rows: p50 {result['p50_ms']:>8} ms  "
+                        f"p95 {result['p95_ms']:>8} ms  {result['matches']} matches"
+                    )
+                transaction.set_rollback(True)
+        self.stdout.write(json.dumps(results, indent=2))
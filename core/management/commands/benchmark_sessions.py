@@ -0,0 +1,81 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.benchmarking import seed_user
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+PASSWORD = 'bench-sessions'
+
+
+def _session_queries(queries):
+    return [q['sql'] for q in queries if 'django_session' in q['sql']]
+
+
+class Command(BaseCommand):
+    help = (
+        "Log in and load the dashboard and the monthly API repeatedly under each session engine, "
+        "reporting total and django_session queries per request. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=sorted(ENGINES), default=list(ENGINES))
+        parser.add_argument('--requests', type=int, default=50, help="Requests per endpoint after login.")
+        parser.add_argument('--rows', type=int, default=1000)
+
+    def run(self, mode, user, options):
+        with override_settings(SESSION_ENGINE=ENGINES[mode]):
+            client = Client()
+            with CaptureQueriesContext(connection) as login_queries:
+                response = client.post(
+                    reverse('api_login'), json.dumps({'username': user.username, 'password': PASSWORD}),
+                    content_type='application/json',
+                )
+            assert response.status_code == 200, response.content
+
+            result = {
+                'mode': mode,
+                'login_queries': len(login_queries),
+                'login_session_queries': len(_session_queries(login_queries)),
+            }
+            for name in ('dashboard', 'api_recharges_monthly'):
+                url = reverse(name)
+                started = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(options['requests']):
+                        client.get(url)
+                elapsed = time.perf_counter() - started
+                result[name] = {
+                    'queries_per_request': round(len(queries) / options['requests'], 2),
+                    'session_queries_per_request': round(len(_session_queries(queries)) / options['requests'], 2),
+                    'mean_ms': round(elapsed / options['requests'] * 1000, 2),
+                }
+        return result
+
+    def handle(self, *args, **options):
+        results = []
+        with transaction.atomic():
+            user = seed_user("__bench_sessions", options['rows'])
+            user.set_password(PASSWORD)
+            user.save()
+            for mode in options['modes']:
+                result = self.run(mode, user, options)
+                results.append(result)
+                self.stderr.write(
+                    f"{mode:>14}: login {result['login_queries']} queries; " + ", ".join(
+                        f"{name} {result[name]['queries_per_request']} queries/request "
+                        f"({result[name]['session_queries_per_request']} session)"
+                        for name in ('dashboard', 'api_recharges_monthly')
+                    )
+                )
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,116 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import geo, kpis, pagination, rollups, search, segments, series, sync
+from core.benchmarking import seed_user
+from core.models import Recharge, MonthlyRollup, RechargeTombstone
+
+# Tables whose hot queries must never fall back to a sequential scan.
+CHECKED_TABLES = {Recharge._meta.db_table, MonthlyRollup._meta.db_table, RechargeTombstone._meta.db_table}
+
+
+def hot_queries(user):
+    """Run the hot read paths for ``user`` and return {name: [sql, ...]}."""
+    recent = datetime.datetime(2021, 6, 1, tzinfo=datetime.timezone.utc)
+    yesterday = (timezone.now() - datetime.timedelta(days=1), 0)
+    paths = {
+        'manage_recharges page': lambda: list(
+            Recharge.objects.filter(user=user).order_by('-data')[:20]
+        ),
+        'manage_recharges date range': lambda: list(
+            Recharge.objects.filter(user=user, data__gte=recent).order_by('-data')[:20]
+        ),
+        'api_recharge_list': lambda: list(
+            Recharge.objects.filter(user=user).order_by('-data').values_list('id', flat=True)
+        ),
+        'keyset deep page': lambda: pagination.paginate(
+            Recharge.objects.filter(user=user), 100,
+            after=pagination.encode_cursor(Recharge.objects.filter(user=user).order_by('data', 'id').first()),
+        ),
+        'delta sync': lambda: sync.changes(user, sync.encode_token(yesterday, yesterday), 100),
+        'dashboard kpis': lambda: kpis.aggregate_totals(Recharge.objects.filter(user=user)),
+        'rollup month refresh': lambda: rollups.refresh_month(user.id, recent.date()),
+        'time series': lambda: series.bucket_rows(
+            user, series.SeriesQuery('week', 'America/Sao_Paulo', start=recent.date()),
+        ),
+        'history local search': lambda: list(
+            search.filter_text(Recharge.objects.filter(user=user), 'local', 'eletroposto').order_by('-data')[:20]
+        ),
+        'history observacoes search': lambda: list(
+            search.filter_text(Recharge.objects.filter(user=user), 'observacoes', 'rapida').order_by('-data')[:20]
+        ),
+        'efficiency segments': lambda: segments.page(user, segments.SegmentQuery(limit=50)),
+        'map clusters': lambda: geo.clusters(user, geo.parse_bbox('-46.7,-23.6,-46.6,-23.5'), 14),
+        'monthly rollup read': lambda: list(
+            MonthlyRollup.objects.filter(user=user).order_by('mes').values('mes', 'kwh')
+        ),
+    }
+    captured = {}
+    for name, run in paths.items():
+        with CaptureQueriesContext(connection) as ctx:
+            run()
+        captured[name] = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+    return captured
+
+
+def seq_scans(plan):
+    """Yield the relation names of every Seq Scan node in a JSON plan tree."""
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan.get('Relation Name')
+    for child in plan.get('Plans', []):
+        yield from seq_scans(child)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic recharges, run EXPLAIN on the hot Recharge queries and fail "
+        "if any of them plans a sequential scan. Seeded data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help="Number of seeded users.")
+        parser.add_argument('--rows', type=int, default=500, help="Recharges per seeded user.")
+        parser.add_argument(
+            '--natural', action='store_true',
+            help="Let the planner pick freely. By default sequential scans are disabled so "
+                 "small seeds still prove an index exists for each query.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("check_query_plans requires PostgreSQL.")
+
+        failures = []
+        with transaction.atomic():
+            users = [
+                seed_user(f"__plan_check_{i}", options['rows'], seed=i)
+                for i in range(options['users'])
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE core_recharge")
+                cursor.execute("ANALYZE core_monthlyrollup")
+                cursor.execute("ANALYZE core_rechargetombstone")
+                if not options['natural']:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+                for name, statements in hot_queries(users[0]).items():
+                    for sql in statements:
+                        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+                        plan = cursor.fetchone()[0]
+                        if isinstance(plan, str):
+                            plan = json.loads(plan)
+                        bad = sorted({t for t in seq_scans(plan[0]['Plan']) if t in CHECKED_TABLES})
+                        status = self.style.ERROR("SEQ SCAN") if bad else self.style.SUCCESS("ok")
+                        self.stdout.write(f"{status}  {name}")
+                        if bad:
+                            failures.append(f"{name}: {', '.join(bad)}")
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError("Sequential scans found in hot queries:\n  " + "\n  ".join(failures))
@@ -0,0 +1,150 @@
+import http.client
+import json
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarking import latency_summary, seed_user
+
+MODES = {
+    'sync': 'capstone.wsgi:application',
+    'asgi': 'capstone.asgi:application',
+}
+DEFAULT_PATHS = ['/api/recharges/monthly/', '/api/recharges/?limit=100', '/api/settings/']
+USERNAME = '__loadtest_api'
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with gunicorn.conf.py in sync and in ASGI mode (same worker count) "
+        "and compare concurrent-request throughput and latency on the JSON API. "
+        "Seeds a temporary user with recharges in the configured database and removes it at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['sync', 'asgi'])
+        parser.add_argument('--concurrency', type=int, default=32, help="Concurrent client connections.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per mode.")
+        parser.add_argument('--rows', type=int, default=2000, help="Recharges of the load test user.")
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS, help="Request paths, used round robin.")
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        password = secrets.token_urlsafe(16)
+        User.objects.filter(username=USERNAME).delete()
+        user = seed_user(USERNAME, options['rows'])
+        user.set_password(password)
+        user.save()
+
+        results = []
+        try:
+            for mode in options['modes']:
+                result = self.run_mode(mode, password, options)
+                results.append(result)
+                self.stderr.write(
+                    f"{mode:>5}: {result['requests_per_second']:>8.1f} req/s  "
+                    f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  errors {result['errors'] or 0}"
+                )
+        finally:
+            User.objects.filter(username=USERNAME).delete()
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def start_server(self, mode, port):
+        env = dict(os.environ, GUNICORN_MODE=mode, ASYNC_API=str(mode == 'asgi'))
+        return subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', MODES[mode]],
+            cwd=Path(settings.BASE_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    def wait_ready(self, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+                conn.request('GET', '/api/settings/')
+                conn.getresponse().read()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"gunicorn did not start on port {port}")
+
+    def login(self, port, password):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.request(
+            'POST', '/api/auth/login/', json.dumps({'username': USERNAME, 'password': password}),
+            {'Content-Type': 'application/json'},
+        )
+        response = conn.getresponse()
+        response.read()
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie' and value.startswith(settings.SESSION_COOKIE_NAME + '='):
+                return value.split(';', 1)[0]
+        raise CommandError("Login failed")
+
+    def run_mode(self, mode, password, options):
+        port = options['port']
+        server = self.start_server(mode, port)
+        try:
+            self.wait_ready(port)
+            cookie = self.login(port, password)
+            latencies, errors = self.load(port, cookie, options)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        return {
+            'mode': mode,
+            'concurrency': options['concurrency'],
+            'seconds': options['duration'],
+            'requests': len(latencies),
+            'errors': errors,
+            'requests_per_second': round(len(latencies) / options['duration'], 1),
+            **latency_summary(latencies),
+        }
+
+    def load(self, port, cookie, options):
+        deadline = time.monotonic() + options['duration']
+        paths = options['paths']
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+
+        def client(offset):
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            local, failed, i = [], Counter(), offset
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers={'Cookie': cookie})
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        failed[str(response.status)] += 1
+                        continue
+                except (OSError, http.client.HTTPException) as e:
+                    failed[type(e).__name__] += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                    continue
+                local.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(local)
+                errors.update(failed)
+
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(options['concurrency'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies, dict(errors)
@@ -0,0 +1,100 @@
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/', '/register/', '/api/settings/']
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with gunicorn.conf.py, with and without GUNICORN_PRELOAD, and measure the "
+        "time from launch to the first complete response, then the first-hit latency of each path. "
+        "--max-ms makes the command fail when the median time-to-first-response exceeds it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preload', nargs='+', choices=['on', 'off'], default=['on', 'off'])
+        parser.add_argument('--runs', type=int, default=3, help="Cold starts per preload setting.")
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS,
+                            help="The first path is polled until it answers; the rest are timed afterwards.")
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--timeout', type=float, default=60.0)
+        parser.add_argument('--max-ms', type=float, help="Fail if the median time-to-first-response is higher.")
+
+    def handle(self, *args, **options):
+        results = []
+        for preload in options['preload']:
+            runs = [self.cold_start(preload == 'on', options) for _ in range(options['runs'])]
+            ttfr = statistics.median(run['first_response_ms'] for run in runs)
+            result = {
+                'preload': preload,
+                'runs': runs,
+                'median_first_response_ms': round(ttfr, 1),
+            }
+            results.append(result)
+            first_hits = ', '.join(
+                f"{path} {statistics.median(run['first_hit_ms'][path] for run in runs):.1f} ms"
+                for path in options['paths'][1:]
+            )
+            self.stderr.write(f"preload {preload:>3}: first response {ttfr:.1f} ms; first hit {first_hits}")
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+        limit = options['max_ms']
+        slow = [r for r in results if limit is not None and r['median_first_response_ms'] > limit]
+        if slow:
+            raise CommandError(
+                "Time-to-first-response above %.0f ms: %s" % (
+                    limit, ', '.join(f"preload {r['preload']} {r['median_first_response_ms']} ms" for r in slow),
+                )
+            )
+
+    def cold_start(self, preload, options):
+        port = options['port']
+        paths = options['paths']
+        env = dict(os.environ, GUNICORN_PRELOAD=str(preload))
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+             'capstone.wsgi:application'],
+            cwd=Path(settings.BASE_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.get_until_answered(port, paths[0], started + options['timeout'])
+            first_response = time.perf_counter() - started
+            first_hit = {}
+            for path in paths[1:]:
+                hit_started = time.perf_counter()
+                self.get(port, path)
+                first_hit[path] = round((time.perf_counter() - hit_started) * 1000, 1)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        return {'first_response_ms': round(first_response * 1000, 1), 'first_hit_ms': first_hit}
+
+    def get(self, port, path):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def get_until_answered(self, port, path, deadline):
+        while time.perf_counter() < deadline:
+            try:
+                self.get(port, path)
+                return
+            except (OSError, http.client.HTTPException):
+                time.sleep(0.01)
+        raise CommandError(f"gunicorn did not answer on port {port}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete recharge tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS. "
+        "Clients whose sync token is older than that get 410 and resync from scratch."
+    )
+
+    def handle(self, *args, **options):
+        count = sync.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {count} tombstones."))
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the MonthlyRollup table from scratch using the Recharge rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='users', metavar='USERNAME',
+            help="Only rebuild this user (can be repeated). Defaults to every user.",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+
+        total_users = 0
+        total_months = 0
+        for user_id, username in users.values_list('id', 'username').iterator():
+            months = rollups.rebuild_user(user_id)
+            total_users += 1
+            total_months += months
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{username}: {months} months")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total_months} monthly rollups for {total_users} users."
+        ))
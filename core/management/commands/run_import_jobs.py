@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import jobs
+from core.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Process pending CSV import jobs and resume the ones abandoned by a "
+        "restarted worker, in the foreground."
+    )
+
+    def handle(self, *args, **options):
+        job_ids = list(
+            ImportJob.objects.filter(jobs.claimable()).order_by('criado_em').values_list('pk', flat=True)
+        )
+        for job_id in job_ids:
+            jobs.run_job(job_id)
+            job = ImportJob.objects.only('status', 'criadas', 'total_linhas').get(pk=job_id)
+            self.stdout.write(f"job {job_id}: {job.status} ({job.criadas}/{job.total_linhas} rows)")
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(job_ids)} import jobs."))
@@ -0,0 +1,143 @@
+"""
+Prometheus metrics for every request: latency, response size and status per
+view, and the number and total time of the DB queries the request ran.
+Recorded by core.metrics_middleware and served as Prometheus text at
+``/metrics``.
+
+Under gunicorn each worker is a separate process, so the values live in
+prometheus_client's multiprocess store: one mmap'd file per process in
+``PROMETHEUS_MULTIPROC_DIR`` (set and cleared by gunicorn.conf.py), summed
+by whichever worker answers the scrape. Without that variable (runserver,
+tests) the process-local registry is used.
+
+Queries are counted by a wrapper installed on every database connection.
+It adds to the stats of the request running in the current context, which
+asgiref copies into the threads that run async views' ORM calls.
+"""
+import contextvars
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover - metrics are optional
+    prometheus_client = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(9))  # 256 B .. 16 MiB
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+if prometheus_client is not None:
+    REQUESTS = prometheus_client.Counter(
+        'capstone_http_requests_total', "Requests by view, method and status.", ['view', 'method', 'status'],
+    )
+    LATENCY = prometheus_client.Histogram(
+        'capstone_http_request_duration_seconds', "Time until the response was returned.", ['view'],
+        buckets=LATENCY_BUCKETS,
+    )
+    RESPONSE_SIZE = prometheus_client.Histogram(
+        'capstone_http_response_size_bytes', "Response body size as sent (after compression).", ['view'],
+        buckets=SIZE_BUCKETS,
+    )
+    DB_QUERIES = prometheus_client.Histogram(
+        'capstone_db_queries_per_request', "Database queries run by one request.", ['view'],
+        buckets=QUERY_BUCKETS,
+    )
+    DB_SECONDS = prometheus_client.Histogram(
+        'capstone_db_seconds_per_request', "Time one request spent in database queries.", ['view'],
+        buckets=LATENCY_BUCKETS,
+    )
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def start_request():
+    """Start counting queries for the current context; returns a token for ``finish_request``."""
+    return _current.set(RequestStats())
+
+
+def finish_request(token):
+    stats = _current.get()
+    _current.reset(token)
+    return stats
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def install_all():
+    """Add the query wrapper to this thread's connections (new connections get it on connect)."""
+    for connection in connections.all():
+        install(connection)
+
+
+@receiver(connection_created)
+def _on_connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+def observe(view, method, status, seconds, size, stats):
+    if prometheus_client is None:
+        return
+    REQUESTS.labels(view, method, str(status)).inc()
+    LATENCY.labels(view).observe(seconds)
+    if size is not None:
+        RESPONSE_SIZE.labels(view).observe(size)
+    if stats is not None:
+        DB_QUERIES.labels(view).observe(stats.queries)
+        DB_SECONDS.labels(view).observe(stats.db_seconds)
+
+
+def observe_size(view, size):
+    if prometheus_client is not None:
+        RESPONSE_SIZE.labels(view).observe(size)
+
+
+def exposition():
+    """Current metrics in Prometheus text format, summed over workers in multiprocess mode."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry)
+
+
+def metrics_view(request):
+    # Plain view on purpose: no login_required, so scraping never loads a session or hits the DB.
+    if prometheus_client is None:
+        return HttpResponse("prometheus_client is not installed\n", status=501, content_type='text/plain')
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(exposition(), content_type=prometheus_client.CONTENT_TYPE_LATEST)
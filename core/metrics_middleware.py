@@ -0,0 +1,82 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+UNRESOLVED = '<unresolved>'
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED
+    return match.url_name or match.view_name
+
+
+def _count_stream(chunks, view):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    metrics.observe_size(view, size)
+
+
+async def _count_async_stream(chunks, view):
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    metrics.observe_size(view, size)
+
+
+class MetricsMiddleware:
+    """
+    Records every request in core.metrics. Goes first in MIDDLEWARE so the
+    latency covers the whole stack and the size is the compressed one.
+    Streaming responses are timed until their headers are ready and their
+    size is recorded once the body has been sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics.install_all()
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = metrics.finish_request(token)
+        return self.record(request, response, time.perf_counter() - started, stats)
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats = metrics.finish_request(token)
+        return self.record(request, response, time.perf_counter() - started, stats)
+
+    def record(self, request, response, seconds, stats):
+        view = _view_name(request)
+        if view == 'metrics':
+            return response
+        size = None
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _count_async_stream(response.streaming_content, view)
+            else:
+                response.streaming_content = _count_stream(response.streaming_content, view)
+        else:
+            size = len(response.content)
+        metrics.observe(view, request.method, response.status_code, seconds, size, stats)
+        return response
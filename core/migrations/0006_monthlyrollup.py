@@ -0,0 +1,74 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:59
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum, Min, Max, Q
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    Recharge = apps.get_model('core', 'Recharge')
+    MonthlyRollup = apps.get_model('core', 'MonthlyRollup')
+
+    rows = (
+        Recharge.objects
+        .annotate(mes=TruncMonth('data', tzinfo=datetime.timezone.utc))
+        .values('user_id', 'mes')
+        .annotate(
+            recargas=Count('id'),
+            kwh_total=Sum('kwh'),
+            custo_sum=Sum('custo'),
+            custo_pagas_sum=Sum('custo', filter=Q(isento=False)),
+            odo_min=Min('odometro'),
+            odo_max=Max('odometro'),
+        )
+        .order_by('user_id', 'mes')
+    )
+    MonthlyRollup.objects.bulk_create(
+        (
+            MonthlyRollup(
+                user_id=row['user_id'],
+                mes=row['mes'].date().replace(day=1),
+                recargas=row['recargas'],
+                kwh=row['kwh_total'] or 0.0,
+                custo_total=row['custo_sum'] or 0.0,
+                custo_pagas=row['custo_pagas_sum'] or 0.0,
+                odometro_min=row['odo_min'],
+                odometro_max=row['odo_max'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recharge_latitude_longitude'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('recargas', models.IntegerField(default=0)),
+                ('kwh', models.FloatField(default=0.0)),
+                ('custo_total', models.FloatField(default=0.0)),
+                ('custo_pagas', models.FloatField(default=0.0)),
+                ('odometro_min', models.FloatField(blank=True, null=True)),
+                ('odometro_max', models.FloatField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'mes'), name='core_monthlyrollup_user_mes_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
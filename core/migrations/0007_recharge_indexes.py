@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:01
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; it avoids
+    # blocking recharge writes while the indexes are built on a large table.
+    atomic = False
+
+    dependencies = [
+        ('core', '0006_monthlyrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=models.Index(fields=['user', 'data'], include=('kwh', 'custo', 'isento', 'odometro'), name='core_recharge_user_data_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['data'], name='core_recharge_data_brin'),
+        ),
+    ]
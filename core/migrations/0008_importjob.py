@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recharge_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('modo', models.CharField(default='atomic', max_length=10)),
+                ('nome_arquivo', models.CharField(blank=True, max_length=255)),
+                ('arquivo', models.BinaryField()),
+                ('total_linhas', models.IntegerField(default=0)),
+                ('processadas', models.IntegerField(default=0)),
+                ('criadas', models.IntegerField(default=0)),
+                ('erros', models.JSONField(blank=True, default=list)),
+                ('lotes', models.JSONField(blank=True, default=list)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
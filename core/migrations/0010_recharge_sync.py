@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:21
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_dataversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RechargeTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recharge_id', models.BigIntegerField()),
+                ('apagado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'apagado_em', 'id'], name='core_tombstone_user_del_idx')],
+            },
+        ),
+        # now() is stable, so PostgreSQL fills existing rows with the migration
+        # time without rewriting the table.
+        migrations.AddField(
+            model_name='recharge',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now()),
+        ),
+    ]
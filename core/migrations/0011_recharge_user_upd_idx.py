@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:22
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_recharge_sync'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=models.Index(fields=['user', 'atualizado_em', 'id'], name='core_recharge_user_upd_idx'),
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:40
+
+from django.db import migrations, models, transaction
+
+
+# Standard geohash (base32, longitude bit first); core.geo.encode is the same
+# algorithm in Python.
+CREATE_FUNCTION = """
+CREATE OR REPLACE FUNCTION core_geohash(lat double precision, lon double precision, prec integer)
+RETURNS text LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    base32 constant text := '0123456789bcdefghjkmnpqrstuvwxyz';
+    lat_lo double precision := -90;
+    lat_hi double precision := 90;
+    lon_lo double precision := -180;
+    lon_hi double precision := 180;
+    mid double precision;
+    ch integer := 0;
+    nbits integer := 0;
+    even boolean := true;
+    result text := '';
+BEGIN
+    WHILE length(result) < prec LOOP
+        IF even THEN
+            mid := (lon_lo + lon_hi) / 2;
+            IF lon >= mid THEN ch := ch * 2 + 1; lon_lo := mid; ELSE ch := ch * 2; lon_hi := mid; END IF;
+        ELSE
+            mid := (lat_lo + lat_hi) / 2;
+            IF lat >= mid THEN ch := ch * 2 + 1; lat_lo := mid; ELSE ch := ch * 2; lat_hi := mid; END IF;
+        END IF;
+        even := NOT even;
+        nbits := nbits + 1;
+        IF nbits = 5 THEN
+            result := result || substr(base32, ch + 1, 1);
+            ch := 0;
+            nbits := 0;
+        END IF;
+    END LOOP;
+    RETURN result;
+END
+$$;
+"""
+
+
+# Keeps geohash filled on every write that sets latitude/longitude, including
+# bulk_create, queryset updates and raw SQL.
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION core_recharge_set_geohash() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.geohash := core_geohash(NEW.latitude, NEW.longitude, 9);
+    RETURN NEW;
+END
+$$;
+CREATE TRIGGER core_recharge_geohash
+    BEFORE INSERT OR UPDATE OF latitude, longitude ON core_recharge
+    FOR EACH ROW EXECUTE FUNCTION core_recharge_set_geohash();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS core_recharge_geohash ON core_recharge;
+DROP FUNCTION IF EXISTS core_recharge_set_geohash();
+"""
+
+BACKFILL_BATCH = """
+UPDATE core_recharge SET geohash = core_geohash(latitude, longitude, 9)
+WHERE id >= %s AND id < %s AND geohash IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+"""
+
+
+def backfill(connection, batch_size=5000):
+    """
+    Fill geohash for rows written before the trigger, one id range per
+    transaction so row locks are held briefly. The UPDATE does not set
+    latitude/longitude, so the trigger does not fire and atualizado_em is
+    left alone (no delta sync churn).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT min(id), max(id) FROM core_recharge")
+        first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+    for start in range(first_id, last_id + 1, batch_size):
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(BACKFILL_BATCH, [start, start + batch_size])
+
+
+def backfill_geohash(apps, schema_editor):
+    backfill(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    # Every step runs in its own short transaction: adding a nullable column
+    # and creating the trigger only hold their table locks for a catalog
+    # update, and the backfill commits batch by batch while the app keeps
+    # writing. Rows written meanwhile get their geohash from the trigger.
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_recharge_user_upd_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_FUNCTION,
+            reverse_sql="DROP FUNCTION IF EXISTS core_geohash(double precision, double precision, integer);",
+        ),
+        migrations.AddField(
+            model_name='recharge',
+            name='geohash',
+            field=models.CharField(blank=True, db_collation='C', editable=False, max_length=9, null=True),
+        ),
+        migrations.RunSQL(sql=CREATE_TRIGGER, reverse_sql=DROP_TRIGGER),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0012_recharge_geohash'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=models.Index(
+                fields=['user', 'geohash'],
+                include=['latitude', 'longitude', 'kwh', 'custo'],
+                name='core_recharge_user_geo_idx',
+            ),
+        ),
+    ]
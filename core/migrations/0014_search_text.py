@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:05
+
+from django.contrib.postgres.operations import BtreeGinExtension, TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+
+# unaccent() is only STABLE (it looks its dictionary up through search_path),
+# so it cannot appear in an index. The wrapper pins the dictionary and the
+# search_path and is declared IMMUTABLE; core.search.SearchText calls it.
+CREATE_FUNCTION = """
+CREATE OR REPLACE FUNCTION core_search_text(value text)
+RETURNS text LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+SET search_path = public, extensions, pg_catalog AS $$
+    SELECT lower(unaccent('unaccent'::regdictionary, value))
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recharge_user_geo_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        # Only used by the (user, text) search indexes of 0015, which 0019
+        # replaces with text-only ones.
+        BtreeGinExtension(),
+        migrations.RunSQL(
+            sql=CREATE_FUNCTION,
+            reverse_sql="DROP FUNCTION IF EXISTS core_search_text(text);",
+        ),
+    ]
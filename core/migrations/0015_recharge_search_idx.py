@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:05
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_search_text'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=django.contrib.postgres.indexes.GinIndex(
+                models.F('user'),
+                django.contrib.postgres.indexes.OpClass(
+                    models.Func(models.F('local'), function='core_search_text'), name='gin_trgm_ops'
+                ),
+                name='core_recharge_local_trgm',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=django.contrib.postgres.indexes.GinIndex(
+                models.F('user'),
+                django.contrib.postgres.indexes.OpClass(
+                    models.Func(models.F('observacoes'), function='core_search_text'), name='gin_trgm_ops'
+                ),
+                name='core_recharge_obs_trgm',
+            ),
+        ),
+    ]
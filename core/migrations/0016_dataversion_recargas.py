@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+# Rollups are exact per month, so their sum is each user's recharge count.
+BACKFILL = """
+INSERT INTO core_dataversion (user_id, versao, atualizado_em, recargas)
+SELECT user_id, 0, now(), sum(recargas) FROM core_monthlyrollup GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET recargas = EXCLUDED.recargas;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recharge_search_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataversion',
+            name='recargas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(sql=BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0016_dataversion_recargas'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='monthlyrollup',
+            index=models.Index(fields=['mes'], name='core_monthlyrollup_mes_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 23:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_monthlyrollup_mes_idx'),
+    ]
+
+    # Both columns are added without a table rewrite: a nullable column and a
+    # constant default are catalog-only changes in Postgres.
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='token_execucao',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='recharge',
+            name='importacao',
+            field=models.ForeignKey(
+                blank=True, db_constraint=False, db_index=False, editable=False, null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.importjob',
+            ),
+        ),
+    ]
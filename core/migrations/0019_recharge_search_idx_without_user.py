@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-19 09:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # The (user, text) GIN indexes of 0015 also served plain user_id = N
+    # predicates and displaced the btree plans of sync, KPIs and lists.
+    # Search falls back to the user btree indexes between the two steps.
+    atomic = False
+
+    dependencies = [
+        ('core', '0018_import_job_ownership'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(model_name='recharge', name='core_recharge_local_trgm'),
+        RemoveIndexConcurrently(model_name='recharge', name='core_recharge_obs_trgm'),
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    models.Func(models.F('local'), function='core_search_text'), name='gin_trgm_ops'
+                ),
+                name='core_recharge_local_trgm',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='recharge',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    models.Func(models.F('observacoes'), function='core_search_text'), name='gin_trgm_ops'
+                ),
+                name='core_recharge_obs_trgm',
+            ),
+        ),
+    ]
@@ -1,5 +1,12 @@
 from django.db import models
+from django.db.models import F, Func
+from django.db.models.functions import Now
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, OpClass
+
+# Length of Recharge.geohash: ~5 m cells, finer than any map zoom needs.
+GEOHASH_PRECISION = 9
 
 class Recharge(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -12,6 +19,57 @@ class Recharge(models.Model):
     local = models.CharField(max_length=100, blank=True, null=True)
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+    # Grid cell of (latitude, longitude) for the map clusters (core.geo). A
+    # Postgres trigger sets it on every write (migration 0012); the "C"
+    # collation makes prefix ranges index scans.
+    geohash = models.CharField(
+        max_length=GEOHASH_PRECISION, null=True, blank=True, editable=False, db_collation='C',
+    )
+    # db_default covers rows inserted with raw SQL.
+    atualizado_em = models.DateTimeField(auto_now=True, db_default=Now())
+    # Background import that inserted the row, so a failed all-or-nothing job
+    # deletes only its own rows (core.jobs). Only read together with the job's
+    # id ranges, hence no index and no constraint.
+    importacao = models.ForeignKey(
+        'ImportJob', null=True, blank=True, editable=False, related_name='+',
+        on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+    )
+
+    class Meta:
+        indexes = [
+            # Every hot query filters by user and orders/ranges by data. The
+            # included columns let the KPI and rollup aggregates run as
+            # index-only scans.
+            models.Index(
+                fields=['user', 'data'],
+                include=['kwh', 'custo', 'isento', 'odometro'],
+                name='core_recharge_user_data_idx',
+            ),
+            # Rows are mostly appended in date order: a tiny BRIN index covers
+            # cross-user date ranges (admin date_hierarchy, reports).
+            BrinIndex(fields=['data'], name='core_recharge_data_brin'),
+            # Delta sync (core.sync) walks a user's changes in (atualizado_em, id) order.
+            models.Index(fields=['user', 'atualizado_em', 'id'], name='core_recharge_user_upd_idx'),
+            # Map bounding boxes are geohash prefix ranges; the included columns
+            # let the cluster aggregates run as index-only scans.
+            models.Index(
+                fields=['user', 'geohash'],
+                include=['latitude', 'longitude', 'kwh', 'custo'],
+                name='core_recharge_user_geo_idx',
+            ),
+            # History page and admin text search (core.search): LIKE '%term%'
+            # on the unaccented, lowercased text is a trigram lookup. The user
+            # filter stays on the btree indexes above; a leading user column
+            # here would let plain user_id = N queries pick these indexes.
+            GinIndex(
+                OpClass(Func(F('local'), function='core_search_text'), name='gin_trgm_ops'),
+                name='core_recharge_local_trgm',
+            ),
+            GinIndex(
+                OpClass(Func(F('observacoes'), function='core_search_text'), name='gin_trgm_ops'),
+                name='core_recharge_obs_trgm',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.data}"
@@ -33,3 +91,86 @@ class ContactLog(models.Model):
 
     def __str__(self):
         return f"{self.email} - {self.status}"
+
+class MonthlyRollup(models.Model):
+    """Per-user monthly aggregate of Recharge rows, kept in sync by core.rollups."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    mes = models.DateField()
+    recargas = models.IntegerField(default=0)
+    kwh = models.FloatField(default=0.0)
+    custo_total = models.FloatField(default=0.0)
+    custo_pagas = models.FloatField(default=0.0)
+    odometro_min = models.FloatField(blank=True, null=True)
+    odometro_max = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'mes'], name='core_monthlyrollup_user_mes_uniq'),
+        ]
+        indexes = [
+            # First/last month across all users bounds the admin date hierarchy.
+            models.Index(fields=['mes'], name='core_monthlyrollup_mes_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.mes:%Y-%m}"
+
+class ImportJob(models.Model):
+    """A CSV upload processed in the background by core.jobs."""
+    PENDENTE = 'pendente'
+    PROCESSANDO = 'processando'
+    CONCLUIDO = 'concluido'
+    FALHOU = 'falhou'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (PROCESSANDO, 'Processando'),
+        (CONCLUIDO, 'Concluído'),
+        (FALHOU, 'Falhou'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+    modo = models.CharField(max_length=10, default='atomic')
+    nome_arquivo = models.CharField(max_length=255, blank=True)
+    arquivo = models.BinaryField()
+    total_linhas = models.IntegerField(default=0)
+    # Rows of the parsed file already committed; a restarted job resumes here.
+    processadas = models.IntegerField(default=0)
+    criadas = models.IntegerField(default=0)
+    erros = models.JSONField(default=list, blank=True)
+    # [first_id, last_id] of every committed batch, to undo a failed all-or-nothing job.
+    lotes = models.JSONField(default=list, blank=True)
+    # Set by each claim; a worker whose lease expired and was claimed again
+    # sees a different token and stops before committing another batch.
+    token_execucao = models.CharField(max_length=32, blank=True, editable=False)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.nome_arquivo} ({self.status})"
+
+class DataVersion(models.Model):
+    """Per-user stamp bumped on every Recharge/Settings write (see core.versions)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    versao = models.PositiveBigIntegerField(default=0)
+    atualizado_em = models.DateTimeField()
+    # The user's number of recharges, set with each rollup refresh (core.rollups),
+    # so the admin lists counts without touching core_recharge.
+    recargas = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} v{self.versao}"
+
+class RechargeTombstone(models.Model):
+    """Marks a deleted Recharge so delta sync clients can drop it (see core.sync)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    recharge_id = models.BigIntegerField()
+    apagado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'apagado_em', 'id'], name='core_tombstone_user_del_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.recharge_id} ({self.apagado_em})"
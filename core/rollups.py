@@ -0,0 +1,168 @@
+"""
+Maintenance of the per-user MonthlyRollup table.
+
+Months are bucketed in UTC, matching the historical ``strftime("%Y-%m")``
+grouping of ``api_recharges_monthly``. A refresh recomputes only the touched
+(user, month) buckets from their Recharge rows, so edits and deletes (which
+can move min/max odometer) stay exact without scanning the whole history.
+Every refresh also bumps the user's data version (core.versions) and stores
+their recharge count, the sum of their rollups, next to it.
+"""
+import datetime
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, Sum, Min, Max, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import versions
+from .models import Recharge, MonthlyRollup
+
+_local = threading.local()
+
+
+def month_of(value):
+    """Return the first day (date) of the UTC month containing ``value``."""
+    if isinstance(value, str):
+        value = Recharge._meta.get_field('data').to_python(value)
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        value = value.astimezone(datetime.timezone.utc)
+    return datetime.date(value.year, value.month, 1)
+
+
+def _month_bounds(mes):
+    start = datetime.datetime(mes.year, mes.month, 1, tzinfo=datetime.timezone.utc)
+    if mes.month == 12:
+        end = start.replace(year=mes.year + 1, month=1)
+    else:
+        end = start.replace(month=mes.month + 1)
+    return start, end
+
+
+def bucket_aggregates():
+    """Aggregates of one bucket of recharges, for ``.values(bucket).annotate(**...)``."""
+    return {
+        'recargas': Count('id'),
+        'kwh_total': Sum('kwh'),
+        'custo_sum': Sum('custo'),
+        'custo_pagas_sum': Sum('custo', filter=Q(isento=False)),
+        'odo_min': Min('odometro'),
+        'odo_max': Max('odometro'),
+    }
+
+
+def bucket_values(agg):
+    """Map a ``bucket_aggregates`` row to the MonthlyRollup field names, empty sums as 0."""
+    return {
+        'recargas': agg['recargas'],
+        'kwh': agg['kwh_total'] or 0.0,
+        'custo_total': agg['custo_sum'] or 0.0,
+        'custo_pagas': agg['custo_pagas_sum'] or 0.0,
+        'odometro_min': agg['odo_min'],
+        'odometro_max': agg['odo_max'],
+    }
+
+
+def refresh_months(user_id, months):
+    """
+    Recompute the given (user, month) buckets with one grouped query, upserting
+    non-empty months and deleting the ones left without recharges.
+    """
+    months = sorted(set(months))
+    if not months:
+        return
+    start, _end = _month_bounds(months[0])
+    _start, end = _month_bounds(months[-1])
+
+    rows = (
+        Recharge.objects.filter(user_id=user_id, data__gte=start, data__lt=end)
+        .annotate(mes=TruncMonth('data', tzinfo=datetime.timezone.utc))
+        .values('mes')
+        .annotate(**bucket_aggregates())
+        .order_by()
+    )
+    found = {}
+    for row in rows:
+        mes = month_of(row['mes'])
+        if mes in months:
+            found[mes] = MonthlyRollup(user_id=user_id, mes=mes, **bucket_values(row))
+
+    if found:
+        MonthlyRollup.objects.bulk_create(
+            found.values(),
+            update_conflicts=True,
+            unique_fields=['user', 'mes'],
+            update_fields=['recargas', 'kwh', 'custo_total', 'custo_pagas', 'odometro_min', 'odometro_max'],
+        )
+    empty = [mes for mes in months if mes not in found]
+    if empty:
+        MonthlyRollup.objects.filter(user_id=user_id, mes__in=empty).delete()
+    total = MonthlyRollup.objects.filter(user_id=user_id).aggregate(total=Sum('recargas'))['total']
+    versions.bump(user_id, recargas=total or 0)
+
+
+def refresh_month(user_id, mes):
+    """Recompute one (user, month) bucket, deleting it when the month is empty."""
+    refresh_months(user_id, [mes])
+
+
+def mark_dirty(user_id, mes):
+    """Refresh a bucket now, or later if inside a ``deferred()`` block."""
+    if mes is None:
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.add((user_id, mes))
+    else:
+        refresh_month(user_id, mes)
+
+
+@contextmanager
+def deferred():
+    """
+    Collect dirty buckets during mass writes (bulk import, delete all) and
+    refresh each affected month once on exit instead of once per row.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        # Nested block: the outermost one does the refresh.
+        yield
+        return
+
+    _local.pending = set()
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+
+    by_user = {}
+    for user_id, mes in pending:
+        by_user.setdefault(user_id, set()).add(mes)
+    for user_id, months in sorted(by_user.items()):
+        refresh_months(user_id, months)
+
+
+def rebuild_user(user_id):
+    """Drop and rebuild every rollup of one user with a single grouped query."""
+    rows = (
+        Recharge.objects.filter(user_id=user_id)
+        .annotate(mes=TruncMonth('data', tzinfo=datetime.timezone.utc))
+        .values('mes')
+        .annotate(**bucket_aggregates())
+        .order_by('mes')
+    )
+    rollups = [
+        MonthlyRollup(user_id=user_id, mes=month_of(row['mes']), **bucket_values(row))
+        for row in rows
+    ]
+    with transaction.atomic():
+        MonthlyRollup.objects.filter(user_id=user_id).delete()
+        MonthlyRollup.objects.bulk_create(rollups)
+        versions.bump(user_id, recargas=sum(rollup.recargas for rollup in rollups))
+    return len(rollups)
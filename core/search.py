@@ -0,0 +1,36 @@
+"""
+Indexed text search over ``Recharge.local`` and ``Recharge.observacoes``.
+
+``icontains`` becomes ``UPPER(col) LIKE UPPER('%term%')``, which no index can
+serve. On PostgreSQL both sides of the match go through ``core_search_text``
+(``lower(unaccent(...))``, migration 0014) and ``core_search_text(col)``
+trigram GIN indexes (migration 0019) answer the ``LIKE '%term%'`` from the
+index; the user filter is combined from the btree indexes. Matching is case-
+and accent-insensitive, so "sao jose" finds "São José".
+
+Other databases fall back to ``icontains`` (case-insensitive only).
+"""
+from django.db import connection
+from django.db.models import F, Func, Q, TextField, Value
+from django.db.models.lookups import Contains
+
+SEARCH_FIELDS = ('local', 'observacoes')
+
+
+class SearchText(Func):
+    """``core_search_text(expr)``: the normalised form both the indexes and the terms use."""
+    function = 'core_search_text'
+    output_field = TextField()
+
+
+def matches(field, term):
+    """Filter for rows whose ``field`` contains ``term``, usable with ``filter()`` and ``Q``."""
+    if connection.vendor != 'postgresql':
+        return Q(**{f'{field}__icontains': term})
+    # The term is normalised in SQL too, so Python never has to mirror unaccent's rules.
+    return Q(Contains(SearchText(F(field)), SearchText(Value(term))))
+
+
+def filter_text(queryset, field, term):
+    term = term.strip()
+    return queryset.filter(matches(field, term)) if term else queryset
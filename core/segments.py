@@ -0,0 +1,125 @@
+"""
+Per-recharge efficiency for ``/api/recharges/segments/``.
+
+A segment is the driving between one recharge and the previous one: its km
+is the odometer difference, from which kWh/100 km, cost/km and the saving
+over a gasoline car follow. The previous odometer is a window function in
+the page query itself. ``LAG`` over ``(data, id)`` is written as ``LEAD``
+over the newest-first order the pages are read in, so Postgres walks the
+``(user, data)`` index backwards, computes the window as rows stream by and
+stops at the LIMIT: a page costs ``limit + 1`` index entries whatever the
+history size.
+
+Pages are keyset-paginated like the recharge list (core.pagination). The
+end of the date range and the cursor filter the query; the start is applied
+to the fetched rows, so the oldest recharge in range still sees the one
+before it.
+"""
+import datetime
+import zoneinfo
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import Lead
+
+from . import kpis, pagination
+from .models import Recharge
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+SEGMENT_FIELDS = ('id', 'data', 'odometro', 'kwh', 'custo', 'isento', 'local')
+
+
+@dataclass(frozen=True)
+class SegmentQuery:
+    limit: int = DEFAULT_LIMIT
+    cursor: str = None
+    start: datetime.datetime = None
+    end: datetime.datetime = None
+
+
+def parse(params):
+    """Validate ``limit``, ``cursor``, ``start``, ``end`` and ``tz`` into a ``SegmentQuery``; raises ValueError."""
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+
+    cursor = params.get('cursor') or None
+    if cursor:
+        pagination.decode_cursor(cursor)
+
+    time_zone = params.get('tz') or settings.SERIES_DEFAULT_TIME_ZONE
+    try:
+        zone = zoneinfo.ZoneInfo(time_zone)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {time_zone}")
+
+    # start and end are whole local days; end is inclusive.
+    bounds = {}
+    for name, shift in (('start', 0), ('end', 1)):
+        value = params.get(name)
+        if value:
+            try:
+                day = datetime.date.fromisoformat(value) + datetime.timedelta(days=shift)
+            except ValueError:
+                raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+            bounds[name] = datetime.datetime.combine(day, datetime.time(), tzinfo=zone)
+    query = SegmentQuery(limit, cursor, **bounds)
+    if query.start and query.end and query.end <= query.start:
+        raise ValueError("end must not be before start")
+    return query
+
+
+def _segment(row, config):
+    km = row['odometro'] - row['odometro_anterior'] if row['odometro_anterior'] is not None else None
+    # The first recharge, or an odometer that went backwards, describes no driving.
+    if km is not None and km <= 0:
+        km = None
+    if km is not None and kpis.has_gas_config(config):
+        economia = round(km / config.consumo_km_l * config.preco_gasolina - row['custo'], 2)
+    else:
+        economia = None
+    return {
+        "id": row['id'],
+        "data": row['data'].isoformat(),
+        "odometro": row['odometro'],
+        "kwh": row['kwh'],
+        "custo": row['custo'],
+        "isento": row['isento'],
+        "local": row['local'],
+        "km": round(km, 2) if km is not None else None,
+        "consumo_por_100km": round(row['kwh'] / km * 100, 2) if km else None,
+        "custo_por_km": round(row['custo'] / km, 4) if km else None,
+        "economia": economia,
+    }
+
+
+def page(user, query, config=None):
+    """One page of segments, newest first, with the cursor of the next page."""
+    recharges = Recharge.objects.filter(user=user)
+    if query.end:
+        recharges = recharges.filter(data__lt=query.end)
+    if query.cursor:
+        data, pk = pagination.decode_cursor(query.cursor)
+        recharges = recharges.filter(data__lte=data).filter(Q(data__lt=data) | Q(data=data, id__lt=pk))
+
+    newest_first = [F('data').desc(), F('id').desc()]
+    rows = list(
+        recharges
+        .annotate(odometro_anterior=Window(Lead('odometro'), order_by=newest_first))
+        .order_by(*newest_first)
+        .values(*SEGMENT_FIELDS, 'odometro_anterior')[:query.limit + 1]
+    )
+    if query.start:
+        rows = [row for row in rows if row['data'] >= query.start]
+
+    has_more = len(rows) > query.limit
+    rows = rows[:query.limit]
+    return {
+        "results": [_segment(row, config) for row in rows],
+        "next_cursor": pagination.encode_cursor(rows[-1]) if has_more else None,
+        "limit": query.limit,
+    }
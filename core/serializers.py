@@ -0,0 +1,71 @@
+"""
+Recharge list serialization for the API: field projection and layouts.
+
+``fields=`` is pushed down to ``.values()``, so only the requested columns
+are read. The ``objects`` layout is the historical array of dicts; the
+``columnar`` layout sends each field name once with an array of values, e.g.
+``{"data": [...], "kwh": [...]}``, which is much smaller for long lists.
+"""
+RECHARGE_FIELDS = [
+    'id', 'data', 'kwh', 'custo', 'isento', 'odometro', 'observacoes',
+    'local', 'latitude', 'longitude', 'atualizado_em',
+]
+DATETIME_FIELDS = {'data', 'atualizado_em'}
+# Keyset cursors are built from (data, id), so they are always read.
+CURSOR_FIELDS = ['id', 'data']
+FORMATS = ('objects', 'columnar')
+
+
+def parse_fields(value):
+    """
+    Return the requested field list (``id`` first) from a comma separated
+    ``fields`` parameter, or every field when empty. Raises ValueError.
+    """
+    if not value:
+        return list(RECHARGE_FIELDS)
+    requested = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in RECHARGE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return [f for f in RECHARGE_FIELDS if f == 'id' or f in requested]
+
+
+def parse_format(value):
+    value = value or 'objects'
+    if value not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    return value
+
+
+def project(queryset, fields):
+    """``queryset`` as dicts holding only ``fields`` (plus the cursor columns)."""
+    columns = list(fields) + [f for f in CURSOR_FIELDS if f not in fields]
+    return queryset.values(*columns)
+
+
+def _column(rows, name):
+    if name in DATETIME_FIELDS:
+        return [row[name].isoformat() for row in rows]
+    return [row[name] for row in rows]
+
+
+def as_objects(rows, fields):
+    dates = [f for f in fields if f in DATETIME_FIELDS]
+    result = []
+    for row in rows:
+        item = {f: row[f] for f in fields}
+        for f in dates:
+            item[f] = item[f].isoformat()
+        result.append(item)
+    return result
+
+
+def as_columns(rows, fields):
+    return {f: _column(rows, f) for f in fields}
+
+
+def render(rows, fields, fmt):
+    """Serialize ``project()`` rows in layout ``fmt``."""
+    if fmt == 'columnar':
+        return as_columns(rows, fields)
+    return as_objects(rows, fields)
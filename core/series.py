@@ -0,0 +1,99 @@
+"""
+Recharge time series for ``/api/recharges/series/``: day, week, month or
+year buckets in the caller's time zone.
+
+Each bucket's totals and odometer range come from one grouped query with
+``Trunc(..., tzinfo=...)``. Postgres reads the rows of the range from the
+covering ``(user, data)`` index and returns one row per bucket, so Python
+work and payload size grow with the number of buckets, not with the
+history. Responses are cached per data version (core.kpi_cache).
+"""
+import datetime
+import zoneinfo
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models.functions import Trunc
+
+from . import kpis, rollups
+from .models import Recharge
+
+GRANULARITIES = {
+    # Trunc kind -> bucket label; weeks start on Monday and are labelled by that day.
+    'day': "%Y-%m-%d",
+    'week': "%Y-%m-%d",
+    'month': "%Y-%m",
+    'year': "%Y",
+}
+
+
+@dataclass(frozen=True)
+class SeriesQuery:
+    granularity: str
+    time_zone: str
+    start: datetime.date = None
+    end: datetime.date = None
+
+    @property
+    def cache_name(self):
+        return f"series:{self.granularity}:{self.time_zone}:{self.start}:{self.end}"
+
+
+def parse(params):
+    """Validate the query string into a ``SeriesQuery``; raises ValueError."""
+    granularity = params.get('granularity') or 'month'
+    if granularity not in GRANULARITIES:
+        raise ValueError("granularity must be one of: " + ", ".join(GRANULARITIES))
+
+    time_zone = params.get('tz') or settings.SERIES_DEFAULT_TIME_ZONE
+    try:
+        zoneinfo.ZoneInfo(time_zone)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {time_zone}")
+
+    dates = {}
+    for name in ('start', 'end'):
+        value = params.get(name)
+        if value:
+            try:
+                dates[name] = datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+    query = SeriesQuery(granularity, time_zone, **dates)
+    if query.start and query.end and query.end < query.start:
+        raise ValueError("end must not be before start")
+    return query
+
+
+def _local_midnight(day, zone):
+    return datetime.datetime.combine(day, datetime.time(), tzinfo=zone)
+
+
+def bucket_rows(user, query):
+    """One dict per non-empty bucket, in order, with the MonthlyRollup field names plus ``periodo``."""
+    zone = zoneinfo.ZoneInfo(query.time_zone)
+    recharges = Recharge.objects.filter(user=user)
+    # start and end are whole local days; end is inclusive.
+    if query.start:
+        recharges = recharges.filter(data__gte=_local_midnight(query.start, zone))
+    if query.end:
+        recharges = recharges.filter(data__lt=_local_midnight(query.end + datetime.timedelta(days=1), zone))
+
+    rows = (
+        recharges
+        .annotate(periodo=Trunc('data', query.granularity, tzinfo=zone))
+        .values('periodo')
+        .annotate(**rollups.bucket_aggregates())
+        .order_by('periodo')
+    )
+    return [{'periodo': row['periodo'], **rollups.bucket_values(row)} for row in rows]
+
+
+def build(user, config, query):
+    return {
+        "granularity": query.granularity,
+        "time_zone": query.time_zone,
+        "start": query.start.isoformat() if query.start else None,
+        "end": query.end.isoformat() if query.end else None,
+        **kpis.bucket_series(bucket_rows(user, query), config, 'periodo', GRANULARITIES[query.granularity]),
+    }
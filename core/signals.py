@@ -0,0 +1,56 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import rollups, sync, versions
+from .models import Recharge, Settings
+
+
+def _deleting_user(origin):
+    # Deleting the user cascades to its rollups, version and tombstones as well.
+    return isinstance(origin, User) or (isinstance(origin, QuerySet) and origin.model is User)
+
+
+@receiver(pre_save, sender=Recharge)
+def remember_previous_month(sender, instance, raw=False, **kwargs):
+    # An edit may move the recharge to another month (or user): keep the old bucket.
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    previous = Recharge.objects.filter(pk=instance.pk).values('user_id', 'data').first()
+    if previous:
+        instance._rollup_previous = (previous['user_id'], rollups.month_of(previous['data']))
+
+
+@receiver(post_save, sender=Recharge)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = (instance.user_id, rollups.month_of(instance.data))
+    previous = getattr(instance, '_rollup_previous', None)
+    rollups.mark_dirty(*current)
+    if previous and previous != current:
+        rollups.mark_dirty(*previous)
+
+
+@receiver(post_delete, sender=Recharge)
+def update_rollup_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    rollups.mark_dirty(instance.user_id, rollups.month_of(instance.data))
+
+
+@receiver(post_delete, sender=Recharge)
+def record_tombstone_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    sync.record_delete(instance.user_id, instance.pk)
+
+
+@receiver(post_save, sender=Settings)
+@receiver(post_delete, sender=Settings)
+def bump_version_on_settings_change(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _deleting_user(origin):
+        return
+    versions.bump(instance.user_id)
@@ -0,0 +1,167 @@
+"""
+Delta sync for the mobile API (``/api/recharges/changes/``).
+
+Clients keep an opaque token holding two keyset positions: one over the
+user's recharges in (atualizado_em, id) order and one over their delete
+tombstones in (apagado_em, id) order. Each call reads only the rows past
+those positions through the (user, atualizado_em, id) and (user, apagado_em,
+id) indexes, so its cost follows the amount of change, not the history size.
+
+A write is stamped when it is saved but becomes visible when its transaction
+commits. The token therefore never advances past ``SYNC_SETTLE_SECONDS``
+ago: rows newer than that are still returned, and returned again on the next
+call (upserts and deletes are idempotent), so a slow commit is never skipped.
+Transactions that can run longer than that (a synchronous CSV import) call
+``restamp_on_commit`` so their rows are stamped again once they are visible.
+"""
+import base64
+import datetime
+import json
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Recharge, RechargeTombstone
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+_local = threading.local()
+
+
+class TokenExpired(Exception):
+    """The token predates the tombstone retention window: a full resync is needed."""
+
+
+def encode_token(upserts_key, deletes_key):
+    raw = json.dumps({
+        'u': [upserts_key[0].isoformat(), upserts_key[1]] if upserts_key else None,
+        'd': [deletes_key[0].isoformat(), deletes_key[1]],
+    })
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return (upserts_key, deletes_key); raise ValueError if malformed."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        keys = []
+        for name in ('u', 'd'):
+            value = raw[name]
+            keys.append((datetime.datetime.fromisoformat(value[0]), int(value[1])) if value else None)
+    except (ValueError, TypeError, KeyError, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid sync token: {token!r}") from e
+    if keys[1] is None:
+        raise ValueError(f"Invalid sync token: {token!r}")
+    return tuple(keys)
+
+
+def _page(queryset, field, key, limit, horizon):
+    """
+    Read up to ``limit`` rows after ``key`` and return (rows, new_key, has_more).
+    The key only moves over rows stamped at or before ``horizon``.
+    """
+    if key is not None:
+        stamp, pk = key
+        queryset = queryset.filter(**{f'{field}__gte': stamp}).filter(
+            Q(**{f'{field}__gt': stamp}) | Q(**{field: stamp, 'id__gt': pk})
+        )
+    rows = list(queryset.order_by(field, 'id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    settled = [row for row in rows if getattr(row, field) <= horizon]
+    if settled:
+        key = (getattr(settled[-1], field), settled[-1].id)
+    if not has_more:
+        # Caught up: nothing settled remains past the horizon.
+        key = max(key, (horizon, 0)) if key else (horizon, 0)
+    elif not settled:
+        # A full page of rows still settling; stop until they are.
+        has_more = False
+    return rows, key, has_more
+
+
+def changes(user, token=None, limit=DEFAULT_LIMIT):
+    """
+    Return the recharges upserted and deleted for ``user`` since ``token``
+    (everything on the first sync) as a dict with ``upserts`` (Recharge
+    objects), ``deletes`` (ids), ``next`` and ``has_more``.
+    """
+    now = timezone.now()
+    horizon = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    if token:
+        upserts_key, deletes_key = decode_token(token)
+        retention = timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        if deletes_key[0] < now - retention:
+            raise TokenExpired("Sync token is older than the tombstone retention; resync from scratch")
+    else:
+        # A client starting from scratch has nothing to delete.
+        upserts_key, deletes_key = None, (horizon, 0)
+
+    upserts, upserts_key, more_upserts = _page(
+        Recharge.objects.filter(user=user), 'atualizado_em', upserts_key, limit, horizon
+    )
+    deletes, deletes_key, more_deletes = _page(
+        RechargeTombstone.objects.filter(user=user), 'apagado_em', deletes_key, limit, horizon
+    )
+    return {
+        'upserts': upserts,
+        'deletes': [t.recharge_id for t in deletes],
+        'next': encode_token(upserts_key, deletes_key),
+        'has_more': more_upserts or more_deletes,
+    }
+
+
+def restamp_on_commit(user_id, id_ranges):
+    """
+    After the current transaction commits, set ``atualizado_em`` to now on
+    the user's recharges in each (first_id, last_id) range, one short
+    transaction per range. Rows stamped when the long transaction wrote them
+    may be older than a token handed out before it committed; restamped,
+    they are past every such token. Other rows of the user in a range are
+    just sent again.
+    """
+    def restamp():
+        for first_id, last_id in id_ranges:
+            Recharge.objects.filter(user_id=user_id, pk__range=(first_id, last_id)).update(
+                atualizado_em=timezone.now()
+            )
+    transaction.on_commit(restamp)
+
+
+def record_delete(user_id, recharge_id):
+    """Write a tombstone now, or on exit if inside a ``deferred()`` block."""
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.append(RechargeTombstone(user_id=user_id, recharge_id=recharge_id))
+    else:
+        RechargeTombstone.objects.create(user_id=user_id, recharge_id=recharge_id)
+
+
+@contextmanager
+def deferred():
+    """Collect the tombstones of a mass delete and insert them in one statement."""
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+
+    _local.pending = []
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+    RechargeTombstone.objects.bulk_create(pending, batch_size=5000)
+
+
+def prune_tombstones(now=None):
+    """Delete tombstones older than the retention window; return how many."""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    count, _deleted = RechargeTombstone.objects.filter(apagado_em__lt=cutoff).delete()
+    return count
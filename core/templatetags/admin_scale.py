@@ -0,0 +1,100 @@
+"""
+Date hierarchy for the Recharge changelist that never scans core_recharge.
+
+Django's ``date_hierarchy`` tag runs ``MIN``/``MAX`` and ``DISTINCT
+date_trunc(...)`` over the filtered queryset at every level. Here the first
+and last month come from MonthlyRollup (the ``mes`` index, or the
+``(user, mes)`` constraint when a user is selected), and the years, months
+and days offered are every one inside those bounds. A link may lead to an
+empty period; the filter it applies is the same ``data`` range Django uses.
+"""
+import calendar
+import datetime
+
+from django import template
+from django.contrib.admin.utils import get_last_value_from_parameters
+from django.db.models import Max, Min
+from django.utils import formats
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from core.admin import UserAutocompleteFilter
+from core.models import MonthlyRollup
+
+register = template.Library()
+
+
+def month_bounds(user_id=None):
+    """(first, last) month with recharges, as dates, or (None, None)."""
+    rollups = MonthlyRollup.objects.all()
+    if user_id is not None:
+        rollups = rollups.filter(user_id=user_id)
+    bounds = rollups.aggregate(first=Min('mes'), last=Max('mes'))
+    return bounds['first'], bounds['last']
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def bounded_date_hierarchy(cl):
+    field_name = cl.date_hierarchy
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    year = get_last_value_from_parameters(cl.params, year_field)
+    month = get_last_value_from_parameters(cl.params, month_field)
+    day = get_last_value_from_parameters(cl.params, day_field)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+
+    if year and month and day:
+        date = datetime.date(int(year), int(month), int(day))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year, month_field: month}),
+                'title': capfirst(formats.date_format(date, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(date, 'MONTH_DAY_FORMAT'))}],
+        }
+
+    first, last = month_bounds(get_last_value_from_parameters(cl.params, UserAutocompleteFilter.parameter_name))
+    if first is None:
+        return {'show': False}
+
+    if year and month:
+        days = calendar.monthrange(int(year), int(month))[1]
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year}), 'title': str(year)},
+            'choices': [
+                {
+                    'link': link({year_field: year, month_field: month, day_field: d}),
+                    'title': capfirst(formats.date_format(datetime.date(int(year), int(month), d), 'MONTH_DAY_FORMAT')),
+                }
+                for d in range(1, days + 1)
+            ],
+        }
+    if year:
+        months = [
+            datetime.date(int(year), m, 1) for m in range(1, 13)
+            if (first.year, first.month) <= (int(year), m) <= (last.year, last.month)
+        ]
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year, month_field: m.month}),
+                    'title': capfirst(formats.date_format(m, 'YEAR_MONTH_FORMAT')),
+                }
+                for m in months
+            ],
+        }
+    return {
+        'show': True,
+        'back': None,
+        'choices': [
+            {'link': link({year_field: str(y)}), 'title': str(y)}
+            for y in range(first.year, last.year + 1)
+        ],
+    }
@@ -1,4 +1,6 @@
 from django import template
+from django.template.defaultfilters import date as django_date_filter
+from django.utils.translation import get_language
 import locale
 
 register = template.Library()
@@ -13,8 +15,6 @@ def brl(value, args=None):
     - with_prefix (bool, default True)
     Parsed from string/arg.
     """
-    from django.utils.translation import get_language
-    
     decimals = 2
     with_prefix = True
     
@@ -62,9 +62,6 @@ def date_fmt(value):
     The current "d/m/Y H:i" implies they want time. I'll make the filter return the formatted string suitable for `date` filter or format it directly.
     Best to format directly.
     """
-    from django.utils import timezone
-    from django.utils.translation import get_language
-    
     if not value:
         return ""
         
@@ -83,5 +80,4 @@ def date_fmt(value):
         fmt = "d/M/Y H:i"
         
     # We can use Django's date format function
-    from django.template.defaultfilters import date as django_date_filter
     return django_date_filter(value, fmt)
@@ -1,3 +1,1541 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import importlib
+import io
+import json
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from asgiref.sync import async_to_sync, sync_to_async
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+
+from . import (
+    compression_middleware, geo, housekeeping, importer, jobs, kpi_cache, kpis, metrics, pagination, rollups, search,
+    warmup,
+)
+from .benchmarking import make_rows
+from .models import Recharge, Settings, MonthlyRollup, ImportJob, RechargeTombstone, DataVersion
+
+UTC = datetime.timezone.utc
+
+
+def make_recharge(user, data, kwh=10.0, custo=20.0, odometro=1000.0, isento=False, **extra):
+    return Recharge.objects.create(
+        user=user, data=data, kwh=kwh, custo=custo, odometro=odometro, isento=isento, **extra
+    )
+
+
+class MonthlyRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def rollup(self, year, month):
+        return MonthlyRollup.objects.filter(user=self.user, mes=datetime.date(year, month, 1)).first()
+
+    def test_create_edit_delete_keep_rollup_in_sync(self):
+        r1 = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), kwh=10, custo=30, odometro=100)
+        make_recharge(self.user, datetime.datetime(2025, 1, 20, tzinfo=UTC), kwh=5, custo=10, odometro=180, isento=True)
+
+        jan = self.rollup(2025, 1)
+        self.assertEqual(jan.recargas, 2)
+        self.assertAlmostEqual(jan.kwh, 15)
+        self.assertAlmostEqual(jan.custo_total, 40)
+        self.assertAlmostEqual(jan.custo_pagas, 30)
+        self.assertEqual((jan.odometro_min, jan.odometro_max), (100, 180))
+
+        # Moving a recharge to another month updates both buckets.
+        r1.data = datetime.datetime(2025, 2, 1, tzinfo=UTC)
+        r1.save()
+        self.assertEqual(self.rollup(2025, 1).recargas, 1)
+        self.assertEqual(self.rollup(2025, 2).recargas, 1)
+
+        r1.delete()
+        self.assertIsNone(self.rollup(2025, 2))
+
+    def test_api_create_with_string_date(self):
+        response = self.client.post(
+            reverse('api_recharge_list'),
+            data=json.dumps({"data": "2025-03-10T08:00:00Z", "kwh": 7, "custo": 14, "odometro": 50}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rollup(2025, 3).recargas, 1)
+
+    def test_delete_all_clears_rollups(self):
+        make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+        make_recharge(self.user, datetime.datetime(2025, 4, 5, tzinfo=UTC))
+        self.client.post(reverse('delete_all_recharges'))
+        self.assertFalse(MonthlyRollup.objects.filter(user=self.user).exists())
+
+    def test_monthly_api_and_rebuild_command(self):
+        make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), odometro=100)
+        make_recharge(self.user, datetime.datetime(2025, 1, 25, tzinfo=UTC), odometro=300)
+        make_recharge(self.user, datetime.datetime(2025, 2, 10, tzinfo=UTC), odometro=450)
+
+        MonthlyRollup.objects.all().delete()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+
+        data = self.client.get(reverse('api_recharges_monthly')).json()
+        self.assertEqual(data['labels'], ['2025-01', '2025-02'])
+        # A month with a single reading is measured from the previous month's last odometer.
+        self.assertEqual(data['km'], [200.0, 150.0])
+        self.assertEqual(data['consumo'], [20.0, 10.0])
+
+
+class KpiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bia', password='secret-pass-123')
+        self.client.force_login(self.user)
+        Settings.objects.create(user=self.user, preco_gasolina=6.0, consumo_km_l=12.0)
+
+    def test_single_query_and_totals(self):
+        make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), kwh=20, custo=40, odometro=1000)
+        make_recharge(self.user, datetime.datetime(2025, 1, 9, tzinfo=UTC), kwh=30, custo=15, odometro=1300, isento=True)
+
+        with self.assertNumQueries(1):
+            result = kpis.compute_kpis(self.user, self.user.settings)
+
+        self.assertEqual(result['recargas'], 2)
+        self.assertEqual(result['recargas_isentas_qtd'], 1)
+        self.assertEqual(result['total_km'], 300)
+        self.assertAlmostEqual(result['custo_pagas'], 40)
+        self.assertAlmostEqual(result['custo_isentas'], 15)
+        self.assertAlmostEqual(result['economia_total'], 300 / 12 * 6 - 55)
+
+    def test_dashboard_and_api_agree_on_single_reading(self):
+        make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), odometro=1000)
+
+        dashboard = self.client.get(reverse('dashboard')).context['kpis']
+        api = self.client.get(reverse('api_recharges_monthly')).json()['kpis']
+        self.assertEqual(dashboard['total_km'], 0.0)
+        self.assertEqual(dashboard, api)
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('check_query_plans', users=5, rows=200, stdout=out)
+        self.assertNotIn("SEQ SCAN", out.getvalue())
+
+
+class CsvExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('caio', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_filters_headers_and_filename(self):
+        make_recharge(self.user, datetime.datetime(2025, 1, 5, 8, 30, tzinfo=UTC), local="Casa", kwh=12.5)
+        make_recharge(self.user, datetime.datetime(2025, 1, 6, tzinfo=UTC), local="Trabalho")
+
+        response = self.client.get(reverse('manage_recharges'), {'export': 'csv', 'local': 'casa'})
+        self.assertTrue(response.streaming)
+        self.assertIn('recharge_export_filtered.csv', response['Content-Disposition'])
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "Data,Local,kWh,Custo,Odometro,Isento,Observacoes,Latitude,Longitude")
+        self.assertEqual(lines[1], "2025-01-05 08:30,Casa,12.5,20.0,1000.0,False,,,")
+        self.assertEqual(len(lines), 2)
+
+    def test_memory_stays_bounded_on_one_million_rows(self):
+        rows = 1_000_000
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO core_recharge (user_id, data, kwh, custo, isento, odometro, observacoes, local)
+                SELECT %s, TIMESTAMPTZ '2000-01-01' + g * INTERVAL '1 hour', 10.5, 21.0, g %% 5 = 0,
+                       1000 + g, 'obs', 'Casa'
+                FROM generate_series(1, %s) AS g
+                """,
+                [self.user.id, rows],
+            )
+
+        response = self.client.get(reverse('manage_recharges'), {'export': 'csv'})
+        tracemalloc.start()
+        try:
+            lines = 0
+            for chunk in response.streaming_content:
+                lines += chunk.count(b"\n")
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(lines, rows + 1)
+        # Materializing the export would need hundreds of MB; streaming stays at a few chunks.
+        self.assertLess(peak, 20 * 1024 * 1024)
+
+
+class BulkImportTests(TestCase):
+    CSV = (
+        "data,kwh,custo,isento,odometro,local\n"
+        "2025-01-05 10:00,10,20,0,100,Casa\n"
+        "2025-01-06 10:00,11,22,1,200," + "x" * 150 + "\n"
+        "2025-02-01 10:00,12,24,0,300,Trabalho\n"
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user('duda', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def upload(self, mode):
+        upload = SimpleUploadedFile("recargas.csv", self.CSV.encode(), content_type="text/csv")
+        return self.client.post(reverse('bulk_recharge'), {'file': upload, 'mode': mode})
+
+    def test_atomic_mode_rolls_back_everything(self):
+        self.upload('atomic')
+        self.assertFalse(Recharge.objects.filter(user=self.user).exists())
+        self.assertFalse(MonthlyRollup.objects.filter(user=self.user).exists())
+
+    def test_skip_mode_keeps_valid_rows(self):
+        self.upload('skip')
+        self.assertEqual(Recharge.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            list(MonthlyRollup.objects.filter(user=self.user).order_by('mes').values_list('recargas', flat=True)),
+            [1, 1],
+        )
+
+    def test_batches_are_bulk_inserted(self):
+        rows = list(make_rows(25))
+        with CaptureQueriesContext(connection) as ctx:
+            result = importer.import_rows(self.user, rows, batch_size=5)
+        self.assertEqual(result.created, 25)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_recharge"')]
+        refreshes = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT DATE_TRUNC')]
+        self.assertEqual((len(inserts), len(refreshes)), (5, 1))
+
+
+@override_settings(IMPORT_JOB_MIN_BYTES=1, IMPORT_JOBS_EAGER=True, BULK_IMPORT_BATCH_SIZE=2)
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('edu', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def csv(self, count, bad_at=None):
+        lines = ["data,kwh,custo,isento,odometro,local"]
+        for i in range(count):
+            local = "x" * 150 if i == bad_at else "Casa"
+            lines.append(f"2025-01-{i + 1:02d} 10:00,10,20,0,{100 + i},{local}")
+        return SimpleUploadedFile("recargas.csv", "\n".join(lines).encode(), content_type="text/csv")
+
+    def test_upload_returns_job_and_reports_progress(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('bulk_recharge'), {'file': self.csv(5), 'mode': 'atomic'},
+                HTTP_ACCEPT='application/json',
+            )
+        self.assertEqual(response.status_code, 202)
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], ImportJob.CONCLUIDO)
+        self.assertEqual((status['processadas'], status['criadas'], status['progresso']), (5, 5, 100.0))
+        self.assertEqual(Recharge.objects.filter(user=self.user).count(), 5)
+
+    def test_abandoned_job_resumes_from_last_committed_batch(self):
+        job = ImportJob.objects.create(user=self.user, arquivo=self.csv(5).read(), nome_arquivo="r.csv")
+        # A worker committed the first batch (2 rows) and then died.
+        importer.import_rows(self.user, importer.validate_csv_and_parse(self.csv(5))[0][:2])
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.PROCESSANDO, processadas=2, criadas=2,
+            atualizado_em=timezone.now() - datetime.timedelta(hours=1),
+        )
+
+        call_command('run_import_jobs', stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processadas, job.criadas), (ImportJob.CONCLUIDO, 5, 5))
+        self.assertEqual(Recharge.objects.filter(user=self.user).count(), 5)
+
+    def test_atomic_job_undoes_committed_batches_on_failure(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('bulk_recharge'), {'file': self.csv(5, bad_at=3), 'mode': 'atomic'})
+
+        job = ImportJob.objects.get(user=self.user)
+        self.assertEqual(job.status, ImportJob.FALHOU)
+        self.assertFalse(Recharge.objects.filter(user=self.user).exists())
+        self.assertFalse(MonthlyRollup.objects.filter(user=self.user).exists())
+
+    def test_undo_keeps_rows_created_outside_the_job(self):
+        job = ImportJob.objects.create(user=self.user, arquivo=b'', nome_arquivo="r.csv")
+        rows = importer.validate_csv_and_parse(self.csv(3))[0]
+        first = importer.insert_batch(self.user, rows[:1], 0, importer.ImportResult(), import_job=job)
+        # Saved through the form while the import was running: its id falls inside the job's range.
+        own = make_recharge(self.user, datetime.datetime(2025, 2, 1, tzinfo=UTC))
+        last = importer.insert_batch(self.user, rows[1:], 1, importer.ImportResult(), import_job=job)
+        job.lotes = [[first[0].pk, last[-1].pk]]
+
+        jobs._undo_committed_batches(job)
+
+        self.assertEqual(list(Recharge.objects.filter(user=self.user)), [own])
+
+    def test_worker_stops_once_another_worker_claimed_the_job(self):
+        job = ImportJob.objects.create(user=self.user, arquivo=self.csv(5).read(), nome_arquivo="r.csv")
+        insert_batch = importer.insert_batch
+
+        def insert_then_lose_lease(*args, **kwargs):
+            saved = insert_batch(*args, **kwargs)
+            # This worker stalls past its lease and another one claims the job.
+            ImportJob.objects.filter(pk=job.pk).update(token_execucao='outro-worker')
+            return saved
+
+        with mock.patch.object(importer, 'insert_batch', side_effect=insert_then_lose_lease):
+            jobs.run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processadas), (ImportJob.PROCESSANDO, 2))
+        self.assertEqual(Recharge.objects.filter(user=self.user).count(), 2)
+        self.assertIsNone(jobs.claim(job.pk))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('fabi', password='secret-pass-123')
+        self.client.force_login(self.user)
+        base = datetime.datetime(2025, 1, 1, tzinfo=UTC)
+        # Pairs of recharges share a timestamp, so ties must be broken by id.
+        for i in range(25):
+            make_recharge(self.user, base + datetime.timedelta(days=i // 2), odometro=100 + i)
+
+    def test_api_walks_every_row_once(self):
+        url = reverse('api_recharge_list')
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 4, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(url, params).json()
+            seen.extend(r['id'] for r in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        expected = list(Recharge.objects.filter(user=self.user).order_by('-data', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_api_rejects_bad_cursor_and_keeps_legacy_array(self):
+        url = reverse('api_recharge_list')
+        self.assertEqual(self.client.get(url, {'cursor': '%%%'}).status_code, 400)
+        self.assertEqual(len(self.client.get(url).json()), 25)
+
+    def test_history_page_navigates_back_and_forth(self):
+        url = reverse('manage_recharges')
+        first = self.client.get(url)
+        self.assertEqual(len(first.context['recharges']), 20)
+        self.assertEqual(first.context['total_aproximado'], 25)
+
+        second = self.client.get(url, {'cursor': first.context['page'].next_cursor})
+        self.assertEqual(len(second.context['recharges']), 5)
+        self.assertIsNone(second.context['page'].next_cursor)
+
+        back = self.client.get(url, {'before': second.context['page'].prev_cursor})
+        self.assertEqual(
+            [r.id for r in back.context['recharges']],
+            [r.id for r in first.context['recharges']],
+        )
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('gabi', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.recharge = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+
+    def assert_revalidates_without_row_queries(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        touched = [q['sql'] for q in ctx.captured_queries if 'core_recharge' in q['sql'] or 'core_monthlyrollup' in q['sql']]
+        self.assertEqual(touched, [])
+        return first['ETag']
+
+    def test_endpoints_answer_304_until_data_changes(self):
+        urls = [
+            reverse('api_recharges_monthly'),
+            reverse('api_recharge_list'),
+            reverse('api_recharge_detail', args=[self.recharge.pk]),
+        ]
+        etags = [self.assert_revalidates_without_row_queries(url) for url in urls]
+
+        make_recharge(self.user, datetime.datetime(2025, 2, 5, tzinfo=UTC))
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_settings_and_delete_all_bump_version(self):
+        url = reverse('api_recharges_monthly')
+        etag = self.client.get(url)['ETag']
+        Settings.objects.create(user=self.user, preco_gasolina=6.0, consumo_km_l=12.0)
+        etag2 = self.client.get(url)['ETag']
+        self.assertNotEqual(etag, etag2)
+
+        self.client.post(reverse('delete_all_recharges'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag2).status_code, 200)
+
+
+class KpiCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        kpi_cache.reset_stats()
+        self.user = User.objects.create_user('hugo', password='secret-pass-123')
+        self.client.force_login(self.user)
+        make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), kwh=10, odometro=100)
+        make_recharge(self.user, datetime.datetime(2025, 1, 25, tzinfo=UTC), kwh=20, odometro=300)
+
+    def data_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'core_recharge' in q['sql'] or 'core_monthlyrollup' in q['sql']]
+
+    def test_repeat_requests_are_served_from_cache(self):
+        for url in (reverse('dashboard'), reverse('api_recharges_monthly')):
+            self.assertNotEqual(self.data_queries(url), [])
+            self.assertEqual(self.data_queries(url), [])
+        self.assertEqual(kpi_cache.stats(), {'hits': 2, 'misses': 2, 'hit_ratio': 0.5})
+
+    def test_writes_invalidate_cached_values(self):
+        url = reverse('api_recharges_monthly')
+        self.assertEqual(self.client.get(url).json()['kpis']['recargas'], 2)
+
+        r = make_recharge(self.user, datetime.datetime(2025, 2, 5, tzinfo=UTC), odometro=400)
+        self.assertEqual(self.client.get(url).json()['kpis']['recargas'], 3)
+
+        r.kwh = 50
+        r.save()
+        self.assertEqual(self.client.get(url).json()['consumo'], [30.0, 50.0])
+
+        r.delete()
+        self.assertEqual(self.client.get(url).json()['labels'], ['2025-01'])
+
+        self.assertFalse(self.client.get(reverse('dashboard')).context['has_complete_config'])
+        Settings.objects.create(user=self.user, preco_gasolina=6.0, consumo_km_l=12.0)
+        self.assertTrue(self.client.get(reverse('dashboard')).context['has_complete_config'])
+
+        self.client.post(reverse('delete_all_recharges'))
+        self.assertEqual(self.client.get(url).json()['kpis']['recargas'], 0)
+        self.assertEqual(kpi_cache.stats()['hits'], 0)
+
+    def test_stats_endpoint_is_staff_only(self):
+        url = reverse('api_cache_stats')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).json()['kpis']['misses'], 0)
+
+
+class BatchApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('iris', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.url = reverse('api_recharge_batch')
+
+    def post(self, operations):
+        return self.client.post(self.url, {'operations': operations}, content_type='application/json')
+
+    def test_mixed_operations_apply_in_bulk(self):
+        keep = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), kwh=10)
+        gone = make_recharge(self.user, datetime.datetime(2025, 2, 5, tzinfo=UTC), kwh=20)
+        operations = [
+            {'op': 'create', 'ref': 'a', 'fields': {'data': '2025-03-01T10:00:00Z', 'kwh': 7, 'odometro': 1500}},
+            {'op': 'update', 'id': keep.pk, 'fields': {'kwh': 12.5, 'data': '2025-03-02T10:00:00'}},
+            {'op': 'delete', 'id': gone.pk},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(operations)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['created', 'updated', 'deleted'])
+        self.assertEqual(results[0]['ref'], 'a')
+
+        self.assertEqual(Recharge.objects.get(pk=results[0]['id']).kwh, 7)
+        keep.refresh_from_db()
+        self.assertEqual((keep.kwh, keep.data.month), (12.5, 3))
+        self.assertFalse(Recharge.objects.filter(pk=gone.pk).exists())
+        # Rollups follow the moved and deleted recharges.
+        self.assertEqual(
+            list(MonthlyRollup.objects.filter(user=self.user).values_list('mes', 'kwh')),
+            [(datetime.date(2025, 3, 1), 19.5)],
+        )
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_recharge"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_invalid_operation_rejects_whole_batch(self):
+        other = User.objects.create_user('jonas', password='secret-pass-123')
+        foreign = make_recharge(other, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+        response = self.post([
+            {'op': 'create', 'fields': {'data': '2025-03-01T10:00:00Z', 'kwh': 7}},
+            {'op': 'create', 'fields': {'kwh': 'abc', 'data': '2025-03-01T10:00:00Z'}},
+            {'op': 'create', 'fields': {'kwh': 1}},
+            {'op': 'delete', 'id': foreign.pk},
+            {'op': 'merge'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['results']
+        self.assertEqual([e['index'] for e in errors], [1, 2, 3, 4])
+        self.assertIn('kwh', errors[0]['message'])
+        self.assertIn('data', errors[1]['message'])
+        self.assertEqual(errors[2]['message'], 'Recharge not found')
+        self.assertFalse(Recharge.objects.filter(user=self.user).exists())
+        self.assertTrue(Recharge.objects.filter(pk=foreign.pk).exists())
+
+    def test_thousand_creates_in_one_call(self):
+        rows = [{**row, 'data': row['data'].isoformat()} for row in make_rows(1000)]
+        response = self.post([{'op': 'create', 'fields': row} for row in rows])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Recharge.objects.filter(user=self.user).count(), 1000)
+        self.assertEqual(
+            MonthlyRollup.objects.filter(user=self.user).aggregate(n=Sum('recargas'))['n'], 1000
+        )
+
+    def test_rejects_oversized_and_malformed_bodies(self):
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post(None).status_code, 400)
+        self.assertEqual(self.post([{'op': 'delete', 'id': 1}] * 2001).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('kaio', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.url = reverse('api_recharge_changes')
+
+    def sync(self, token=None, **params):
+        if token:
+            params['since'] = token
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_returns_only_changes_since_token(self):
+        r1 = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+        r2 = make_recharge(self.user, datetime.datetime(2025, 1, 6, tzinfo=UTC))
+        first = self.sync()
+        self.assertEqual(sorted(r['id'] for r in first['upserts']), [r1.pk, r2.pk])
+        self.assertEqual(first['deletes'], [])
+
+        self.assertEqual(self.sync(first['next'])['upserts'], [])
+
+        r1.kwh = 42
+        r1.save()
+        r3 = make_recharge(self.user, datetime.datetime(2025, 1, 7, tzinfo=UTC))
+        self.client.post(reverse('delete_recharge', args=[r2.pk]))
+        delta = self.sync(first['next'])
+        self.assertEqual([r['id'] for r in delta['upserts']], [r1.pk, r3.pk])
+        self.assertEqual(delta['upserts'][0]['kwh'], 42)
+        self.assertEqual(delta['deletes'], [r2.pk])
+
+        self.client.post(reverse('delete_all_recharges'))
+        final = self.sync(delta['next'])
+        self.assertEqual(final['upserts'], [])
+        self.assertEqual(sorted(final['deletes']), [r1.pk, r3.pk])
+
+    def test_api_and_batch_deletes_leave_tombstones(self):
+        r1 = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+        r2 = make_recharge(self.user, datetime.datetime(2025, 1, 6, tzinfo=UTC))
+        token = self.sync()['next']
+        self.client.delete(reverse('api_recharge_detail', args=[r1.pk]))
+        self.client.post(
+            reverse('api_recharge_batch'), {'operations': [{'op': 'delete', 'id': r2.pk}]},
+            content_type='application/json',
+        )
+        self.assertEqual(sorted(self.sync(token)['deletes']), [r1.pk, r2.pk])
+
+    def test_deleting_users_leaves_no_orphans(self):
+        from .models import DataVersion, RechargeTombstone
+        for delete in (lambda u: u.delete(), lambda u: User.objects.filter(pk=u.pk).delete()):
+            user = User.objects.create_user(f'gone{secrets.token_hex(3)}', password='secret-pass-123')
+            make_recharge(user, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+            delete(user)
+            self.assertFalse(RechargeTombstone.objects.filter(user_id=user.pk).exists())
+            self.assertFalse(DataVersion.objects.filter(user_id=user.pk).exists())
+            self.assertFalse(MonthlyRollup.objects.filter(user_id=user.pk).exists())
+        connection.check_constraints()
+
+    def test_pages_through_large_deltas(self):
+        token = self.sync()['next']
+        importer.import_rows(self.user, list(make_rows(25)))
+        seen = []
+        while True:
+            page = self.sync(token, limit=10)
+            seen.extend(r['id'] for r in page['upserts'])
+            token = page['next']
+            if not page['has_more']:
+                break
+        self.assertEqual(sorted(seen), sorted(Recharge.objects.filter(user=self.user).values_list('id', flat=True)))
+
+    def test_unsettled_writes_are_sent_again(self):
+        r1 = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+        with self.settings(SYNC_SETTLE_SECONDS=60):
+            first = self.sync()
+            self.assertEqual([r['id'] for r in first['upserts']], [r1.pk])
+            self.assertEqual([r['id'] for r in self.sync(first['next'])['upserts']], [r1.pk])
+
+    def test_bad_and_expired_tokens(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'garbage'}).status_code, 400)
+        token = self.sync()['next']
+        with self.settings(SYNC_TOMBSTONE_RETENTION_DAYS=-1):
+            self.assertEqual(self.client.get(self.url, {'since': token}).status_code, 410)
+
+    def test_import_committed_after_a_sync_is_delivered(self):
+        token = self.sync()['next']
+        # The import started a minute ago and commits only now, after the
+        # sync above handed out a token newer than its rows' write time.
+        started = timezone.now() - datetime.timedelta(minutes=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch('django.utils.timezone.now', return_value=started):
+                importer.import_rows(self.user, list(make_rows(3)), batch_size=2)
+
+        delta = self.sync(token)
+        self.assertEqual(
+            sorted(r['id'] for r in delta['upserts']),
+            sorted(Recharge.objects.filter(user=self.user).values_list('id', flat=True)),
+        )
+        self.assertEqual(len(delta['upserts']), 3)
+
+    def test_delta_reads_use_the_sync_index(self):
+        importer.import_rows(self.user, list(make_rows(50)))
+        token = self.sync()['next']
+        with CaptureQueriesContext(connection) as ctx:
+            self.sync(token)
+        sql = next(q['sql'] for q in ctx.captured_queries if 'FROM "core_recharge"' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE core_recharge")
+            # On 50 rows any user index plus a sort costs about the same, so
+            # only plans that already return rows in token order are allowed.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+            cursor.execute("EXPLAIN " + sql)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn('core_recharge_user_upd_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+
+class RechargeListFormatTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lia', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.r1 = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), kwh=10, local='Casa')
+        self.r2 = make_recharge(self.user, datetime.datetime(2025, 1, 6, tzinfo=UTC), kwh=20, local='Trabalho')
+        self.url = reverse('api_recharge_list')
+
+    def test_default_response_is_unchanged(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data[0]['id'], self.r2.pk)
+        self.assertEqual(data[0]['data'], self.r2.data.isoformat())
+        self.assertEqual(set(data[0]), {
+            'id', 'data', 'kwh', 'custo', 'isento', 'odometro', 'observacoes',
+            'local', 'latitude', 'longitude', 'atualizado_em',
+        })
+
+    def test_columnar_with_projection(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(self.url, {'format': 'columnar', 'fields': 'kwh,data'}).json()
+        self.assertEqual(data, {
+            'id': [self.r2.pk, self.r1.pk],
+            'data': [self.r2.data.isoformat(), self.r1.data.isoformat()],
+            'kwh': [20.0, 10.0],
+        })
+        sql = next(q['sql'] for q in ctx.captured_queries if 'FROM "core_recharge"' in q['sql'])
+        self.assertNotIn('"observacoes"', sql)
+
+    def test_paginated_projection_keeps_cursors(self):
+        data = self.client.get(self.url, {'limit': 1, 'fields': 'local'}).json()
+        self.assertEqual(data['results'], [{'id': self.r2.pk, 'local': 'Trabalho'}])
+        data = self.client.get(self.url, {'limit': 1, 'fields': 'local', 'format': 'columnar', 'cursor': data['next_cursor']}).json()
+        self.assertEqual(data['results'], {'id': [self.r1.pk], 'local': ['Casa']})
+
+    def test_rejects_unknown_fields_and_formats(self):
+        self.assertEqual(self.client.get(self.url, {'fields': 'kwh,user__password'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, 400)
+
+    def test_stdlib_fallback_matches_orjson(self):
+        expected = self.client.get(self.url, {'format': 'columnar'}).json()
+        with self.settings(API_JSON_DUMPS='core.fastjson.stdlib_dumps'):
+            self.assertEqual(self.client.get(self.url, {'format': 'columnar'}).json(), expected)
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('milo', password='secret-pass-123')
+        self.client.force_login(self.user)
+        importer.import_rows(self.user, list(make_rows(200)))
+
+    def test_negotiation(self):
+        negotiate = compression_middleware.negotiate
+        self.assertEqual(negotiate('gzip, deflate, br'), 'br')
+        self.assertEqual(negotiate('gzip;q=1.0, br;q=0.5'), 'gzip')
+        self.assertEqual(negotiate('br;q=0, gzip'), 'gzip')
+        self.assertEqual(negotiate('*'), 'br')
+        self.assertEqual(negotiate('identity'), None)
+        self.assertEqual(negotiate(''), None)
+
+    def test_json_is_compressed_and_varies(self):
+        url = reverse('api_recharge_list')
+        plain = self.client.get(url, HTTP_ORIGIN='https://app.example')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertIn('Origin', plain['Vary'])
+
+        gz = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gz['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gz.content), plain.content)
+        self.assertEqual(int(gz['Content-Length']), len(gz.content))
+        self.assertTrue(gz['ETag'].startswith('W/'))
+
+        br = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(br['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(br.content), plain.content)
+
+        # A revalidation with the weakened ETag still gets a 304.
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gz['ETag']).status_code, 304)
+
+    def test_small_and_html_responses_are_left_alone(self):
+        other = User.objects.create_user('nina', password='secret-pass-123')
+        self.client.force_login(other)
+        small = self.client.get(reverse('api_recharge_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', small)
+        page = self.client.get(reverse('dashboard'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', page)
+
+    def test_streaming_csv_is_compressed_incrementally(self):
+        plain = b"".join(self.client.get(reverse('manage_recharges'), {'export': 'csv'}).streaming_content)
+        response = self.client.get(reverse('manage_recharges'), {'export': 'csv'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(gzip.decompress(b"".join(chunks)), plain)
+
+    def test_strong_etag_responses_reuse_the_compressed_body(self):
+        url = reverse('api_recharges_monthly')
+        with mock.patch('core.compression_middleware.compress', wraps=compression_middleware.compress) as spy:
+            first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(spy.call_count, 1)
+            self.assertEqual(first.content, second.content)
+
+            make_recharge(self.user, timezone.now(), odometro=10**6)
+            self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(spy.call_count, 2)
+
+
+class AsyncApiTests(TestCase):
+    """The async API views answer exactly like the sync ones."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.use_urls(async_api=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.use_urls(async_api=False)
+        super().tearDownClass()
+
+    @staticmethod
+    def use_urls(async_api):
+        import capstone.urls
+        import core.urls
+        with override_settings(ASYNC_API=async_api):
+            importlib.reload(core.urls)
+            importlib.reload(capstone.urls)
+        clear_url_caches()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('olga', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.async_client = AsyncClient()
+        self.async_client.cookies = self.client.cookies
+        self.r1 = make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC), odometro=100)
+        self.r2 = make_recharge(self.user, datetime.datetime(2025, 2, 5, tzinfo=UTC), odometro=400)
+
+    def test_urls_point_to_async_views(self):
+        from . import async_api_views
+        self.assertIs(resolve(reverse('api_recharge_list')).func.__wrapped__.__module__, async_api_views.__name__)
+
+    async def test_reads_match_sync_views(self):
+        for url, params in [
+            (reverse('api_recharges_monthly'), {}),
+            (reverse('api_recharge_list'), {}),
+            (reverse('api_recharge_list'), {'limit': 1, 'format': 'columnar', 'fields': 'kwh'}),
+            (reverse('api_recharge_detail', args=[self.r1.pk]), {}),
+            (reverse('api_settings'), {}),
+        ]:
+            response = await self.async_client.get(url, params)
+            self.assertEqual(response.status_code, 200, url)
+            expected = await sync_to_async(self.sync_get)(url, params)
+            self.assertEqual(response.json(), expected, url)
+
+    def sync_get(self, url, params):
+        from . import api_views, views
+        request = RequestFactory().get(url, params)
+        request.user = self.user
+        request.session = {}
+        match = resolve(url)
+        sync_view = {
+            'api_recharges_monthly': views.api_recharges_monthly,
+            'api_recharge_list': api_views.api_recharge_list,
+            'api_recharge_detail': api_views.api_recharge_detail,
+            'api_settings': api_views.api_settings,
+        }[match.url_name]
+        return json.loads(sync_view(request, *match.args, **match.kwargs).content)
+
+    async def test_writes_and_conditional_get(self):
+        url = reverse('api_recharge_list')
+        first = await self.async_client.get(url)
+        self.assertEqual((await self.async_client.get(url, headers={'If-None-Match': first['ETag']})).status_code, 304)
+
+        created = await self.async_client.post(
+            url, {'data': '2025-03-05T10:00:00Z', 'kwh': 5, 'odometro': 700}, content_type='application/json'
+        )
+        pk = created.json()['id']
+        detail = reverse('api_recharge_detail', args=[pk])
+        await self.async_client.put(detail, {'kwh': 9}, content_type='application/json')
+        self.assertEqual((await self.async_client.get(detail)).json()['kwh'], 9)
+        self.assertEqual((await self.async_client.get(url, headers={'If-None-Match': first['ETag']})).status_code, 200)
+
+        await self.async_client.delete(detail)
+        self.assertEqual((await self.async_client.get(detail)).status_code, 404)
+        monthly = (await self.async_client.get(reverse('api_recharges_monthly'))).json()
+        self.assertEqual(monthly['labels'], ['2025-01', '2025-02'])
+
+    def test_settings_keep_the_original_keys(self):
+        Settings.objects.create(user=self.user, preco_gasolina=6.0, consumo_km_l=12.0)
+        self.assertEqual(self.client.get(reverse('api_settings')).json(), {
+            'preco_gasolina': 6.0, 'consumo_km_l': 12.0, 'limit_kwh': 0, 'limit_cost': 0,
+        })
+
+    async def test_anonymous_requests_are_redirected(self):
+        response = await AsyncClient().get(reverse('api_recharge_list'))
+        self.assertEqual(response.status_code, 302)
+
+
+class WarmupTests(TestCase):
+    def test_warm_runs_every_step_but_the_database_when_asked(self):
+        timings = warmup.warm(database=False)
+        self.assertEqual(set(timings), {'urls', 'templates', 'translations'})
+
+    def test_templates_and_catalogs_are_loaded(self):
+        from django.utils.translation import trans_real
+
+        self.assertGreaterEqual(warmup.warm_templates(), 9)
+        warmup.warm_translations()
+        for code, _name in settings.LANGUAGES:
+            self.assertIn(code, trans_real._translations)
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    # Pooled connections are shared across threads and outlive a test
+    # transaction, so the tests commit for real.
+    databases = {'default', 'pool_test'}
+
+    @classmethod
+    def setUpClass(cls):
+        # A pooled alias on the test database, registered like one from
+        # DATABASES so that connections[...] and core.db_pool see it. As a
+        # mirror of default it is not flushed a second time after each test.
+        connections.settings['pool_test'] = {
+            **connection.settings_dict,
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {**connection.settings_dict['OPTIONS'], 'pool': {'min_size': 1, 'max_size': 2, 'timeout': 5}},
+            'TEST': {**connection.settings_dict['TEST'], 'MIRROR': 'default'},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        del connections['pool_test']
+        connections.settings.pop('pool_test')
+
+    def setUp(self):
+        # A fresh pool per test, so its counters start at zero.
+        self.pooled = connections['pool_test']
+        self.addCleanup(self.pooled.close_pool)
+        self.addCleanup(self.pooled.close)
+
+    def backend_pid(self):
+        with self.pooled.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            pid = cursor.fetchone()[0]
+        self.pooled.close()  # back to the pool
+        return pid
+
+    def test_connection_killed_by_the_server_is_replaced_on_checkout(self):
+        pid = self.backend_pid()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+
+        self.assertNotEqual(self.backend_pid(), pid)
+        self.assertGreaterEqual(self.pooled.pool.get_stats()['connections_lost'], 1)
+
+    def test_threads_share_at_most_max_size_connections(self):
+        self.backend_pid()  # opens the pool
+        pids, lock = set(), threading.Lock()
+
+        def work():
+            with self.pooled.pool.connection() as conn:
+                pid = conn.execute("SELECT pg_backend_pid() FROM pg_sleep(0.05)").fetchone()[0]
+            with lock:
+                pids.add(pid)
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertIn(len(pids), (1, 2))
+        stats = self.pooled.pool.get_stats()
+        self.assertLessEqual(stats['pool_size'], 2)
+        self.assertEqual(stats.get('requests_errors', 0), 0)
+
+    def test_stats_endpoint_is_staff_only(self):
+        user = User.objects.create_user('pool_stats', password='pw')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('api_db_pool_stats')).status_code, 403)
+        user.is_staff = True
+        user.save()
+        pools = self.client.get(reverse('api_db_pool_stats')).json()['pools']
+        self.assertEqual(list(pools), ['pool_test'])
+        self.assertLessEqual(pools['pool_test']['pool_size'], 2)
+
+
+class EndpointBenchmarkTests(TestCase):
+    def test_reports_every_endpoint(self):
+        out = io.StringIO()
+        call_command('benchmark_endpoints', sizes=[30], repeat=2, warmup=0, import_rows=5, stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+
+        results = {r['endpoint']: r for r in report['results']}
+        self.assertEqual(set(results), {
+            'dashboard', 'api_recharges_monthly', 'api_recharge_series', 'api_recharge_map', 'api_recharge_segments',
+            'manage_recharges', 'manage_recharges_csv', 'api_recharge_list', 'api_recharge_list_full', 'bulk_recharge',
+        })
+        for result in results.values():
+            self.assertIn(result['status'], (200, 302))
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['peak_memory_kib'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # Seeded rows and uploads are rolled back.
+        self.assertFalse(User.objects.filter(username='__bench_endpoints').exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('metrics', password='pw')
+        make_recharge(self.user, datetime.datetime(2025, 1, 5, tzinfo=UTC))
+        self.client.force_login(self.user)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_records_status_latency_size_and_queries_per_view(self):
+        before = {
+            'requests': self.sample('capstone_http_requests_total', view='dashboard', method='GET', status='200'),
+            'latency': self.sample('capstone_http_request_duration_seconds_count', view='dashboard'),
+            'queries': self.sample('capstone_db_queries_per_request_sum', view='dashboard'),
+            'bytes': self.sample('capstone_http_response_size_bytes_sum', view='dashboard'),
+        }
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(self.sample('capstone_http_requests_total', view='dashboard', method='GET', status='200'),
+                         before['requests'] + 1)
+        self.assertEqual(self.sample('capstone_http_request_duration_seconds_count', view='dashboard'),
+                         before['latency'] + 1)
+        self.assertGreater(self.sample('capstone_db_queries_per_request_sum', view='dashboard'), before['queries'])
+        self.assertEqual(self.sample('capstone_http_response_size_bytes_sum', view='dashboard'),
+                         before['bytes'] + len(response.content))
+
+    def test_streamed_size_is_recorded_when_the_body_is_sent(self):
+        before = self.sample('capstone_http_response_size_bytes_sum', view='manage_recharges')
+        response = self.client.get(reverse('manage_recharges') + '?export=csv')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(self.sample('capstone_http_response_size_bytes_sum', view='manage_recharges'),
+                         before + len(body))
+
+    def test_queries_in_async_view_threads_count_for_the_request(self):
+        async def view():
+            token = metrics.start_request()
+            await sync_to_async(lambda: list(User.objects.all()))()
+            return metrics.finish_request(token)
+
+        self.assertEqual(async_to_sync(view)().queries, 1)
+
+    def test_endpoint_touches_neither_sessions_nor_the_database(self):
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(0):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Set-Cookie', response.headers)
+        names = {family.name for family in text_string_to_metric_families(response.content.decode())}
+        self.assertIn('capstone_db_seconds_per_request', names)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_values_from_worker_processes_are_summed(self):
+        script = (
+            "import django; django.setup()\n"
+            "from core import metrics\n"
+            "metrics.observe('dashboard', 'GET', 200, 0.1, 100, None)\n"
+        )
+        with tempfile.TemporaryDirectory() as store:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=store, DJANGO_SETTINGS_MODULE='capstone.settings')
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', script], env=env, cwd=settings.BASE_DIR, check=True)
+            with mock.patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=store):
+                text = metrics.exposition().decode()
+
+        samples = {
+            (s.name, s.labels.get('view'), s.labels.get('status')): s.value
+            for family in text_string_to_metric_families(text) for s in family.samples
+        }
+        self.assertEqual(samples[('capstone_http_requests_total', 'dashboard', '200')], 2)
+        self.assertEqual(samples[('capstone_http_response_size_bytes_sum', 'dashboard', None)], 200)
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sessions', password='pw')
+
+    def session_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [q['sql'] for q in queries if 'django_session' in q['sql']]
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cached_sessions_skip_the_session_table(self):
+        self.client.login(username='sessions', password='pw')
+        self.assertEqual(self.session_queries(reverse('dashboard')), [])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_unchanged_session_is_not_written_back(self):
+        self.client.login(username='sessions', password='pw')
+        sql = self.session_queries(reverse('dashboard'))
+        self.assertEqual(len(sql), 1)
+        self.assertTrue(sql[0].startswith('SELECT'))
+
+    def status_after_logout_elsewhere(self, engine, location_a, location_b):
+        """
+        Log in and out on worker "a" and replay the old cookie on worker "b".
+        Both workers share the database; each has its own cache alias. A new
+        Client per call, because SessionMiddleware binds SESSION_ENGINE when
+        the client's handler first loads the middleware.
+        """
+        locmem = 'django.core.cache.backends.locmem.LocMemCache'
+        caches_setting = {
+            'default': settings.CACHES['default'],
+            'a': {'BACKEND': locmem, 'LOCATION': location_a},
+            'b': {'BACKEND': locmem, 'LOCATION': location_b},
+        }
+        with override_settings(SESSION_ENGINE=engine, CACHES=caches_setting):
+            client = Client()
+            with override_settings(SESSION_CACHE_ALIAS='a'):
+                client.login(username='sessions', password='pw')
+            cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+            with override_settings(SESSION_CACHE_ALIAS='b'):
+                self.assertEqual(client.get(reverse('dashboard')).status_code, 200)
+            with override_settings(SESSION_CACHE_ALIAS='a'):
+                client.get(reverse('logout'))
+            client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+            with override_settings(SESSION_CACHE_ALIAS='b'):
+                return client.get(reverse('dashboard')).status_code
+
+    def test_logout_ends_the_session_on_every_worker(self):
+        cached_db = 'django.contrib.sessions.backends.cached_db'
+        db = 'django.contrib.sessions.backends.db'
+        # Per-process caches: cached_db would keep serving the session from
+        # worker b's cache, which is why it is not the default without Redis.
+        self.assertEqual(self.status_after_logout_elsewhere(cached_db, 'sessions-a1', 'sessions-b1'), 200)
+        self.assertEqual(self.status_after_logout_elsewhere(db, 'sessions-a2', 'sessions-b2'), 302)
+        # A shared cache (Redis in production) sees the logout from every worker.
+        self.assertEqual(self.status_after_logout_elsewhere(cached_db, 'sessions-shared', 'sessions-shared'), 302)
+
+    @mock.patch.dict(os.environ)
+    def test_cached_db_is_the_default_only_with_a_shared_cache(self):
+        import capstone.settings
+
+        os.environ.pop('SESSION_MODE', None)
+        os.environ.pop('REDIS_URL', None)
+        self.assertEqual(importlib.reload(capstone.settings).SESSION_MODE, 'db')
+        os.environ['REDIS_URL'] = 'redis://localhost:6379/0'
+        self.assertEqual(importlib.reload(capstone.settings).SESSION_MODE, 'cached_db')
+        self.addCleanup(importlib.reload, capstone.settings)
+
+    def test_housekeeping_deletes_expired_sessions_and_old_tombstones(self):
+        from django.contrib.sessions.models import Session
+
+        now = timezone.now()
+        Session.objects.create(session_key='expired', session_data='', expire_date=now - datetime.timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + datetime.timedelta(days=1))
+        RechargeTombstone.objects.create(user=self.user, recharge_id=1, apagado_em=now - datetime.timedelta(days=365))
+
+        self.assertEqual(housekeeping.run_once(), {'sessions': 1, 'tombstones': 1})
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+
+class RechargeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('series', password='pw')
+        Settings.objects.create(user=self.user, preco_gasolina=6.0, consumo_km_l=12.0)
+        # 01:30 UTC on Feb 1st is still January 31st in São Paulo (UTC-3).
+        make_recharge(self.user, datetime.datetime(2025, 1, 10, 12, 0, tzinfo=UTC), kwh=10, custo=20, odometro=1000)
+        make_recharge(self.user, datetime.datetime(2025, 2, 1, 1, 30, tzinfo=UTC), kwh=5, custo=0, odometro=1100,
+                      isento=True)
+        make_recharge(self.user, datetime.datetime(2025, 2, 20, 9, 0, tzinfo=UTC), kwh=8, custo=16, odometro=1300)
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get(reverse('api_recharge_series'), params)
+
+    def test_buckets_follow_the_requested_time_zone(self):
+        sao_paulo = self.get(granularity='month', tz='America/Sao_Paulo').json()
+        self.assertEqual(sao_paulo['labels'], ['2025-01', '2025-02'])
+        self.assertEqual(sao_paulo['consumo'], [15.0, 8.0])
+        self.assertEqual(sao_paulo['km'], [100.0, 200.0])
+
+        utc = self.get(granularity='month', tz='UTC').json()
+        self.assertEqual(utc['consumo'], [10.0, 13.0])
+
+    def test_day_week_and_year_labels(self):
+        self.assertEqual(self.get(granularity='day', tz='UTC').json()['labels'],
+                         ['2025-01-10', '2025-02-01', '2025-02-20'])
+        self.assertEqual(self.get(granularity='week', tz='UTC').json()['labels'],
+                         ['2025-01-06', '2025-01-27', '2025-02-17'])
+        self.assertEqual(self.get(granularity='year').json()['labels'], ['2025'])
+
+    def test_range_is_whole_local_days_with_inclusive_end(self):
+        data = self.get(granularity='day', tz='America/Sao_Paulo', start='2025-01-31', end='2025-01-31').json()
+        self.assertEqual(data['labels'], ['2025-01-31'])
+        self.assertEqual(data['consumo'], [5.0])
+
+    def test_month_series_in_utc_matches_the_monthly_endpoint(self):
+        series = self.get(granularity='month', tz='UTC').json()
+        monthly = self.client.get(reverse('api_recharges_monthly')).json()
+        for key in ('labels', 'custos', 'consumo', 'km', 'economia', 'consumo_por_100km'):
+            self.assertEqual(series[key], monthly[key], key)
+
+    def test_one_grouped_query_over_recharges(self):
+        for i in range(50):
+            make_recharge(self.user, datetime.datetime(2025, 3, 1, tzinfo=UTC) + datetime.timedelta(hours=i),
+                          odometro=1400 + i)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get(granularity='day').status_code, 200)
+        recharge_queries = [q['sql'] for q in queries if 'core_recharge' in q['sql']]
+        self.assertEqual(len(recharge_queries), 1)
+        self.assertIn('GROUP BY', recharge_queries[0])
+
+    def test_invalid_parameters(self):
+        for params in ({'granularity': 'hour'}, {'tz': 'Mars/Olympus'}, {'start': '2025-13-01'},
+                       {'start': '2025-02-01', 'end': '2025-01-01'}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class RechargeMapTests(TestCase):
+    # São Paulo (Paulista, Ibirapuera) and Campinas.
+    PAULISTA = (-23.5614, -46.6559)
+    IBIRAPUERA = (-23.5874, -46.6576)
+    CAMPINAS = (-22.9099, -47.0626)
+
+    def setUp(self):
+        self.user = User.objects.create_user('mapa', password='pw')
+        when = datetime.datetime(2025, 1, 1, tzinfo=UTC)
+        for i, (lat, lon) in enumerate([self.PAULISTA, self.PAULISTA, self.IBIRAPUERA, self.CAMPINAS]):
+            make_recharge(self.user, when + datetime.timedelta(days=i), kwh=10 + i, custo=20 + i,
+                          odometro=1000 + i, latitude=lat, longitude=lon)
+        make_recharge(self.user, when, odometro=900)  # no location
+        other = User.objects.create_user('outro', password='pw')
+        make_recharge(other, when, latitude=self.PAULISTA[0], longitude=self.PAULISTA[1])
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get(reverse('api_recharge_map'), params)
+
+    def test_database_geohash_matches_python_encoder(self):
+        for recharge in Recharge.objects.filter(user=self.user, latitude__isnull=False):
+            self.assertEqual(recharge.geohash, geo.encode(recharge.latitude, recharge.longitude))
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertIsNone(Recharge.objects.get(user=self.user, latitude__isnull=True).geohash)
+
+    def test_geohash_follows_updates_and_bulk_writes(self):
+        Recharge.objects.filter(user=self.user, latitude=self.CAMPINAS[0]).update(latitude=self.PAULISTA[0],
+                                                                              longitude=self.PAULISTA[1])
+        Recharge.objects.bulk_create([Recharge(user=self.user, data=timezone.now(), kwh=1, custo=1, odometro=2000,
+                                               latitude=self.PAULISTA[0], longitude=self.PAULISTA[1])])
+        self.assertEqual(Recharge.objects.filter(user=self.user, geohash=geo.encode(*self.PAULISTA)).count(), 4)
+
+    def test_migration_backfills_rows_written_before_the_trigger(self):
+        migration = importlib.import_module('core.migrations.0012_recharge_geohash')
+        updated_before = dict(Recharge.objects.values_list('id', 'atualizado_em'))
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE core_recharge SET geohash = NULL")
+
+        migration.backfill(connection, batch_size=2)
+
+        for recharge in Recharge.objects.filter(latitude__isnull=False):
+            self.assertEqual(recharge.geohash, geo.encode(recharge.latitude, recharge.longitude))
+        self.assertEqual(dict(Recharge.objects.values_list('id', 'atualizado_em')), updated_before)
+
+    def test_clusters_split_with_zoom(self):
+        whole_state = self.get(bbox='-48,-25,-42,-21', zoom=1).json()
+        self.assertEqual(whole_state['recargas'], 4)
+        self.assertEqual(len(whole_state['clusters']), 1)
+        cluster = whole_state['clusters'][0]
+        self.assertEqual(cluster['kwh_total'], 46.0)
+        self.assertEqual(cluster['custo_medio'], 21.5)
+
+        city = self.get(bbox='-47,-24,-46,-23', zoom=14).json()
+        self.assertEqual(city['precision'], 6)
+        self.assertEqual(sorted(c['recargas'] for c in city['clusters']), [1, 2])
+        paulista = next(c for c in city['clusters'] if c['recargas'] == 2)
+        self.assertEqual(paulista['geohash'], geo.encode(*self.PAULISTA, 6))
+        self.assertEqual((paulista['latitude'], paulista['longitude']), self.PAULISTA)
+        self.assertEqual(paulista['kwh_total'], 21.0)
+
+    def test_bbox_is_exact_even_when_cover_cells_are_larger(self):
+        data = self.get(bbox='-46.66,-23.57,-46.65,-23.55', zoom=16).json()
+        self.assertEqual(data['recargas'], 2)
+
+    def test_cover_contains_the_box(self):
+        bbox = geo.parse_bbox('-46.9,-23.8,-46.3,-23.3')
+        prefixes = geo.cover(bbox, 6)
+        self.assertLessEqual(len(prefixes), geo.MAX_COVER_CELLS)
+        for lat in (-23.8, -23.55, -23.3):
+            for lon in (-46.9, -46.6, -46.3):
+                self.assertTrue(any(geo.encode(lat, lon).startswith(p) for p in prefixes), (lat, lon))
+
+    def test_one_grouped_query_over_recharges(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get(bbox='-180,-90,180,90', zoom=0).status_code, 200)
+        recharge_queries = [q['sql'] for q in queries if 'core_recharge' in q['sql']]
+        self.assertEqual(len(recharge_queries), 1)
+        self.assertIn('GROUP BY', recharge_queries[0])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'bbox': '1,2,3'}, {'bbox': 'a,b,c,d'}, {'bbox': '10,0,-10,5'},
+                       {'bbox': '0,-91,1,0'}, {'bbox': '0,0,1,1', 'zoom': 'x'}, {'bbox': '0,0,1,1', 'zoom': 30}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class TextSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('busca', password='pw')
+        when = datetime.datetime(2025, 1, 1, tzinfo=UTC)
+        make_recharge(self.user, when, local="Eletroposto São José", observacoes="Carga rápida")
+        make_recharge(self.user, when + datetime.timedelta(days=1), local="Casa", observacoes="100% carregado")
+        make_recharge(self.user, when + datetime.timedelta(days=2), local=None, observacoes=None)
+        other = User.objects.create_user('vizinho', password='pw')
+        make_recharge(other, when, local="Sao Jose Shopping")
+        self.client.force_login(self.user)
+
+    def search(self, field, term):
+        recharges = search.filter_text(Recharge.objects.filter(user=self.user), field, term)
+        return list(recharges.values_list(field, flat=True))
+
+    def test_accent_and_case_insensitive(self):
+        self.assertEqual(self.search('local', 'SAO JOSE'), ["Eletroposto São José"])
+        self.assertEqual(self.search('local', 'são josé'), ["Eletroposto São José"])
+        self.assertEqual(self.search('observacoes', 'rapida'), ["Carga rápida"])
+
+    def test_like_wildcards_are_literal(self):
+        self.assertEqual(self.search('observacoes', '100%'), ["100% carregado"])
+        self.assertEqual(self.search('observacoes', '%'), ["100% carregado"])
+        self.assertEqual(self.search('local', '_'), [])
+
+    def test_history_page_filters(self):
+        response = self.client.get(reverse('manage_recharges'), {'export': 'csv', 'local': 'sao jose'})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("Eletroposto São José", lines[1])
+
+    def test_search_uses_trigram_index(self):
+        # Enough rows of the same user that the (user, ...) btree indexes are
+        # no shortcut; the seq and plain index scans are also switched off so
+        # only the bitmap scans compete.
+        when = datetime.datetime(2024, 1, 1, tzinfo=UTC)
+        Recharge.objects.bulk_create([
+            Recharge(user=self.user, data=when + datetime.timedelta(hours=i), kwh=10, custo=20, odometro=i,
+                     local=f"Casa {i}")
+            for i in range(2000)
+        ])
+        qs = search.filter_text(Recharge.objects.filter(user=self.user), 'local', 'eletroposto')
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE core_recharge")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_indexscan = off")
+            cursor.execute("SET LOCAL enable_indexonlyscan = off")
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("core_recharge_local_trgm", plan)
+
+    def test_trigram_indexes_exist_and_their_sql_runs(self):
+        # Exits with status 1 if a model index is missing from the migrations.
+        call_command('makemigrations', 'core', check=True, verbosity=0)
+        trigram = [index for index in Recharge._meta.indexes if index.name.endswith('_trgm')]
+        self.assertEqual(len(trigram), 2)
+        with connection.cursor() as cursor:
+            # The test database is built by the migrations, so these come from 0019.
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'core_recharge'")
+            applied = dict(cursor.fetchall())
+            for index in trigram:
+                self.assertIn('gin_trgm_ops', applied[index.name])
+            # Build them again with the SQL the migration generates (minus
+            # CONCURRENTLY). setUp's inserts left deferred FK checks pending,
+            # and Postgres refuses DDL on a table with pending trigger events.
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            with connection.schema_editor() as editor:
+                for index in trigram:
+                    editor.remove_index(Recharge, index)
+                    editor.add_index(Recharge, index)
+            cursor.execute(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = ANY(%s) AND i.indisvalid",
+                [[index.name for index in trigram]],
+            )
+            self.assertEqual(sorted(row[0] for row in cursor.fetchall()), sorted(index.name for index in trigram))
+
+    def test_admin_search(self):
+        admin_user = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(admin_user)
+        url = reverse('admin:core_recharge_changelist')
+        self.assertEqual(self.client.get(url, {'q': 'sao jose'}).context['cl'].result_count, 2)
+        self.assertEqual(self.client.get(url, {'q': 'vizinho'}).context['cl'].result_count, 1)
+        self.assertEqual(self.client.get(url, {'q': 'busca rapida'}).context['cl'].result_count, 1)
+        self.assertEqual(self.client.get(url, {'q': 'nada'}).context['cl'].result_count, 0)
+
+    def test_admin_username_search_stays_in_the_database(self):
+        for i in range(30):
+            User.objects.create_user(f'usuario{i}', password='pw')
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:core_recharge_changelist'), {'q': 'u'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        searches = [q['sql'] for q in ctx.captured_queries
+                    if 'FROM "core_recharge"' in q['sql'] and 'LIKE' in q['sql']]
+        self.assertTrue(searches)
+        for sql in searches:
+            self.assertIn('FROM "auth_user" U0', sql)
+
+
+class AdminScaleTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.users = [User.objects.create_user(f'frota{i}', password='pw') for i in range(3)]
+        for i, user in enumerate(self.users):
+            for day in range(i + 2):
+                make_recharge(user, datetime.datetime(2024, 11 + day % 2, 1 + day, tzinfo=UTC), odometro=1000 + day)
+        self.client.force_login(self.admin)
+
+    def test_recharge_counter_follows_writes(self):
+        counts = dict(DataVersion.objects.values_list('user_id', 'recargas'))
+        self.assertEqual([counts[u.id] for u in self.users], [2, 3, 4])
+
+        user = self.users[0]
+        Recharge.objects.filter(user=user).first().delete()
+        with rollups.deferred():
+            for day in range(3):
+                make_recharge(user, datetime.datetime(2025, 2, 1 + day, tzinfo=UTC), odometro=5000 + day)
+        self.assertEqual(DataVersion.objects.get(user=user).recargas, 4)
+
+    def test_user_changelist_reads_the_counter(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:auth_user_changelist'))
+        self.assertEqual(response.status_code, 200)
+        counts = {row.username: row.recharge_count for row in response.context['cl'].result_list}
+        self.assertEqual(counts, {'root': 0, 'frota0': 2, 'frota1': 3, 'frota2': 4})
+        self.assertFalse(any('core_recharge' in q['sql'] for q in queries))
+
+    def test_recharge_changelist_has_no_n_plus_one(self):
+        url = reverse('admin:core_recharge_changelist')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for user in self.users:
+            for day in range(5):
+                make_recharge(user, datetime.datetime(2025, 3, 1 + day, tzinfo=UTC), odometro=2000 + day)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.context['cl'].result_count, 24)
+        self.assertEqual(len(many), len(few))
+        # No DISTINCT date_trunc / MIN / MAX over core_recharge for the date hierarchy.
+        recharge_sql = [q['sql'] for q in many if 'core_recharge' in q['sql']]
+        self.assertFalse(any('DISTINCT' in sql or 'MIN(' in sql for sql in recharge_sql), recharge_sql)
+        self.assertContains(response, '?data__year=2024')
+        self.assertContains(response, '?data__year=2025')
+
+    def test_user_filter_renders_only_the_selected_user(self):
+        url = reverse('admin:core_recharge_changelist')
+        user = self.users[2]
+        response = self.client.get(url, {'user__id__exact': user.id})
+        self.assertEqual(response.context['cl'].result_count, 4)
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, f'<option value="{user.id}" selected>{user.username}</option>', html=True)
+        self.assertNotContains(response, self.users[0].username)
+        self.assertContains(response, 'data__year=2024')
+        self.assertNotContains(response, 'data__year=2025')
+
+        self.assertEqual(self.client.get(url, {'user__id__exact': 'x'}).status_code, 302)
+
+    def test_estimated_count_paginator(self):
+        paginator = pagination.EstimatedCountPaginator(Recharge.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.count, 9)
+        with mock.patch.object(pagination, 'approximate_count', return_value=50_000):
+            paginator = pagination.EstimatedCountPaginator(Recharge.objects.order_by('pk'), 2)
+            self.assertEqual(paginator.count, 50_000)
+            self.assertEqual(list(paginator.page(10_000).object_list), [])
+
+
+class RechargeSegmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('trechos', password='pw')
+        Settings.objects.create(user=self.user, preco_gasolina=6.0, consumo_km_l=12.0)
+        day = datetime.datetime(2025, 3, 1, 12, 0, tzinfo=UTC)
+        for i, (odometro, kwh, custo) in enumerate([(1000, 10, 20), (1100, 15, 30), (1300, 20, 0), (1250, 5, 10),
+                                                     (1500, 30, 45)]):
+            make_recharge(self.user, day + datetime.timedelta(days=i), kwh=kwh, custo=custo, odometro=odometro)
+        other = User.objects.create_user('alheio', password='pw')
+        make_recharge(other, day + datetime.timedelta(hours=1), odometro=1050)
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get(reverse('api_recharge_segments'), params)
+
+    def test_each_segment_since_the_previous_recharge(self):
+        results = self.get().json()['results']
+        self.assertEqual([r['odometro'] for r in results], [1500, 1250, 1300, 1100, 1000])
+        self.assertEqual([r['km'] for r in results], [250.0, None, 200.0, 100.0, None])
+        newest = results[0]
+        self.assertEqual(newest['consumo_por_100km'], 12.0)
+        self.assertEqual(newest['custo_por_km'], 0.18)
+        # 250 km on gasoline: 250 / 12 * 6 = 125, minus the 45 paid.
+        self.assertEqual(newest['economia'], 80.0)
+        self.assertIsNone(results[-1]['economia'])
+
+    def test_keyset_pages_keep_the_previous_odometer(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.get(limit=2).json()
+        recharge_sql = [q['sql'] for q in queries if 'core_recharge' in q['sql']]
+        self.assertEqual(len(recharge_sql), 1)
+        self.assertIn('LEAD(', recharge_sql[0])
+        self.assertIn('LIMIT 3', recharge_sql[0])
+
+        second = self.get(limit=2, cursor=first['next_cursor']).json()
+        third = self.get(limit=2, cursor=second['next_cursor']).json()
+        self.assertEqual([r['km'] for r in first['results'] + second['results'] + third['results']],
+                         [250.0, None, 200.0, 100.0, None])
+        self.assertIsNone(third['next_cursor'])
+
+    def test_date_range_keeps_the_segment_into_the_first_day(self):
+        data = self.get(start='2025-03-02', end='2025-03-03', tz='UTC').json()
+        self.assertEqual([r['km'] for r in data['results']], [200.0, 100.0])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_no_gas_config_means_no_savings(self):
+        Settings.objects.filter(user=self.user).delete()
+        self.assertIsNone(self.get().json()['results'][0]['economia'])
+
+    def test_invalid_parameters(self):
+        for params in ({'limit': 'x'}, {'cursor': 'nope'}, {'start': '2025-13-01'}, {'tz': 'Mars/Olympus'},
+                       {'start': '2025-03-05', 'end': '2025-03-01'}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+def fleet_fixture():
+    """Users covering the KPI edge cases: gas config, none or unusable, one recharge, none, exempt-only."""
+    day = datetime.datetime(2025, 1, 1, 8, 0, tzinfo=UTC)
+    users = {}
+    for name, config, rows in [
+        ('frota_a', (6.19, 11.5), [(12.37, 30.11, False, 1000.0), (20.05, 0.0, True, 1187.4), (7.3, 14.6, False, 1420.9)]),
+        ('frota_b', None, [(33.33, 71.1, False, 52000.0), (18.1, 36.2, False, 52350.5)]),
+        ('frota_c', (5.5, 0.0), [(9.99, 19.98, False, 300.0)]),
+        ('frota_d', (5.89, 13.0), [(10.0, 0.0, True, 10.0), (11.0, 0.0, True, 10.0)]),
+        ('frota_e', (6.0, 12.0), []),
+    ]:
+        user = User.objects.create_user(name, password='pw')
+        if config:
+            Settings.objects.create(user=user, preco_gasolina=config[0], consumo_km_l=config[1])
+        for i, (kwh, custo, isento, odometro) in enumerate(rows):
+            make_recharge(user, day + datetime.timedelta(days=i), kwh=kwh, custo=custo, isento=isento,
+                          odometro=odometro)
+        users[name] = user
+    return users
+
+
+class FleetReportTests(TestCase):
+    def setUp(self):
+        self.users = fleet_fixture()
+
+    def report(self, **options):
+        out = io.StringIO()
+        call_command('fleet_report', stdout=out, stderr=io.StringIO(), **options)
+        return json.loads(out.getvalue())
+
+    def test_matches_the_dashboard_kpis_of_every_user(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'frota.csv')
+            report = self.report(workers=0, shard_size=2, csv=path)
+            with open(path, newline='') as f:
+                rows = {int(row['user_id']): row for row in csv.DictReader(f)}
+
+        self.assertEqual(report['rows'], 8)
+        self.assertEqual(report['shards'], 3)
+        self.assertGreater(report['rows_per_second'], 0)
+        self.assertEqual(set(rows), {u.id for name, u in self.users.items() if name != 'frota_e'})
+        for user_id, row in rows.items():
+            expected = kpis.compute_kpis(User.objects.get(pk=user_id), Settings.objects.filter(user_id=user_id).first())
+            for key, value in expected.items():
+                got = float(row[key]) if row[key] != '' else None
+                self.assertEqual(got, None if value is None else float(value), (user_id, key))
+
+    def test_fleet_summary(self):
+        fleet = self.report(workers=0)['fleet']
+        per_user = [kpis.compute_kpis(u, Settings.objects.filter(user=u).first()) for u in self.users.values()]
+        self.assertEqual(fleet['usuarios'], 4)
+        self.assertEqual(fleet['usuarios_com_gasolina'], 2)
+        self.assertEqual(fleet['recargas'], 8)
+        self.assertAlmostEqual(fleet['custo_total'], sum(k['custo_total'] for k in per_user))
+        self.assertAlmostEqual(fleet['economia_total'], sum(k['economia_total'] or 0 for k in per_user))
+        consumo = fleet['consumo_por_100km']
+        self.assertLessEqual(consumo['p10'], consumo['p50'])
+        self.assertLessEqual(consumo['p50'], consumo['p90'])
+
+
+class FleetReportPoolTests(TransactionTestCase):
+    def test_process_pool_gives_the_same_report(self):
+        fleet_fixture()
+        reports = []
+        for workers in (0, 2):
+            out = io.StringIO()
+            call_command('fleet_report', workers=workers, shard_size=1, stdout=out, stderr=io.StringIO())
+            reports.append(json.loads(out.getvalue()))
+        self.assertEqual(reports[1]['workers'], 2)
+        self.assertEqual(reports[0]['fleet'], reports[1]['fleet'])
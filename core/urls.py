@@ -1,6 +1,16 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import api_views
+from . import metrics
+
+# Under the ASGI worker the hot JSON endpoints are served by async views.
+if settings.ASYNC_API:
+    from . import async_api_views as hot_api
+    api_recharges_monthly = hot_api.api_recharges_monthly
+else:
+    hot_api = api_views
+    api_recharges_monthly = views.api_recharges_monthly
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -19,9 +29,18 @@ urlpatterns = [
     # API Endpoints
     path('api/auth/login/', api_views.api_login, name='api_login'),
     path('api/auth/logout/', api_views.api_logout, name='api_logout'),
-    path('api/settings/', api_views.api_settings, name='api_settings'),
-    path('api/recharges/', api_views.api_recharge_list, name='api_recharge_list'),
-    path('api/recharges/<int:pk>/', api_views.api_recharge_detail, name='api_recharge_detail'),
-    path('api/recharges/monthly/', views.api_recharges_monthly, name='api_recharges_monthly'),
+    path('api/settings/', hot_api.api_settings, name='api_settings'),
+    path('api/recharges/', hot_api.api_recharge_list, name='api_recharge_list'),
+    path('api/recharges/changes/', api_views.api_recharge_changes, name='api_recharge_changes'),
+    path('api/recharges/batch/', api_views.api_recharge_batch, name='api_recharge_batch'),
+    path('api/recharges/<int:pk>/', hot_api.api_recharge_detail, name='api_recharge_detail'),
+    path('api/recharges/monthly/', api_recharges_monthly, name='api_recharges_monthly'),
+    path('api/recharges/series/', api_views.api_recharge_series, name='api_recharge_series'),
+    path('api/recharges/map/', api_views.api_recharge_map, name='api_recharge_map'),
+    path('api/recharges/segments/', api_views.api_recharge_segments, name='api_recharge_segments'),
+    path('api/import-jobs/<int:pk>/', api_views.api_import_job, name='api_import_job'),
+    path('api/cache-stats/', api_views.api_cache_stats, name='api_cache_stats'),
+    path('api/db-pool-stats/', api_views.api_db_pool_stats, name='api_db_pool_stats'),
     path('settings/', views.settings_view, name='settings'),
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
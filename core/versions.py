@@ -0,0 +1,80 @@
+"""
+Per-user data version used for conditional GETs.
+
+Any write to a user's recharges (through the rollup refresh) or settings
+bumps ``DataVersion``. API views decorated with ``conditional`` derive a
+strong ETag and Last-Modified from it, so an ``If-None-Match`` revalidation
+is answered with 304 after a single primary-key lookup, before any
+aggregation or serialization runs.
+"""
+from functools import wraps
+
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .models import DataVersion
+
+# Bump when the JSON shape of the conditional endpoints changes, so clients
+# holding a cached body from an older deploy do not revalidate it as fresh.
+ETAG_SCHEMA = 2
+
+
+def bump(user_id, recargas=None):
+    """Bump the user's version, also storing their recharge count when given."""
+    now = timezone.now()
+    changes = {'atualizado_em': now}
+    if recargas is not None:
+        changes['recargas'] = recargas
+    updated = DataVersion.objects.filter(user_id=user_id).update(versao=F('versao') + 1, **changes)
+    if not updated:
+        DataVersion.objects.get_or_create(user_id=user_id, defaults={'versao': 1, **changes})
+
+
+def current(request):
+    """(versao, atualizado_em) for the request's user, fetched once per request."""
+    if not hasattr(request, '_data_version'):
+        row = DataVersion.objects.filter(user_id=request.user.id).values_list('versao', 'atualizado_em').first()
+        request._data_version = row or (0, None)
+    return request._data_version
+
+
+async def acurrent(request):
+    if not hasattr(request, '_data_version'):
+        row = await DataVersion.objects.filter(user_id=request.user.id).values_list('versao', 'atualizado_em').afirst()
+        request._data_version = row or (0, None)
+    return request._data_version
+
+
+def etag(request, *args, **kwargs):
+    versao, _atualizado_em = current(request)
+    return f'"{ETAG_SCHEMA}-{request.user.id}-{versao}"'
+
+
+def last_modified(request, *args, **kwargs):
+    return current(request)[1]
+
+
+def conditional(view):
+    """
+    ETag/Last-Modified support for a per-user JSON view. Responses are private
+    and must be revalidated, which costs one DataVersion lookup when unchanged.
+    """
+    view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+    return cache_control(private=True, no_cache=True)(view)
+
+
+def aconditional(view):
+    """
+    ``conditional`` for async views. The user and version are loaded with
+    the async ORM first, so the ETag callbacks run without touching the DB.
+    """
+    inner = conditional(view)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await request.auser()
+        await acurrent(request)
+        return await inner(request, *args, **kwargs)
+    return wrapper
@@ -1,11 +1,20 @@
+import datetime
+from urllib.parse import urlencode
+
+from django.conf import settings as django_settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, logout, authenticate
+from django.urls import reverse
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
+from django.db import DatabaseError, transaction
+from django.db.models import Sum
 from django.utils.translation import gettext as _
 from .forms import RegisterForm, ContactForm, SettingsForm, RechargeForm
-from .models import Recharge, Settings, ContactLog
+from .models import Recharge, Settings, MonthlyRollup, ImportJob
+from . import importer, jobs, kpi_cache, kpis, pagination, rollups, search, sync, versions
 
 def index(request):
     if request.user.is_authenticated:
@@ -67,127 +76,40 @@ def recharge(request):
 
 # Helper for CSV
 import csv
-import io
-import unicodedata
-
-def normalize_header(h):
-    if not h: return ""
-    return unicodedata.normalize('NFKD', h).encode('ASCII', 'ignore').decode('utf-8').strip().lower()
-
-def validate_csv_and_parse(file_storage):
-    err_msgs = []
-    rows_validos = []
-    try:
-        raw = file_storage.read()
-    except Exception as e:
-        return [], [_(f"Erro ao ler arquivo: {e}")]
-
-    try:
-        text = raw.decode("utf-8-sig")
-    except UnicodeDecodeError:
-        text = raw.decode("latin-1", errors="ignore")
-    
-    text = text.replace("\x00", "")
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-    stream = io.StringIO(text, newline='')
-
-    sample = text[:10000]
-    delimiter = ','
-    try:
-        dialect = csv.Sniffer().sniff(sample, delimiters=[',', ';', '\t', '|'])
-        delimiter = dialect.delimiter
-    except Exception:
-        first_line = text.splitlines()[0] if text.splitlines() else ""
-        if ';' in first_line and ',' not in first_line:
-            delimiter = ';'
-        elif '\t' in first_line:
-            delimiter = '\t'
-
-    try:
-        reader = csv.DictReader(stream, delimiter=delimiter)
-    except Exception as e:
-        return [], [_(f"Erro ao preparar leitor CSV: {e}")]
-
-    if not reader.fieldnames:
-        return [], [_("Arquivo CSV sem cabeçalho.")]
-
-    # Normalize headers behavior: Remove accents, lowercase
-    reader.fieldnames = [normalize_header(h) for h in reader.fieldnames]
-    required_headers = ['data', 'kwh', 'custo', 'isento', 'odometro']
-    # observacoes is optional
-
-    missing = [h for h in required_headers if h not in reader.fieldnames]
-    if missing:
-        msg = _("Cabeçalhos inválidos. Esperados: %(expected)s. Ausentes: %(missing)s") % {
-            'expected': ", ".join(required_headers),
-            'missing': ", ".join(missing)
-        }
-        return [], [msg]
-
-    line_num = 1
-    for row in reader:
-        line_num += 1
-        # Skip empty lines
-        if all((row.get(h) is None or str(row.get(h)).strip() == "") for h in required_headers):
-            continue
-            
-        try:
-            data_str = (row.get('data') or "").strip()
-            if not data_str:
-                raise ValueError(_("Campo 'data' vazio."))
-            
-            from datetime import datetime
-            try:
-                # Attempt ISO
-                dt = datetime.fromisoformat(data_str.replace(' ', 'T'))
-            except ValueError:
-                raise ValueError(_("Formato de data inválido (Use AAAA-MM-DD HH:MM)."))
-
-            kwh = float((row.get('kwh') or "").replace(',', '.'))
-            custo = float((row.get('custo') or "").replace(',', '.'))
-            odometro = float((row.get('odometro') or "").replace(',', '.'))
-            observacoes = (row.get('observacoes') or "").strip()
-            local = (row.get('local') or "").strip()
-            
-            isento_raw = (row.get('isento') or "").strip().lower()
-            isento = isento_raw in ["true", "1", "sim", "yes", "y"]
-
-            latitude = None
-            try:
-                lat_str = row.get('latitude') or row.get('lat')
-                if lat_str and lat_str.strip():
-                    latitude = float(lat_str.strip().replace(',', '.'))
-            except Exception:
-                pass
-
-            longitude = None
-            try:
-                lon_str = row.get('longitude') or row.get('lon') or row.get('lng')
-                if lon_str and lon_str.strip():
-                    longitude = float(lon_str.strip().replace(',', '.'))
-            except Exception:
-                pass
-
-            rows_validos.append({
-                'data': dt,
-                'kwh': kwh,
-                'custo': custo,
-                'odometro': odometro,
-                'isento': isento,
-                'observacoes': observacoes,
-                'local': local,
-                'latitude': latitude,
-                'longitude': longitude,
-            })
-        except ValueError as ve:
-            err_msgs.append(_(f"Linha {line_num}: {ve}"))
-        except Exception as e:
-            err_msgs.append(_(f"Linha {line_num}: erro inesperado: {e}"))
-
-    if not rows_validos and not err_msgs:
-        err_msgs.append(_("Nenhuma linha válida encontrada no CSV."))
-        
-    return rows_validos, err_msgs
+from .importer import validate_csv_and_parse
+
+CSV_EXPORT_HEADER = ['Data', 'Local', 'kWh', 'Custo', 'Odometro', 'Isento', 'Observacoes', 'Latitude', 'Longitude']
+CSV_EXPORT_FIELDS = ('data', 'local', 'kwh', 'custo', 'odometro', 'isento', 'observacoes', 'latitude', 'longitude')
+
+class _Echo:
+    """Pseudo-buffer for csv.writer: write() hands the formatted line back."""
+    def write(self, value):
+        return value
+
+def stream_recharges_csv(rows, lines_per_chunk=500):
+    """Yield the export CSV in chunks from an iterator of CSV_EXPORT_FIELDS tuples."""
+    writer = csv.writer(_Echo())
+    chunk = [writer.writerow(CSV_EXPORT_HEADER)]
+    for data, local, kwh, custo, odometro, isento, observacoes, latitude, longitude in rows:
+        chunk.append(writer.writerow([
+            data.strftime("%Y-%m-%d %H:%M"),
+            local or "",
+            kwh,
+            custo,
+            odometro,
+            str(isento),
+            observacoes or "",
+            latitude if latitude is not None else "",
+            longitude if longitude is not None else ""
+        ]))
+        if len(chunk) >= lines_per_chunk:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+MAX_IMPORT_WARNINGS = 20
 
 @login_required
 def bulk_recharge(request):
@@ -200,42 +122,54 @@ def bulk_recharge(request):
              return redirect('bulk_recharge')
              
         file = request.FILES['file']
+        # 'atomic': any invalid row aborts the import. 'skip': keep the valid rows.
+        skip_errors = request.POST.get('mode') == 'skip'
+
+        # Large files are imported off the request thread; the page polls the job.
+        if file.size >= django_settings.IMPORT_JOB_MIN_BYTES:
+            job = jobs.create_job(request.user, file, 'skip' if skip_errors else 'atomic')
+            if 'application/json' in request.headers.get('Accept', ''):
+                return JsonResponse({
+                    'job_id': job.pk,
+                    'status_url': reverse('api_import_job', args=[job.pk]),
+                }, status=202)
+            return redirect(f"{reverse('bulk_recharge')}?job={job.pk}")
+
         rows, errors = validate_csv_and_parse(file)
         
-        if errors:
+        if errors and (not skip_errors or not rows):
             for e in errors:
                 messages.error(request, e)
             return redirect('bulk_recharge')
             
-        count = 0
-        for r in rows:
-            try:
-                Recharge.objects.create(
-                    user=request.user,
-                    data=r['data'],
-                    kwh=r['kwh'],
-                    custo=r['custo'],
-                    isento=r['isento'],
-                    odometro=r['odometro'],
-                    observacoes=r.get('observacoes', ''),
-                    local=r.get('local', ''),
-                    latitude=r.get('latitude'),
-                    longitude=r.get('longitude')
-                )
-                count += 1
-            except Exception as e:
-                messages.warning(request, _(f"Erro ao salvar linha: {e}"))
+        try:
+            result = importer.import_rows(request.user, rows, skip_errors=skip_errors)
+        except DatabaseError as e:
+            messages.error(request, _("Importação cancelada, nenhuma recarga foi salva: %(error)s") % {'error': e})
+            return redirect('bulk_recharge')
+
+        skipped = errors + result.errors
+        for e in skipped[:MAX_IMPORT_WARNINGS]:
+            messages.warning(request, e)
+        if len(skipped) > MAX_IMPORT_WARNINGS:
+            messages.warning(request, _("... e mais %(n)s linhas ignoradas.") % {'n': len(skipped) - MAX_IMPORT_WARNINGS})
         
-        messages.success(request, _(f"Importação concluída: {count} recargas adicionadas."))
+        messages.success(request, _("Importação concluída: %(count)s recargas adicionadas (%(rate)s linhas/s).") % {
+            'count': result.created,
+            'rate': f"{result.rows_per_second:.0f}",
+        })
         return redirect('dashboard')
 
-    return render(request, 'core/bulk_recharge.html')
+    job = None
+    job_id = request.GET.get('job', '')
+    if job_id.isdigit():
+        job = ImportJob.objects.filter(user=request.user, pk=job_id).only('pk', 'nome_arquivo').first()
+    return render(request, 'core/bulk_recharge.html', {'job': job})
+
+HISTORY_PAGE_SIZE = 20
 
 @login_required
 def manage_recharges(request):
-    import datetime
-    from django.db.models import Q
-
     # Filters
     local_query = request.GET.get('local', '')
     obs_query = request.GET.get('observacoes', '')
@@ -267,10 +201,10 @@ def manage_recharges(request):
                 pass
 
     if local_query:
-        recharge_list = recharge_list.filter(local__icontains=local_query)
+        recharge_list = search.filter_text(recharge_list, 'local', local_query)
     
     if obs_query:
-        recharge_list = recharge_list.filter(observacoes__icontains=obs_query)
+        recharge_list = search.filter_text(recharge_list, 'observacoes', obs_query)
     
     if isento_query:
         if isento_query == 'True':
@@ -280,45 +214,41 @@ def manage_recharges(request):
 
     recharge_list = recharge_list.order_by('-data')
 
-    # Pagination
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(recharge_list, 20)
-    page = request.GET.get('page')
-    try:
-        recharges = paginator.page(page)
-    except PageNotAnInteger:
-        recharges = paginator.page(1)
-    except EmptyPage:
-        recharges = paginator.page(paginator.num_pages)
-
-    # Export CSV
+    # Export CSV (streamed, so memory stays flat regardless of row count)
     if request.GET.get('export') == 'csv':
-        import csv
-        from django.http import HttpResponse
-
         has_filters = any([local_query, obs_query, isento_query, data_inicio, data_fim, periodo_30d])
         filename = "recharge_export_filtered.csv" if has_filters else "recharge_export_complete.csv"
 
-        response = HttpResponse(content_type='text/csv')
+        rows = recharge_list.values_list(*CSV_EXPORT_FIELDS).iterator(chunk_size=2000)
+        response = StreamingHttpResponse(stream_recharges_csv(rows), content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-        writer = csv.writer(response)
-        writer.writerow(['Data', 'Local', 'kWh', 'Custo', 'Odometro', 'Isento', 'Observacoes', 'Latitude', 'Longitude'])
-
-        for r in recharge_list:
-            writer.writerow([
-                r.data.strftime("%Y-%m-%d %H:%M"),
-                r.local or "",
-                r.kwh,
-                r.custo,
-                r.odometro,
-                str(r.isento),
-                r.observacoes or "",
-                r.latitude if r.latitude is not None else "",
-                r.longitude if r.longitude is not None else ""
-            ])
         return response
 
+    # Keyset pagination: each page is an index range scan, no COUNT/OFFSET
+    try:
+        page = pagination.paginate(
+            recharge_list, HISTORY_PAGE_SIZE,
+            after=request.GET.get('cursor'), before=request.GET.get('before'),
+        )
+    except ValueError:
+        page = pagination.paginate(recharge_list, HISTORY_PAGE_SIZE)
+
+    has_filters = any([local_query, obs_query, isento_query, data_inicio, data_fim, periodo_30d])
+    if has_filters:
+        total_aproximado = pagination.approximate_count(recharge_list)
+    else:
+        total_aproximado = MonthlyRollup.objects.filter(user=request.user).aggregate(total=Sum('recargas'))['total'] or 0
+
+    filter_params = {
+        'local': local_query,
+        'observacoes': obs_query,
+        'isento': isento_query,
+        'data_inicio': data_inicio,
+        'data_fim': data_fim,
+        'periodo': periodo_30d,
+    }
+    filter_qs = urlencode({k: v for k, v in filter_params.items() if v})
+
     isento_ctx = None
     if isento_query == 'True':
         isento_ctx = True
@@ -326,7 +256,11 @@ def manage_recharges(request):
         isento_ctx = False
 
     context = {
-        'recharges': recharges,
+        'recharges': page.items,
+        'page': page,
+        'total_aproximado': total_aproximado,
+        'total_exato': not has_filters,
+        'filter_qs': filter_qs,
         'filters': {
             'local': local_query,
             'observacoes': obs_query,
@@ -366,283 +300,47 @@ def delete_recharge(request, pk):
     return redirect('manage_recharges')
 
 
-@login_required
-def dashboard(request):
-    from django.db.models import Sum, Min, Max
-    from collections import defaultdict
-    import datetime
-
-    user = request.user
-    
-    # --- Fetch Data ---
-    recargas = Recharge.objects.filter(user=user).order_by('data')
-    
+def _dashboard_context(user):
     try:
-        settings = user.settings
+        config = user.settings
     except Settings.DoesNotExist:
-        settings = None
-
-    config = settings
-    
-    # --- KPIs Calculation ---
-    kwhs = [r.kwh for r in recargas]
-    custos = [r.custo for r in recargas]
-    isentos = [r.isento for r in recargas]
-    odometros = [r.odometro for r in recargas if r.odometro is not None]
-
-    total_recargas = len(recargas)
-    recargas_isentas_qtd = sum(1 for i in isentos if i)
-    recargas_pagas_qtd = total_recargas - recargas_isentas_qtd
-    
-    if len(odometros) >= 2:
-        total_km = odometros[-1] - odometros[0]
-    elif len(odometros) == 1:
-        total_km = odometros[0] # Fallback logic from Flask? Flask logic: odometros[0] if odometros else 0
-    else:
-        total_km = 0.0
-        
-    custo_total = sum(custos)
-    custo_isentas = sum(c for c, i in zip(custos, isentos) if i)
-    custo_pagas = sum(c for c, i in zip(custos, isentos) if not i)
-    consumo_total_kwh = sum(kwhs)
-    
-    consumo_por_100km = (consumo_total_kwh / total_km * 100) if total_km > 0 else 0
-    custo_medio_kwh = (custo_total / consumo_total_kwh) if consumo_total_kwh > 0 else 0
-    custo_medio_km = (custo_total / total_km) if total_km > 0 else 0
+        config = None
 
-    # Config gasolina
-    tem_config = config and config.preco_gasolina is not None and config.consumo_km_l and config.consumo_km_l > 0
-    
-    if tem_config:
-        preco_gasolina = config.preco_gasolina
-        consumo_km_l = config.consumo_km_l
-        custo_gas_por_km = preco_gasolina / consumo_km_l
-        custo_gas_total = (total_km / consumo_km_l) * preco_gasolina
-        economia_total = custo_gas_total - custo_total
-        economia_total_por_km = economia_total / total_km if total_km > 0 else 0
-        economia_pagas = custo_gas_total - custo_pagas
-        economia_pagas_por_km = economia_pagas / total_km if total_km > 0 else 0
-    else:
-        custo_gas_por_km = None
-        custo_gas_total = None
-        economia_total = None
-        economia_total_por_km = None
-        economia_pagas = None
-        economia_pagas_por_km = None
-
-    kpis = {
-        "recargas": total_recargas,
-        "recargas_isentas_qtd": recargas_isentas_qtd,
-        "recargas_pagas_qtd": recargas_pagas_qtd,
-        "total_km": total_km,
-        "consumo_total_kwh": consumo_total_kwh,
-        "consumo_por_100km": consumo_por_100km,
-        "custo_total": custo_total,
-        "custo_isentas": custo_isentas,
-        "custo_pagas": custo_pagas,
-        "custo_medio_kwh": custo_medio_kwh,
-        "custo_medio_km": custo_medio_km,
-        "custo_gas_por_km": custo_gas_por_km,
-        "custo_gas_total": custo_gas_total,
-        "economia_total": economia_total,
-        "economia_total_por_km": economia_total_por_km,
-        "economia_pagas": economia_pagas,
-        "economia_pagas_por_km": economia_pagas_por_km,
+    return {
+        'kpis': kpis.compute_kpis(user, config),
+        'has_complete_config': kpis.has_gas_config(config)
     }
 
-    context = {
-        'kpis': kpis,
-        'has_complete_config': tem_config
-    }
+
+@login_required
+def dashboard(request):
+    context = kpi_cache.get_or_compute(request, 'dashboard', lambda: _dashboard_context(request.user))
     return render(request, 'core/dashboard.html', context)
     
 @login_required
+@versions.conditional
 def api_recharges_monthly(request):
-    from django.http import JsonResponse
-    from collections import defaultdict
-    # Helpers
-    def _to_month(dt):
-        return dt.strftime("%Y-%m")
+    payload = kpi_cache.get_or_compute(request, 'monthly', lambda: _monthly_payload(request.user))
+    return JsonResponse(payload)
 
-    user = request.user
-    
-    # Fetch Data
-    recargas = Recharge.objects.filter(user=user).order_by('data')
+
+def _monthly_payload(user):
     try:
         config = user.settings
     except Settings.DoesNotExist:
         config = None
-        
-    preco_gasolina = config.preco_gasolina if config else None
-    consumo_km_l = config.consumo_km_l if config else None
-    tem_config = (preco_gasolina is not None) and (consumo_km_l is not None) and (consumo_km_l > 0)
-
-    # Aggregation
-    monthly = defaultdict(lambda: {
-        "custo_total": 0.0,
-        "custo_pagamento": 0.0,
-        "kwh": 0.0,
-        "odometros": []
-    })
-
-    for r in recargas:
-        mes = _to_month(r.data)
-        monthly[mes]["custo_total"] += r.custo
-        monthly[mes]["kwh"] += r.kwh
-        if r.odometro is not None:
-            monthly[mes]["odometros"].append(r.odometro)
-        if not r.isento:
-            monthly[mes]["custo_pagamento"] += r.custo
-
-    meses_ord = sorted(monthly.keys())
-    
-    # Response Arrays
-    labels = []
-    custos_total = []
-    custos_pagamento = []
-    custos_percentual = []
-    consumos = []
-    kms = []
-    economias_total = []
-    economias_pagamento = []
-    consumo_por_100km_list = []
-
-    for idx, mes in enumerate(meses_ord):
-        data_mes = monthly[mes]
-        labels.append(mes)
-        
-        ct = float(data_mes["custo_total"])
-        cp = float(data_mes["custo_pagamento"])
-        custos_total.append(round(ct, 2))
-        custos_pagamento.append(round(cp, 2))
-        custos_percentual.append(round((cp / ct * 100) if ct > 0 else 0.0, 2))
-        
-        consumo_mes = round(float(data_mes["kwh"]), 2)
-        consumos.append(consumo_mes)
-        
-        odos = sorted(data_mes["odometros"])
-        if len(odos) >= 2:
-            km_mes = odos[-1] - odos[0]
-        elif len(odos) == 1:
-            if idx > 0:
-                prev_mes = meses_ord[idx-1]
-                prev_odos = sorted(monthly[prev_mes]["odometros"])
-                prev_last = prev_odos[-1] if prev_odos else 0.0
-                km_mes = odos[0] - prev_last
-            else:
-                km_mes = 0.0
-                # Could argue odos[0] if it's the very first month, but logic says diff.
-                # Use 0.0 to be safe
-        else:
-            km_mes = 0.0
-            
-        # Prevent negative km if data is weird
-        km_mes = max(km_mes, 0.0)
-        kms.append(round(km_mes, 2))
-        
-        if km_mes > 0:
-            consumo_por_100km_list.append(round((consumo_mes / km_mes) * 100, 2))
-        else:
-            consumo_por_100km_list.append(0)
-            
-        if tem_config:
-            custo_gas_mes = (km_mes / consumo_km_l) * preco_gasolina
-            economia_total_mes = custo_gas_mes - ct
-            economia_pagamento_mes = custo_gas_mes - cp
-        else:
-            economia_total_mes = 0.0
-            economia_pagamento_mes = 0.0
-            
-        economias_total.append(round(economia_total_mes, 2))
-        economias_pagamento.append(round(economia_pagamento_mes, 2))
-        
-    # --- KPI Calculation (Copied from dashboard view) ---
-    kwhs = [r.kwh for r in recargas]
-    custos = [r.custo for r in recargas]
-    isentos = [r.isento for r in recargas]
-    # We need odometros for total_km. Note: recargas is ordered by data.
-    # The monthly loop below handles granular data, but for total KPIs we need overall range.
-    all_odometros = [r.odometro for r in recargas if r.odometro is not None]
-
-    total_recargas = len(recargas)
-    recargas_isentas_qtd = sum(1 for i in isentos if i)
-    recargas_pagas_qtd = total_recargas - recargas_isentas_qtd
-    
-    if len(all_odometros) >= 2:
-        total_km = all_odometros[-1] - all_odometros[0]
-    elif len(all_odometros) == 1:
-         # Fallback logic if needed, but safe to say 0 or just the value? 
-         # Dashboard view logic seems to imply 0 if only 1 reading usually, or specific logic.
-         total_km = 0.0 
-    else:
-        total_km = 0.0
-        
-    custo_total = sum(custos)
-    custo_isentas = sum(c for c, i in zip(custos, isentos) if i)
-    custo_pagas = sum(c for c, i in zip(custos, isentos) if not i)
-    consumo_total_kwh = sum(kwhs)
-    
-    consumo_por_100km = (consumo_total_kwh / total_km * 100) if total_km > 0 else 0
-    custo_medio_kwh = (custo_total / consumo_total_kwh) if consumo_total_kwh > 0 else 0
-    custo_medio_km = (custo_total / total_km) if total_km > 0 else 0
-
-    # Config gasolina
-    if tem_config:
-        custo_gas_por_km = preco_gasolina / consumo_km_l
-        custo_gas_total = (total_km / consumo_km_l) * preco_gasolina
-        economia_total = custo_gas_total - custo_total
-        economia_total_por_km = economia_total / total_km if total_km > 0 else 0
-        economia_pagas = custo_gas_total - custo_pagas
-        economia_pagas_por_km = economia_pagas / total_km if total_km > 0 else 0
-    else:
-        custo_gas_por_km = 0
-        custo_gas_total = 0
-        economia_total = 0
-        economia_total_por_km = 0
-        economia_pagas = 0
-        economia_pagas_por_km = 0
-
-    kpis = {
-        "recargas": total_recargas,
-        "recargas_isentas_qtd": recargas_isentas_qtd,
-        "recargas_pagas_qtd": recargas_pagas_qtd,
-        "total_km": total_km,
-        "consumo_total_kwh": consumo_total_kwh,
-        "consumo_por_100km": consumo_por_100km,
-        "custo_total": custo_total,
-        "custo_isentas": custo_isentas,
-        "custo_pagas": custo_pagas,
-        "custo_medio_kwh": custo_medio_kwh,
-        "custo_medio_km": custo_medio_km,
-        "custo_gas_por_km": custo_gas_por_km,
-        "custo_gas_total": custo_gas_total,
-        "economia_total": economia_total,
-        "economia_total_por_km": economia_total_por_km,
-        "economia_pagas": economia_pagas,
-        "economia_pagas_por_km": economia_pagas_por_km,
-    }
 
-    return JsonResponse({
-        "kpis": kpis,
-        "labels": labels,
-        "custos": {
-            "total": custos_total,
-            "pagas": custos_pagamento,
-            "percentual": custos_percentual
-        },
-        "consumo": consumos,
-        "km": kms,
-        "economia": {
-            "total": economias_total,
-            "pagas": economias_pagamento
-        },
-        "consumo_por_100km": consumo_por_100km_list
-    })
+    rollups = MonthlyRollup.objects.filter(user=user).order_by('mes').values(*kpis.MONTHLY_ROLLUP_FIELDS)
+    return {
+        "kpis": kpis.compute_kpis(user, config, missing=0),
+        **kpis.monthly_series(rollups, config),
+    }
 
 @login_required
 def delete_all_recharges(request):
     if request.method == 'POST':
-        count, ignored = Recharge.objects.filter(user=request.user).delete()
+        with transaction.atomic(), rollups.deferred(), sync.deferred():
+            count, ignored = Recharge.objects.filter(user=request.user).delete()
         messages.success(request, _(f'Todas as {count} recargas foram excluídas.'))
     return redirect('settings')
 
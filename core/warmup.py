@@ -0,0 +1,94 @@
+"""
+Work a process would otherwise do while serving its first requests: URL
+resolver population, template compilation, translation catalog loading for
+each of ``LANGUAGES`` and the first database connection.
+
+gunicorn.conf.py calls ``warm()`` in the master before forking when the app
+is preloaded (``GUNICORN_PRELOAD``), so every worker starts with the work
+already done in copy-on-write memory, and in each worker otherwise. The
+database step checks connectivity and, in ``DB_POOL`` mode, opens the
+process's pool. Before a fork (``before_fork=True``) it closes the
+connection and the pool again: a socket opened in the master must not be
+shared by the workers.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.template.utils import get_app_template_dirs
+from django.urls import get_resolver
+from django.utils import translation
+
+from . import db_pool
+
+logger = logging.getLogger(__name__)
+
+
+def warm_urls():
+    resolver = get_resolver()
+    # Populating the reverse dict imports every view module and compiles every pattern.
+    resolver.reverse_dict
+    return len(resolver.url_patterns)
+
+
+def _template_names():
+    dirs = [Path(d) for engine in settings.TEMPLATES for d in engine.get('DIRS', [])]
+    dirs += [Path(d) for d in get_app_template_dirs('templates')]
+    for base in dirs:
+        for path in sorted(base.rglob('*.html')):
+            yield path.relative_to(base).as_posix()
+
+
+def warm_templates():
+    engine = engines['django']
+    count = 0
+    for name in _template_names():
+        try:
+            engine.get_template(name)
+            count += 1
+        except Exception:
+            # Some third-party templates only compile with their app's context; skip them.
+            logger.debug("Could not precompile template %s", name, exc_info=True)
+    return count
+
+
+def warm_translations():
+    for code, _name in settings.LANGUAGES:
+        with translation.override(code):
+            translation.gettext("Dashboard")
+    return len(settings.LANGUAGES)
+
+
+def warm_database(before_fork=False):
+    for alias in connections:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+    connections.close_all()
+    if before_fork:
+        db_pool.close_pools()
+    return len(connections.all())
+
+
+def warm(database=True, before_fork=False):
+    """
+    Run every warmup step and return ``{step: milliseconds}``. A failing step
+    is logged and skipped so a slow or unreachable database never stops the
+    server from booting.
+    """
+    steps = [('urls', warm_urls), ('templates', warm_templates), ('translations', warm_translations)]
+    if database:
+        steps.append(('database', lambda: warm_database(before_fork)))
+
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warmup step %s failed", name)
+            continue
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
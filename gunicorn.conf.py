@@ -1,4 +1,7 @@
 import multiprocessing
+import os
+import shutil
+import tempfile
 
 # Render recommends 1-2 workers for free tier (512MB RAM)
 # WEB_CONCURRENCY env var sets this, but default fallback is safe.
@@ -7,12 +10,68 @@ workers = 2
 # Threads per worker
 threads = 2
 
+# Database connections: without DB_POOL each thread keeps its own persistent
+# connection (workers * threads in total). With DB_POOL=True each worker has
+# one pool shared by its threads, so the server sees at most
+# workers * (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW) connections. Keep
+# DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW >= threads, or threads will queue for a
+# connection (up to DB_POOL_TIMEOUT seconds), and keep the total under the
+# hosted Postgres connection limit. Under the ASGI worker the async views run
+# their queries on many short-lived threads, which the pool also caps.
+
+# GUNICORN_MODE=asgi serves the app through uvicorn workers and switches the
+# JSON API to the async views (core/async_api_views.py). Start it with
+#   GUNICORN_MODE=asgi gunicorn capstone.asgi:application
+# since an app given on the command line overrides wsgi_app below.
+MODE = os.environ.get('GUNICORN_MODE', 'sync')
+if MODE == 'asgi':
+    wsgi_app = 'capstone.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    os.environ.setdefault('ASYNC_API', 'True')
+
+# Metrics (core/metrics.py) are kept in one file per worker in this directory
+# and summed at scrape time. It must be set before the app is imported.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'capstone-metrics'))
+
 # Timeout: Increase from default 30s to 60s to handle slow DB/cold starts
 timeout = 60
 
+# Load Django once in the master and fork the workers from it, so a restart
+# does not pay the imports per worker and the loaded code is shared
+# copy-on-write. GUNICORN_PRELOAD=False loads the app in each worker instead.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
 # Logging: Output to stdout (seen in Render logs)
 accesslog = '-'
 errorlog = '-'
 
 # Forwarded headers (critical for HTTPS on Render)
 forwarded_allow_ips = '*'
+
+
+def on_starting(server):
+    # Start each server with empty metrics; files of a previous run would be summed in.
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def when_ready(server):
+    # With a preloaded app, warm it up once before the workers are forked (see core/warmup.py)
+    if server.cfg.preload_app:
+        from core import warmup
+        server.log.info("Warmup: %s", warmup.warm(before_fork=True))
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from core import warmup
+        worker.log.info("Warmup: %s", warmup.warm())
+    # Resume CSV import jobs left unfinished by a previous worker (see core/jobs.py)
+    try:
+        from core import jobs
+        jobs.resume_pending()
+    except Exception:
+        worker.log.exception("Could not resume pending import jobs")
+    # Periodic cleanup of expired sessions and old tombstones (see core/housekeeping.py)
+    from core import housekeeping
+    housekeeping.start()